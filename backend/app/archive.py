@@ -0,0 +1,252 @@
+"""
+Build history archive
+Each closed day of build history is compacted into an immutable columnar
+partition per region: one .npy file per column plus a manifest with the
+row count and categorical labels. Partitions are memory-mapped on read, so
+day and range queries only page in the files of the partitions they touch,
+straight from the OS page cache shared by every worker. Recent (hot) days
+are left to the primary source until they age past ARCHIVE_HOT_DAYS.
+"""
+from collections import OrderedDict
+from datetime import date as date_type, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Dict, List
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+
+from app.config import settings
+from app.fleet import get_fleet_simulator
+from app.models import Server
+
+logger = logging.getLogger(__name__)
+
+STRING_COLUMNS = ("hostname", "serial_number", "dbid")
+CATEGORICAL_COLUMNS = ("rackID", "machine_type", "status", "assigned_status")
+NUMERIC_COLUMNS = ("percent_built",)
+MANIFEST = "manifest.json"
+
+# Store-format columns of one region's day, as returned by
+# FleetSimulator.history_columns
+HistorySource = Callable[[str, str], Dict[str, object]]
+
+
+def _code_dtype(labels: int):
+    """Smallest unsigned dtype holding `labels` codes"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if labels <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.int64
+
+
+def _save(path: str, values: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, values, allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class ArchivePartition:
+    """One region's day of build history, memory-mapped column by column"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.rows: int = manifest["rows"]
+        self.labels: Dict[str, List[str]] = manifest["labels"]
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> np.ndarray:
+        """Read-only memory map of a column"""
+        values = self._columns.get(name)
+        if values is None:
+            values = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+            self._columns[name] = values
+        return values
+
+    def columns(self) -> Dict[str, object]:
+        """All columns in store column format (categoricals as (codes, labels))"""
+        columns: Dict[str, object] = {name: self.column(name) for name in STRING_COLUMNS + NUMERIC_COLUMNS}
+        for name in CATEGORICAL_COLUMNS:
+            columns[name] = (self.column(name), self.labels[name])
+        return columns
+
+    def servers(self) -> List[Server]:
+        """Materialize Server models for every row"""
+        strings = {name: self.column(name).tolist() for name in STRING_COLUMNS}
+        codes = {name: self.column(name).tolist() for name in CATEGORICAL_COLUMNS}
+        percents = self.column("percent_built").tolist()
+        labels = self.labels
+
+        return [
+            Server.model_construct(
+                rackID=labels["rackID"][codes["rackID"][i]],
+                hostname=strings["hostname"][i].decode(),
+                dbid=strings["dbid"][i].decode(),
+                serial_number=strings["serial_number"][i].decode(),
+                percent_built=percents[i],
+                assigned_status=labels["assigned_status"][codes["assigned_status"][i]],
+                machine_type=labels["machine_type"][codes["machine_type"][i]],
+                status=labels["status"][codes["status"][i]],
+            )
+            for i in range(self.rows)
+        ]
+
+
+class BuildArchive:
+    """
+    Directory of partitions laid out as {root}/{region}/{YYYY-MM-DD}/
+    A partition is written to a temporary directory and renamed into place,
+    so readers never see a partial one; when several workers archive the
+    same day, the first rename wins and the others discard their copy.
+    """
+
+    def __init__(self, root: str, max_open: int):
+        self.root = root
+        self.max_open = max_open
+        self.lock = threading.Lock()
+        self._open: "OrderedDict[str, ArchivePartition]" = OrderedDict()
+
+    def path(self, region: str, date: str) -> str:
+        return os.path.join(self.root, region, date)
+
+    def has(self, region: str, date: str) -> bool:
+        return os.path.exists(os.path.join(self.path(region, date), MANIFEST))
+
+    def partition(self, region: str, date: str) -> ArchivePartition | None:
+        """Open partition of a region's day, None if not archived"""
+        path = self.path(region, date)
+        with self.lock:
+            partition = self._open.get(path)
+            if partition is not None:
+                self._open.move_to_end(path)
+                return partition
+        if not self.has(region, date):
+            return None
+        partition = ArchivePartition(path)
+        with self.lock:
+            self._open[path] = partition
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return partition
+
+    def scan(self, region: str, date: str) -> ArchivePartition | None:
+        """
+        Partition opened for a one-off scan, bypassing the open partitions
+        kept for repeated reads; its pages are unmapped once it is dropped
+        """
+        return ArchivePartition(self.path(region, date)) if self.has(region, date) else None
+
+    def dates(self, region: str) -> List[str]:
+        """Archived days of a region, oldest first"""
+        try:
+            names = os.listdir(os.path.join(self.root, region))
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if not name.startswith(".") and self.has(region, name))
+
+    def write(self, region: str, date: str, columns: Dict[str, object]) -> bool:
+        """Archive a region's day; returns False if it was already archived"""
+        target = self.path(region, date)
+        if self.has(region, date):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = os.path.join(os.path.dirname(target), f".{date}.{os.getpid()}.{threading.get_ident()}")
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        try:
+            rows = len(columns["hostname"])
+            labels = {}
+            for name in STRING_COLUMNS:
+                _save(os.path.join(temporary, f"{name}.npy"), np.asarray(columns[name], dtype="S"))
+            for name in CATEGORICAL_COLUMNS:
+                codes, names = columns[name]
+                labels[name] = list(names)
+                _save(os.path.join(temporary, f"{name}.npy"), np.asarray(codes).astype(_code_dtype(len(names))))
+            for name in NUMERIC_COLUMNS:
+                _save(os.path.join(temporary, f"{name}.npy"), np.ascontiguousarray(columns[name]))
+            with open(os.path.join(temporary, MANIFEST), "w") as f:
+                json.dump({"rows": rows, "labels": labels}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(temporary, target)
+            return True
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+            if self.has(region, date):
+                return False
+            raise
+
+
+def closed_days(today: date_type) -> List[str]:
+    """Days old enough to archive, oldest first"""
+    newest = today - timedelta(days=settings.ARCHIVE_HOT_DAYS)
+    oldest = today - timedelta(days=settings.ARCHIVE_BACKFILL_DAYS)
+    days = []
+    day = oldest
+    while day < newest:
+        days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+
+def archive_closed_days(archive: BuildArchive, regions: List[str], source: HistorySource) -> int:
+    """Archive every closed day not archived yet; returns the partitions written"""
+    today = datetime.now(timezone.utc).date()
+    written = 0
+    for date in closed_days(today):
+        for region in regions:
+            if not archive.has(region, date) and archive.write(region, date, source(date, region)):
+                written += 1
+    return written
+
+
+def _archive_directory() -> str | None:
+    if settings.ARCHIVE_DIR:
+        return settings.ARCHIVE_DIR
+    if settings.SHARED_STATE_DIR:
+        return os.path.join(settings.SHARED_STATE_DIR, "archive")
+    return None
+
+
+@lru_cache(maxsize=4)
+def _fleet_archive(directory: str, seed: int, size: int) -> BuildArchive:
+    return BuildArchive(os.path.join(directory, f"fleet-{seed}-{size}"), settings.ARCHIVE_OPEN_PARTITIONS)
+
+
+def get_history_archive() -> BuildArchive | None:
+    """
+    Archive of the build history source, None when there is no directory or
+    no source. The simulator's partitions are kept apart per seed and size,
+    and the archive is looked up for the current fleet on every call, so
+    changing either never serves another fleet's history.
+    """
+    fleet = get_fleet_simulator()
+    directory = _archive_directory()
+    if fleet is None or directory is None:
+        return None
+    return _fleet_archive(directory, fleet.seed, fleet.size)
+
+
+async def run_archiver(interval: float):
+    """Lifespan task archiving closed days of build history"""
+    archive = get_history_archive()
+    fleet = get_fleet_simulator()
+    if archive is None or fleet is None:
+        return
+    while True:
+        try:
+            written = await asyncio.to_thread(archive_closed_days, archive, list(fleet.regions), fleet.history_columns)
+            if written:
+                logger.info(f"Archived {written} build history partitions to {archive.root}")
+        except Exception as e:
+            logger.error(f"Build history archiving failed: {str(e)}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,302 @@
+"""
+Append-only audit log
+Who did what through the mutating endpoints, as JSON lines in segment files
+under AUDIT_DIR. Each worker appends to its own segment and rotates it at
+AUDIT_SEGMENT_BYTES. Records arriving while a batch is being written join
+the next batch, so one fsync covers every request waiting on it. A sparse
+index next to each segment maps every AUDIT_INDEX_INTERVAL-th record's
+timestamp to its byte offset, so a time range query seeks straight to the
+records it needs in the segments it overlaps.
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".log"
+INDEX_SUFFIX = ".idx"
+INDEX_DTYPE = np.dtype([("ts", "<i8"), ("offset", "<u8")])
+
+
+def timestamp_ms(moment: datetime) -> int:
+    return int(moment.timestamp() * 1000)
+
+
+def as_datetime(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
+
+
+def _segment_name(first_ts: int, pid: int) -> str:
+    return f"{first_ts:013d}-{pid}{SEGMENT_SUFFIX}"
+
+
+def _parse_segment_name(name: str) -> Tuple[int, int] | None:
+    """(first timestamp, writer pid) of a segment file name"""
+    if not name.endswith(SEGMENT_SUFFIX):
+        return None
+    first, _, pid = name[:-len(SEGMENT_SUFFIX)].partition("-")
+    if not first.isdigit() or not pid.isdigit():
+        return None
+    return int(first), int(pid)
+
+
+class AuditLog:
+    """
+    Segmented append-only audit log
+    Segments are named {first timestamp ms}-{pid}.log; a writer's records
+    are in timestamp order within and across its segments, so the next
+    segment of the same writer bounds the timestamps of the previous one.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int, index_interval: int, fsync: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.fsync = fsync
+        # Held for file I/O only, including the fsync, so never taken on the event loop
+        self.lock = threading.Lock()
+        self._pid: int | None = None
+        self._segment = None
+        self._index = None
+        self._size = 0
+        self._count = 0
+        self._last_ts = 0
+        self._pending: List[Tuple[bytes, int, asyncio.Future]] = []
+        self._flusher: asyncio.Task | None = None
+
+    # Writing
+
+    def _open_segment(self, first_ts: int):
+        """Start a new segment (called with the lock held)"""
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        # A name already taken by this pid belongs to an earlier process
+        while True:
+            path = os.path.join(self.directory, _segment_name(first_ts, os.getpid()))
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o640)
+                break
+            except FileExistsError:
+                first_ts += 1
+        self._segment = os.fdopen(fd, "ab", buffering=0)
+        self._index = open(path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX, "ab", buffering=0)
+        self._size = 0
+        self._count = 0
+        self._pid = os.getpid()
+
+    def _close_segment(self):
+        for f in (self._segment, self._index):
+            if f is not None:
+                f.close()
+        self._segment = self._index = None
+
+    def write_batch(self, batch: List[Tuple[bytes, int]]):
+        """Append (line, timestamp) records and make them durable with one fsync"""
+        with self.lock:
+            # Segments opened before a fork belong to the parent
+            if self._segment is None or self._pid != os.getpid() or self._size >= self.segment_bytes:
+                self._open_segment(batch[0][1])
+            data = bytearray()
+            index = []
+            for line, ts in batch:
+                if self._count % self.index_interval == 0:
+                    index.append((ts, self._size + len(data)))
+                data += line
+                self._count += 1
+            self._segment.write(bytes(data))
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+            self._size += len(data)
+            # The index is only a hint for seeking, written once the records
+            # it points at are durable
+            if index:
+                self._index.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+
+    async def _flush(self):
+        """
+        Write pending records batch by batch until none are left, resolving
+        each batch's waiters as soon as it is on disk
+        """
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                with metrics.audit_flush_seconds.time():
+                    await asyncio.to_thread(self.write_batch, [(line, ts) for line, ts, _ in batch])
+            except asyncio.CancelledError:
+                for _, _, waiting in batch + self._pending:
+                    waiting.cancel()
+                self._pending = []
+                raise
+            except Exception as e:
+                for _, _, waiting in batch:
+                    # Waiters whose request was cancelled are already done
+                    if not waiting.done():
+                        waiting.set_exception(e)
+            else:
+                for _, _, waiting in batch:
+                    if not waiting.done():
+                        waiting.set_result(None)
+
+    async def record(self, action: str, user: str, outcome: str, **fields):
+        """
+        Append a record and wait until it is on disk
+        Writes run in a flusher task of their own, so cancelling a request
+        never strands the others batched with it; records appended while a
+        batch is written go into the next one.
+        """
+        # Only ever runs on the event loop thread, so no lock is needed
+        ts = max(int(time.time() * 1000), self._last_ts)
+        self._last_ts = ts
+        entry = {"ts": ts, "action": action, "user": user, "outcome": outcome, **fields}
+        line = json.dumps(entry, separators=(",", ":"), default=str).encode() + b"\n"
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((line, ts, future))
+        metrics.audit_records_total.inc(action, outcome)
+
+        flusher = self._flusher
+        if flusher is None or flusher.done() or flusher.get_loop() is not loop:
+            self._flusher = loop.create_task(self._flush())
+        await future
+
+    # Reading
+
+    def segments(self) -> List[Tuple[int, int, str]]:
+        """(first timestamp, pid, path) of every segment, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        segments = []
+        for name in names:
+            parsed = _parse_segment_name(name)
+            if parsed:
+                segments.append((*parsed, os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _segments_between(self, start: int, end: int) -> List[List[str]]:
+        """
+        Segments that may hold records from `start` to `end` (inclusive, ms),
+        oldest first per writer
+        """
+        by_writer: Dict[int, List[Tuple[int, str]]] = {}
+        for first, pid, path in self.segments():
+            by_writer.setdefault(pid, []).append((first, path))
+        selected = []
+        for writer in by_writer.values():
+            paths = []
+            for position, (first, path) in enumerate(writer):
+                if first > end:
+                    break
+                # Records of a segment come no later than the writer's next one
+                if position + 1 < len(writer) and writer[position + 1][0] < start:
+                    continue
+                paths.append(path)
+            if paths:
+                selected.append(paths)
+        return selected
+
+    @staticmethod
+    def _start_offset(path: str, start: int) -> int:
+        """Offset of the last indexed record before `start`"""
+        try:
+            with open(path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        # A torn final entry is ignored
+        index = np.frombuffer(data, dtype=INDEX_DTYPE, count=len(data) // INDEX_DTYPE.itemsize)
+        position = int(np.searchsorted(index["ts"], start, side="left")) - 1
+        return int(index["offset"][position]) if position >= 0 else 0
+
+    def _scan(self, path: str, start: int, end: int) -> Iterator[dict]:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._start_offset(path, start))
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Torn final line of a crashed writer
+                if entry["ts"] > end:
+                    break
+                if entry["ts"] >= start:
+                    yield entry
+
+    def query(
+        self,
+        start: int,
+        end: int,
+        user: str | None = None,
+        hostname: str | None = None,
+        limit: int = 1000
+    ) -> Tuple[List[dict], bool]:
+        """
+        Records from `start` to `end` (ms, inclusive) oldest first, and
+        whether more than `limit` matched
+        Each writer's records are already in time order, so the writers are
+        merged lazily and reading stops after `limit + 1` matches.
+        """
+        writers = [
+            itertools.chain.from_iterable(self._scan(path, start, end) for path in paths)
+            for paths in self._segments_between(start, end)
+        ]
+        matches = (
+            entry for entry in heapq.merge(*writers, key=lambda entry: entry["ts"])
+            if (user is None or entry.get("user") == user)
+            and (hostname is None or entry.get("hostname") == hostname)
+        )
+        records = list(itertools.islice(matches, limit + 1))
+        return records[:limit], len(records) > limit
+
+
+def _audit_directory() -> str | None:
+    if settings.AUDIT_DIR:
+        return settings.AUDIT_DIR
+    if settings.SHARED_STATE_DIR:
+        return os.path.join(settings.SHARED_STATE_DIR, "audit")
+    return None
+
+
+@lru_cache(maxsize=1)
+def get_audit_log() -> AuditLog | None:
+    """Audit log of this host, None when there is no directory to write it to"""
+    directory = _audit_directory()
+    if directory is None:
+        return None
+    return AuditLog(directory, settings.AUDIT_SEGMENT_BYTES, settings.AUDIT_INDEX_INTERVAL, settings.AUDIT_FSYNC)
+
+
+async def audit(action: str, user: str, outcome: str, **fields):
+    """
+    Record a mutation in the audit log
+    A failed write is logged rather than raised, since the mutation it
+    describes has already happened
+    """
+    audit_log = get_audit_log()
+    if audit_log is None:
+        logger.warning(f"No audit log directory; {action} by {user} ({outcome}) not recorded")
+        return
+    try:
+        await audit_log.record(action, user, outcome, **fields)
+    except Exception as e:
+        logger.error(
+            f"Audit record of {action} by {user} ({outcome}) failed: {str(e)}",
+            extra={"audit": True, "action": action, "user": user, "outcome": outcome, **fields}
+        )
@@ -1,45 +1,104 @@
 """
 SAML2 Authentication module
 Handles SAML authentication with Microsoft IDP
+Imports the SAML/XML stack (onelogin, xmlsec, lxml) and parses the IDP
+metadata, so it is only imported where a login is handled; validating
+sessions on other requests lives in app.session.
 """
 from fastapi import HTTPException, status, Request
 from onelogin.saml2.auth import OneLogin_Saml2_Auth
 from onelogin.saml2.idp_metadata_parser import OneLogin_Saml2_IdPMetadataParser
+from onelogin.saml2.utils import OneLogin_Saml2_Utils
+from onelogin.saml2.xml_utils import OneLogin_Saml2_XML
 from typing import Dict, Any
+import asyncio
 import logging
-from datetime import datetime, timedelta
+import os
+import secrets
+import time
 
 from app.config import settings
-from app.models import User
+from app.cache import create_cache
+from app import metrics
+from app import session
 
 logger = logging.getLogger(__name__)
 
-# In-memory session store (use Redis in production)
-_sessions: Dict[str, Dict[str, Any]] = {}
-
 
 class SAMLAuth:
     """SAML Authentication handler"""
     
+    REPLAY_WAIT_SECONDS = 5.0  # How long a duplicate waits for the original to finish
+    
     def __init__(self):
         """Initialize SAML auth with settings"""
-        self.saml_settings, self.idp_metadata = settings.get_saml_settings()
-        self._parse_idp_metadata()
+        self._metadata_signature = self._get_metadata_signature()
+        self.saml_settings = self._load_saml_settings()
+        # IDs of assertions being validated or already accepted, shared across workers
+        self._seen_assertions = create_cache(
+            "saml_assertions",
+            settings.SAML_REPLAY_CACHE_SIZE,
+            settings.SAML_REPLAY_CACHE_TTL_SECONDS
+        )
+    
+    def _get_metadata_signature(self) -> tuple | None:
+        """
+        Get (mtime, size) of the IDP metadata file
+        Used to detect certificate rotation without restarting workers
+        """
+        try:
+            stat = os.stat(settings.SAML_METADATA_PATH)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
     
-    def _parse_idp_metadata(self):
+    def _load_saml_settings(self) -> Dict[str, Any]:
+        """Read settings and IDP metadata into a new settings dictionary"""
+        saml_settings, idp_metadata = settings.get_saml_settings()
+        return self._parse_idp_metadata(saml_settings, idp_metadata)
+    
+    def _parse_idp_metadata(self, saml_settings: Dict[str, Any], idp_metadata: str) -> Dict[str, Any]:
         """Parse IDP metadata and merge with settings"""
         try:
-            idp_data = OneLogin_Saml2_IdPMetadataParser.parse(self.idp_metadata)
+            idp_data = OneLogin_Saml2_IdPMetadataParser.parse(idp_metadata)
             
             # Merge IDP data into SAML settings
             if 'idp' in idp_data:
-                self.saml_settings['idp'] = idp_data['idp']
+                saml_settings['idp'] = idp_data['idp']
             
             logger.info("IDP metadata parsed successfully")
+            return saml_settings
         except Exception as e:
             logger.error(f"Failed to parse IDP metadata: {str(e)}")
             raise
     
+    def reload_metadata(self) -> bool:
+        """
+        Re-parse IDP metadata if the file has changed
+        The new settings are fully built before being swapped in with a
+        single reference assignment, so in-flight requests keep using the
+        dictionary they started with. Returns True if settings were replaced.
+        """
+        signature = self._get_metadata_signature()
+        if signature is None or signature == self._metadata_signature:
+            return False
+        
+        # Record the signature up front so a bad file is only reported once;
+        # a completed rewrite changes the signature again and is retried
+        self._metadata_signature = signature
+        
+        try:
+            saml_settings = self._load_saml_settings()
+            if 'idp' not in saml_settings:
+                raise ValueError("No IDP descriptor found in metadata")
+        except Exception as e:
+            logger.error(f"IDP metadata reload failed, keeping previous settings: {str(e)}")
+            return False
+        
+        self.saml_settings = saml_settings
+        logger.info("IDP metadata reloaded")
+        return True
+    
     def _prepare_request_data(self, request: Request) -> Dict[str, Any]:
         """Prepare request data for python3-saml"""
         return {
@@ -80,7 +139,8 @@ class SAMLAuth:
             req_data['post_data'] = {'SAMLResponse': saml_response}
             
             auth = OneLogin_Saml2_Auth(req_data, self.saml_settings)
-            auth.process_response()
+            with metrics.saml_verification_seconds.time():
+                auth.process_response()
             
             errors = auth.get_errors()
             if errors:
@@ -116,6 +176,75 @@ class SAMLAuth:
                 detail="SAML authentication processing failed"
             )
     
+    def _get_assertion_key(self, saml_response: str) -> str | None:
+        """
+        Get a replay cache key from the unverified SAML response
+        Uses the Assertion ID, or the Response ID for encrypted assertions.
+        This only parses the XML, no signature checks are done here.
+        """
+        try:
+            dom = OneLogin_Saml2_XML.to_etree(OneLogin_Saml2_Utils.b64decode(saml_response))
+            assertions = OneLogin_Saml2_XML.query(dom, '//saml:Assertion')
+            element = assertions[0] if assertions else dom
+            element_id = element.get('ID')
+        except Exception:
+            return None
+        tag = element.tag.rsplit('}', 1)[-1]
+        return f"{tag}:{element_id}" if element_id else None
+    
+    async def _wait_for_assertion(self, key: str) -> bool:
+        """
+        Wait while another submission of the same assertion is in progress
+        Returns True once its claim is released (validation failed or the
+        worker crashed), so this submission may be validated in its place.
+        """
+        deadline = time.monotonic() + self.REPLAY_WAIT_SECONDS
+        while time.monotonic() <= deadline:
+            entry = await asyncio.to_thread(self._seen_assertions.get, key)
+            if entry is None:
+                return True
+            if entry['state'] != 'pending':
+                return False
+            await asyncio.sleep(0.05)
+        return False
+    
+    async def login(self, saml_response: str, request: Request) -> str:
+        """
+        Validate a SAML response and create a session
+        Assertion IDs are remembered once accepted, so each assertion logs
+        in at most once and any replay is rejected. A submission arriving
+        while the same assertion is being validated waits for the outcome
+        and is only validated itself if that validation failed.
+        Returns the session token.
+        """
+        key = self._get_assertion_key(saml_response)
+        
+        # Pending claims expire quickly so a crashed worker can't block a retry
+        claim = {'state': 'pending'}
+        claim_ttl = 2 * self.REPLAY_WAIT_SECONDS
+        while key and not await asyncio.to_thread(self._seen_assertions.add, key, claim, claim_ttl):
+            if not await self._wait_for_assertion(key):
+                logger.warning("Replayed SAML assertion rejected")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="SAML assertion has already been used"
+                )
+        
+        try:
+            user_data = self.process_saml_response(saml_response, request)
+        except Exception:
+            # A rejected response doesn't use up its assertion ID
+            if key:
+                await asyncio.to_thread(self._seen_assertions.delete, key)
+            raise
+        
+        if key:
+            await asyncio.to_thread(self._seen_assertions.set, key, {'state': 'accepted'})
+        
+        session_token = secrets.token_urlsafe(32)
+        session.store_session(session_token, user_data)
+        return session_token
+    
     def _extract_user_data(self, nameid: str, attributes: Dict) -> Dict[str, Any]:
         """
         Extract user data from SAML attributes
@@ -202,72 +331,7 @@ class SAMLAuth:
                 return 'operator'
         
         return 'user'
-    
-    def store_session(self, session_token: str, user_data: Dict[str, Any]):
-        """
-        Store session data
-        In production, use Redis or similar
-        """
-        _sessions[session_token] = {
-            'user_data': user_data,
-            'created_at': datetime.utcnow(),
-            'expires_at': datetime.utcnow() + timedelta(seconds=settings.SESSION_LIFETIME_SECONDS)
-        }
-        
-        logger.info(f"Session created for user: {user_data['email']}")
-    
-    def get_session(self, session_token: str) -> Dict[str, Any] | None:
-        """
-        Retrieve session data
-        Returns None if session doesn't exist or is expired
-        """
-        if session_token not in _sessions:
-            return None
-        
-        session = _sessions[session_token]
-        
-        # Check expiration
-        if datetime.utcnow() > session['expires_at']:
-            del _sessions[session_token]
-            logger.info("Session expired and removed")
-            return None
-        
-        return session['user_data']
-    
-    def delete_session(self, session_token: str):
-        """Delete session"""
-        if session_token in _sessions:
-            del _sessions[session_token]
-            logger.info("Session deleted")
 
 
 # Global SAML auth instance
 saml_auth = SAMLAuth()
-
-
-async def get_current_user(request: Request) -> User:
-    """
-    Dependency to get current authenticated user
-    Validates session token from cookie
-    """
-    session_token = request.cookies.get("session_token")
-    
-    if not session_token:
-        logger.warning("No session token in request")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "SAML"}
-        )
-    
-    user_data = saml_auth.get_session(session_token)
-    
-    if not user_data:
-        logger.warning(f"Invalid or expired session token")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Session expired or invalid",
-            headers={"WWW-Authenticate": "SAML"}
-        )
-    
-    return User(**user_data)
\ No newline at end of file
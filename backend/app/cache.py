@@ -0,0 +1,202 @@
+"""
+Bounded TTL caches for short-lived state
+SharedTTLCache keeps entries in an SQLite file so every gunicorn worker on
+the host sees them; TTLCache is the in-process fallback
+"""
+from collections import OrderedDict
+from typing import Any
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    In-process cache with a size bound and per-entry expiry
+    Oldest entries are evicted first when the bound is reached
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_live(self, key: str, now: float) -> tuple | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Any:
+        """Get a value, or None if missing or expired"""
+        with self._lock:
+            entry = self._get_live(key, time.time())
+            return entry[1] if entry else None
+
+    def set(self, key: str, value: Any, ttl_seconds: float | None = None):
+        """Set a value, replacing any existing entry"""
+        expires_at = time.time() + (ttl_seconds or self.ttl_seconds)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires_at, value)
+            self._evict()
+
+    def add(self, key: str, value: Any, ttl_seconds: float | None = None) -> bool:
+        """
+        Set a value only if the key is not already present
+        Returns True if the value was stored
+        """
+        now = time.time()
+        with self._lock:
+            if self._get_live(key, now):
+                return False
+            self._entries[key] = (now + (ttl_seconds or self.ttl_seconds), value)
+            self._evict()
+            return True
+
+    def delete(self, key: str):
+        """Remove a key if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SharedTTLCache:
+    """
+    TTL cache backed by an SQLite file shared between worker processes
+    Values must be JSON-serializable. Connections are opened lazily per
+    process so instances created before a gunicorn fork stay usable.
+    """
+
+    PRUNE_EVERY = 256  # Writes between expired/oversize entry cleanups
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=5.0,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _maybe_prune(self, conn: sqlite3.Connection, now: float):
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY:
+            return
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def get(self, key: str) -> Any:
+        """Get a value, or None if missing or expired"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl_seconds: float | None = None):
+        """Set a value, replacing any existing entry"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + (ttl_seconds or self.ttl_seconds))
+            )
+            self._maybe_prune(conn, now)
+
+    def add(self, key: str, value: Any, ttl_seconds: float | None = None) -> bool:
+        """
+        Set a value only if the key is not already present
+        Atomic across processes. Returns True if the value was stored
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now)
+                )
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), now + (ttl_seconds or self.ttl_seconds))
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._maybe_prune(conn, now)
+        return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        """Remove a key if present"""
+        with self._lock:
+            self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT COUNT(*) FROM entries WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return row[0]
+
+
+def create_cache(name: str, max_entries: int, ttl_seconds: float) -> TTLCache | SharedTTLCache:
+    """
+    Create a cache shared across workers if SHARED_STATE_DIR is usable
+    Falls back to a per-process cache otherwise
+    """
+    if settings.SHARED_STATE_DIR:
+        try:
+            os.makedirs(settings.SHARED_STATE_DIR, exist_ok=True)
+            if not os.access(settings.SHARED_STATE_DIR, os.W_OK):
+                raise PermissionError(f"{settings.SHARED_STATE_DIR} is not writable")
+            path = os.path.join(settings.SHARED_STATE_DIR, f"{name}.sqlite3")
+            return SharedTTLCache(path, max_entries, ttl_seconds)
+        except OSError as e:
+            logger.warning(f"Shared cache '{name}' unavailable, using per-process cache: {str(e)}")
+    return TTLCache(max_entries, ttl_seconds)
@@ -0,0 +1,246 @@
+"""
+Response compression
+Accept-Encoding negotiation and gzip/brotli/zstd encoders (brotli and zstd
+only when their packages are installed), plus a bounded cache of response
+bodies for versioned payloads. A cached body keeps its compressed variants
+next to it, so each version is compressed once per encoding and served to
+every viewer as is. Streamed bodies use incremental encoders instead.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List
+import asyncio
+import gzip
+import threading
+import zlib
+
+from fastapi import Request, Response
+
+from app.config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+IDENTITY = "identity"
+
+# Encoders in order of preference when the client weights them equally
+ENCODERS: Dict[str, Callable[[bytes], bytes]] = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+if brotli is not None:
+    ENCODERS["br"] = lambda body: brotli.compress(body, quality=5)
+ENCODERS["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+def negotiate(accept_encoding: str | None) -> str:
+    """
+    Best available encoding for an Accept-Encoding header
+    Highest q-value wins, ties go to the server's preference; "identity"
+    when nothing acceptable is available
+    """
+    if not accept_encoding:
+        return IDENTITY
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best, best_q = IDENTITY, 0.0
+    for encoding in ENCODERS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(content_type: str | None) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Encode a body; identity returns it unchanged"""
+    if encoding == IDENTITY:
+        return body
+    return ENCODERS[encoding](body)
+
+
+class CachedBody:
+    """
+    A serialized response body and its compressed variants
+    Variants are compressed on first use, once per encoding
+    """
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.media_type = media_type
+        self.variants: Dict[str, bytes] = {IDENTITY: body}
+        self.lock = threading.Lock()
+        self.on_grow: Callable[[int], None] | None = None
+
+    @property
+    def size(self) -> int:
+        return sum(len(variant) for variant in self.variants.values())
+
+    def variant(self, encoding: str) -> bytes:
+        """Body in an encoding, compressing it if this is the first request for it"""
+        encoded = self.variants.get(encoding)
+        if encoded is not None:
+            return encoded
+        with self.lock:
+            encoded = self.variants.get(encoding)
+            if encoded is None:
+                encoded = compress(self.variants[IDENTITY], encoding)
+                self.variants[encoding] = encoded
+                if self.on_grow:
+                    self.on_grow(len(encoded))
+        return encoded
+
+
+class ResponseCache:
+    """
+    Least recently used cache of CachedBody entries, bounded by total bytes
+    (all variants included). Each key holds one version; storing a newer
+    version replaces it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # key -> [version, body, bytes accounted for it]
+        self._entries: OrderedDict[Hashable, list] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: Hashable) -> CachedBody | None:
+        """Cached body for a key, or None if missing or of another version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, version: Hashable, cached: CachedBody):
+        with self._lock:
+            self._remove(key)
+            size = cached.size
+            if size > self.max_bytes:
+                return
+            self._entries[key] = [version, cached, size]
+            self.bytes += size
+            cached.on_grow = lambda amount: self._grow(key, cached, amount)
+            self._evict()
+
+    def _grow(self, key: Hashable, cached: CachedBody, amount: int):
+        """Account for a variant compressed after the body was stored"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is cached:
+                entry[2] += amount
+                self.bytes += amount
+                self._evict()
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[1].on_grow = None
+            self.bytes -= entry[2]
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+
+# Global response cache instance
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_MB * 1024 * 1024)
+
+
+async def encoded_response(request: Request, cached: CachedBody) -> Response:
+    """
+    Response for a cached body in the client's preferred encoding
+    A variant compressed for the first time is compressed in a worker thread
+    """
+    encoding = IDENTITY
+    if settings.COMPRESSION_ENABLED and len(cached.variants[IDENTITY]) >= settings.COMPRESSION_MIN_BYTES:
+        encoding = negotiate(request.headers.get("accept-encoding"))
+    body = cached.variants.get(encoding)
+    if body is None:
+        body = await asyncio.to_thread(cached.variant, encoding)
+
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != IDENTITY:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=cached.media_type, headers=headers)
+
+
+async def cached_response(
+    request: Request,
+    key: Hashable,
+    version: Hashable,
+    build: Callable[[], bytes]
+) -> Response:
+    """
+    Response for a versioned payload, from the response cache or from
+    `build` (run in a worker thread), whose result is cached for later
+    requests of the same version
+    """
+    cached = response_cache.get(key, version)
+    if cached is None:
+        cached = CachedBody(await asyncio.to_thread(build))
+        response_cache.set(key, version, cached)
+    return await encoded_response(request, cached)
+
+
+class StreamEncoder:
+    """Incremental encoder for streamed bodies; identity passes chunks through"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            encoder = zstandard.ZstdCompressor(level=3).compressobj()
+            self._compress, self._flush = encoder.compress, encoder.flush
+        elif encoding == "br":
+            encoder = brotli.Compressor(quality=5)
+            self._compress, self._flush = encoder.process, encoder.finish
+        elif encoding == "gzip":
+            encoder = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._compress, self._flush = encoder.compress, encoder.flush
+        else:
+            self._compress, self._flush = bytes, bytes
+
+    def compress(self, chunk: bytes) -> bytes:
+        """Encoded output so far; may be empty while the encoder buffers"""
+        return self._compress(chunk)
+
+    def flush(self) -> bytes:
+        """Remaining output, ending the stream"""
+        return self._flush()
+
+
+def available_encodings() -> List[str]:
+    return list(ENCODERS)
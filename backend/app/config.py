@@ -3,7 +3,7 @@ Configuration management using Pydantic Settings
 Follows 12-factor app principles for configuration
 """
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import Dict, List
 from functools import lru_cache
 import os
 
@@ -32,13 +32,148 @@ class Settings(BaseSettings):
     SAML_ENTITY_ID: str
     SAML_ACS_URL: str  # Assertion Consumer Service URL
     SAML_SLS_URL: str | None = None  # Single Logout Service URL (optional)
+    SAML_METADATA_RELOAD_SECONDS: int = 30  # Metadata file poll interval (0 disables)
+    SAML_REPLAY_CACHE_TTL_SECONDS: int = 3600  # How long accepted assertion IDs are remembered (and replays rejected)
+    SAML_REPLAY_CACHE_SIZE: int = 10000
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
     RATE_LIMIT_BURST: int = 100
     
+    # Shared state between workers on one host (SQLite files; unset for per-process only)
+    SHARED_STATE_DIR: str | None = "/tmp/server-dashboard"
+    WEB_CONCURRENCY: int = 1  # Worker processes on this host (gunicorn.conf.py exports its count)
+    
+    # Metrics (per-worker snapshots merged on scrape; defaults to SHARED_STATE_DIR/metrics)
+    METRICS_ENABLED: bool = True
+    METRICS_DIR: str | None = None
+    METRICS_FLUSH_SECONDS: int = 5
+    
     # Logging
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # json or text
+    # Fraction of requests per route template whose INFO lines are kept
+    LOG_SAMPLE_RATES: Dict[str, float] = {
+        "/api/build-status": 0.1,
+        "/api/build-history/{date}": 0.1,
+        "/api/build-history": 0.1,
+        "/api/build-rollups": 0.25,
+        "/api/server-details": 0.25,
+        "/api/racks": 0.25,
+        "/api/preconfigs": 0.25,
+        "/metrics": 0.0,
+    }
+    
+    # Synthetic fleet simulator (development only, replaces fixed mock data)
+    FLEET_SIMULATOR: bool = False
+    FLEET_SIZE: int = 1000
+    FLEET_SEED: int = 42
+    FLEET_REFRESH_SECONDS: int = 30  # Build progress refresh into the build store
+    
+    # Heartbeat ingestion
+    HEARTBEAT_TOKEN: str | None = None  # Shared installer token; ingestion is disabled when unset
+    HEARTBEAT_FLUSH_SECONDS: float = 2.0
+    
+    # Stale build detection
+    STALE_HEARTBEAT_SECONDS: int = 600  # In-flight builds silent this long are marked stale
+    STALE_BUILD_STATUS: str = "stalled"  # "stalled" or "failed"
+    STALE_SCAN_SECONDS: float = 15.0
+    
+    # Request coalescing: identical concurrent GETs to these paths (or path
+    # prefixes, ending in /) share one computation
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_PATHS: List[str] = [
+        "/api/build-status",
+        "/api/build-history/",
+        "/api/build-history",
+        "/api/build-rollups",
+        "/api/server-details",
+        "/api/racks",
+        "/api/preconfigs",
+    ]
+    
+    # Admission control (per worker): concurrent requests per path (or path
+    # prefix, ending in /); unlisted paths share ADMISSION_DEFAULT_LIMIT and
+    # ADMISSION_RESERVED_PATHS have their own lane. Requests over a limit wait
+    # in a short queue and are shed with 503 when it is full or they time out.
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_LIMITS: Dict[str, int] = {
+        "/api/build-status": 8,
+        "/api/build-history/": 4,
+        "/api/build-history": 2,
+        "/api/build-rollups": 4,
+        "/api/export/": 2,
+        "/api/heartbeat": 8,
+    }
+    ADMISSION_DEFAULT_LIMIT: int = 16
+    ADMISSION_RESERVED_PATHS: List[str] = ["/api/assign", "/api/push-preconfig", "/health", "/metrics"]
+    ADMISSION_RESERVED_LIMIT: int = 16
+    ADMISSION_QUEUE_SIZE: int = 32  # Requests waiting per lane before new ones are shed
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0  # Longest wait for a slot before being shed
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+
+    # Idempotency-Key results for mutating endpoints (shared across workers)
+    IDEMPOTENCY_TTL_SECONDS: int = 86400  # How long a key's result is replayed
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0  # How long a duplicate waits for the original to finish
+    
+    # Response compression (gzip always; brotli and zstd when installed)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_BYTES: int = 1024  # Smaller bodies are sent uncompressed
+    RESPONSE_CACHE_MAX_MB: int = 64  # Cached versioned bodies and their compressed variants
+    
+    # Region shards
+    SHARD_TIMEOUT_SECONDS: float = 5.0  # A region slower than this is left out of the response
+    
+    # Asset lookup index
+    LOOKUP_MERGE_THRESHOLD: int = 4096  # Changed keys held aside before being merged into the index
+    LOOKUP_MAX_RESULTS: int = 100
+    
+    # Build progress timeline
+    TIMELINE_RAW_DAYS: int = 2  # Days kept with every sample
+    TIMELINE_MINUTE_DAYS: int = 14  # Days kept at one sample per minute, then one per hour
+    TIMELINE_RETENTION_DAYS: int = 90
+    TIMELINE_TAIL_SAMPLES: int = 65536  # Unsorted samples per day before they are sorted into a chunk
+    TIMELINE_MAINTENANCE_SECONDS: float = 300.0
+    
+    # Build history archive (immutable per-region day partitions; defaults to SHARED_STATE_DIR/archive)
+    ARCHIVE_DIR: str | None = None
+    ARCHIVE_HOT_DAYS: int = 7  # Recent days served from the primary source rather than archived
+    ARCHIVE_BACKFILL_DAYS: int = 30  # Oldest day archived
+    ARCHIVE_INTERVAL_SECONDS: float = 3600.0
+    ARCHIVE_OPEN_PARTITIONS: int = 256  # Memory-mapped partitions kept open
+    ARCHIVE_MAX_RANGE_DAYS: int = 31  # Longest range /api/build-history returns
+    
+    # Build throughput rollups (materialized per region and day)
+    ROLLUP_REFRESH_SECONDS: float = 300.0  # Today's partial rollup refresh; closed days are rolled up once
+    ROLLUP_BACKFILL_DAYS: int = 90  # Oldest closed day rolled up
+    ROLLUP_DURATION_BUCKET_SECONDS: int = 60  # Time-to-complete histogram resolution
+    ROLLUP_MAX_RANGE_DAYS: int = 366
+    
+    # Streaming exports
+    EXPORT_CHUNK_ROWS: int = 5000  # Rows formatted and compressed per streamed chunk
+    EXPORT_MAX_RANGE_DAYS: int = 366
+    
+    # Audit log (append-only segment files; defaults to SHARED_STATE_DIR/audit)
+    AUDIT_DIR: str | None = None
+    AUDIT_SEGMENT_BYTES: int = 64 * 1024 * 1024  # Segment size before a worker starts a new one
+    AUDIT_INDEX_INTERVAL: int = 256  # Records between sparse timestamp index entries
+    AUDIT_FSYNC: bool = True  # fsync each batch of records before the requests waiting on it return
+    AUDIT_MAX_RESULTS: int = 10000
+
+    # Profiling (admin-only single requests and a periodic stack sampler;
+    # disabled unless ENVIRONMENT is listed; defaults to SHARED_STATE_DIR/profiles)
+    PROFILING_ENVIRONMENTS: List[str] = ["development", "staging"]
+    PROFILING_DIR: str | None = None
+    PROFILING_REQUEST_INTERVAL_MS: float = 1.0  # Stack sampling interval of a profiled request
+    PROFILING_SAMPLER_SECONDS: float = 0.0  # Periodic sampler window written per file (0 disables)
+    PROFILING_SAMPLE_INTERVAL_MS: float = 10.0  # Periodic sampler stack sampling interval
+    PROFILING_MAX_FILES: int = 200  # Newest profiles kept
+
+    # Build ETA estimation
+    ETA_HALF_LIFE_HOURS: float = 24.0  # Weight of past build samples halves every N hours
+    ETA_DEFAULT_BUILD_HOURS: float = 3.0  # Prior build duration before any samples are seen
+    ETA_REFRESH_SECONDS: float = 60.0  # Re-estimate every build with the latest curves (0 disables)
     
     # Database (for future implementation)
     DATABASE_URL: str | None = None
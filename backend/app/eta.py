@@ -0,0 +1,196 @@
+"""
+Build ETA estimation
+Learns how long each stretch of a build takes, per machine_type and region,
+from successive percent_built samples (starting from install_start_time at
+0%). Estimates are streaming: each batch of samples decays the old weights
+and adds the new ones, so nothing is refit over history. A heartbeat flush
+only re-estimates the builds it observed; ETAs for every build are filled
+in with one vectorized pass over the store every ETA_REFRESH_SECONDS, as
+the learned curves drift.
+"""
+from typing import Dict
+import asyncio
+import logging
+import time
+import numpy as np
+
+from app.config import settings
+from app.shards import get_region_shards
+from app.store import BuildStore, NULL_TIME
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = 20  # Build curve resolution: seconds-per-percent for each 5% stretch
+PRIOR_WEIGHT = 20.0  # Percent-points of evidence a group needs to outweigh its fallback
+
+
+class EtaEstimator:
+    """
+    Online piecewise-linear build-rate curves
+    For every (machine_type, region) group and curve bucket the estimator
+    keeps decayed sums of observed seconds and percent-points. Sparse groups
+    are shrunk towards their machine_type, which is shrunk towards the whole
+    store (one region shard), which is shrunk towards ETA_DEFAULT_BUILD_HOURS.
+    """
+
+    def __init__(self, store: BuildStore, half_life_hours: float, default_build_hours: float):
+        self.store = store
+        self.half_life_seconds = half_life_hours * 3600
+        self.prior_rate = default_build_hours * 3600 / 100
+        self.seconds = np.zeros((0, 0, BUCKETS))
+        self.percent = np.zeros((0, 0, BUCKETS))
+        self.updated_at = time.time()
+        # Last sample per store row at which the percentage changed
+        self.last_percent = np.full(0, -1, dtype=np.int16)
+        self.last_time = np.full(0, NULL_TIME, dtype=np.int64)
+
+    def _grow(self):
+        machine_types = len(self.store.pools["machine_type"].values)
+        regions = len(self.store.pools["region"].values)
+        if self.seconds.shape[:2] != (machine_types, regions):
+            for name in ("seconds", "percent"):
+                old = getattr(self, name)
+                grown = np.zeros((machine_types, regions, BUCKETS))
+                grown[:old.shape[0], :old.shape[1]] = old
+                setattr(self, name, grown)
+        capacity = self.store.capacity
+        if len(self.last_percent) < capacity:
+            grown_percent = np.full(capacity, -1, dtype=np.int16)
+            grown_percent[:len(self.last_percent)] = self.last_percent
+            grown_time = np.full(capacity, NULL_TIME, dtype=np.int64)
+            grown_time[:len(self.last_time)] = self.last_time
+            self.last_percent, self.last_time = grown_percent, grown_time
+
+    def _decay(self, now: float):
+        elapsed = max(now - self.updated_at, 0.0)
+        if elapsed and self.half_life_seconds > 0:
+            factor = 0.5 ** (elapsed / self.half_life_seconds)
+            self.seconds *= factor
+            self.percent *= factor
+        self.updated_at = now
+
+    def observe(self, rows: np.ndarray):
+        """
+        Learn from the current percent_built/last_heartbeat of `rows`
+        Call after the store rows have been written
+        """
+        store = self.store
+        with store.lock:
+            self._grow()
+            self._decay(time.time())
+
+            percent = store.numbers["percent_built"][rows].astype(np.int16)
+            timestamp = store.numbers["last_heartbeat"][rows]
+            start = store.numbers["install_start_time"][rows]
+            machine_type = store.codes["machine_type"][rows]
+            region = store.codes["region"][rows]
+
+            previous_percent = self.last_percent[rows]
+            previous_time = self.last_time[rows]
+            # First sample of a build (or a restarted one): measure from the start
+            restart = (previous_percent < 0) | (percent < previous_percent)
+            previous_percent = np.where(restart, 0, previous_percent)
+            previous_time = np.where(restart, start, previous_time)
+
+            usable = (
+                (percent > previous_percent) & (timestamp > previous_time)
+                & (timestamp != NULL_TIME) & (previous_time != NULL_TIME)
+            )
+            low = previous_percent[usable].astype(np.float64)
+            high = percent[usable].astype(np.float64)
+            rate = (timestamp[usable] - previous_time[usable]) / (high - low)
+            group = (machine_type[usable], region[usable])
+
+            # Spread each span's time over the curve buckets it covers
+            width = 100 / BUCKETS
+            for bucket in range(BUCKETS):
+                overlap = np.clip(
+                    np.minimum(high, (bucket + 1) * width) - np.maximum(low, bucket * width), 0, None
+                )
+                np.add.at(self.percent[:, :, bucket], group, overlap)
+                np.add.at(self.seconds[:, :, bucket], group, overlap * rate)
+
+            # Only move the reference sample when the percentage changes, so
+            # time spent stuck at one percentage is charged to that stretch
+            changed = restart | (percent != self.last_percent[rows])
+            changed &= timestamp != NULL_TIME
+            self.last_percent[rows[changed]] = percent[changed]
+            self.last_time[rows[changed]] = timestamp[changed]
+
+    def rates(self) -> np.ndarray:
+        """Seconds per percent, shape (machine_types, regions, BUCKETS)"""
+        fleet_rate = (self.seconds.sum(axis=(0, 1)) + PRIOR_WEIGHT * self.prior_rate) / (
+            self.percent.sum(axis=(0, 1)) + PRIOR_WEIGHT
+        )
+        type_rate = (self.seconds.sum(axis=1) + PRIOR_WEIGHT * fleet_rate) / (
+            self.percent.sum(axis=1) + PRIOR_WEIGHT
+        )
+        return (self.seconds + PRIOR_WEIGHT * type_rate[:, None, :]) / (
+            self.percent + PRIOR_WEIGHT
+        )
+
+    def remaining_curve(self) -> np.ndarray:
+        """Seconds from each percentage 0..100 to completion, shape (machine_types, regions, 101)"""
+        per_percent = np.repeat(self.rates(), 100 // BUCKETS, axis=2)
+        remaining = np.zeros(per_percent.shape[:2] + (101,))
+        remaining[:, :, :100] = np.cumsum(per_percent[:, :, ::-1], axis=2)[:, :, ::-1]
+        return remaining
+
+    def refresh(self, rows: np.ndarray | None = None) -> int:
+        """
+        Write estimated_completion for `rows` (default every row) in one
+        vectorized pass
+        Installing builds get last sample time + learned remaining time,
+        complete builds their completion time and failed builds no ETA.
+        Returns the number of in-flight builds estimated.
+        """
+        store = self.store
+        with store.lock:
+            self._grow()
+            if rows is None:
+                rows = np.arange(store.size)
+            curve = self.remaining_curve()
+            status = store.codes["status"][rows]
+            percent = store.numbers["percent_built"][rows]
+            last_heartbeat = store.numbers["last_heartbeat"][rows]
+            reference = np.where(
+                self.last_time[rows] != NULL_TIME, self.last_time[rows], last_heartbeat
+            )
+            reference = np.where(
+                reference != NULL_TIME, reference, store.numbers["install_start_time"][rows]
+            )
+
+            remaining = curve[store.codes["machine_type"][rows], store.codes["region"][rows], percent]
+            estimate = np.where(reference != NULL_TIME, reference + remaining.astype(np.int64), NULL_TIME)
+
+            installing = status == store.pools["status"].code("installing")
+            complete = status == store.pools["status"].code("complete")
+            estimate = np.where(complete, last_heartbeat, estimate)
+            estimate = np.where(installing | complete, estimate, NULL_TIME)
+
+            store.update_rows(rows, estimated_completion=estimate)
+        return int(installing.sum())
+
+
+def get_eta_estimator(store: BuildStore) -> EtaEstimator:
+    """Estimator attached to a build store"""
+    return store.attachment(
+        "eta_estimator",
+        lambda store: EtaEstimator(store, settings.ETA_HALF_LIFE_HOURS, settings.ETA_DEFAULT_BUILD_HOURS)
+    )
+
+
+def refresh_region_estimates() -> Dict[str, int]:
+    """Re-estimate every build of every region shard; returns the in-flight builds per region"""
+    shards = get_region_shards()
+    return {region: get_eta_estimator(shards.get(region)).refresh() for region in shards.regions()}
+
+
+async def run_eta_refresh(interval: float):
+    """Lifespan task re-estimating every shard with the latest learned curves"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(refresh_region_estimates)
+        except Exception as e:
+            logger.error(f"ETA refresh failed: {str(e)}")
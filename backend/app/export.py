@@ -0,0 +1,125 @@
+"""
+Streaming exports of build history and assignments
+Rows are read one region's day at a time (from memory-mapped archive
+partitions where the day is archived), formatted EXPORT_CHUNK_ROWS rows at
+a time and passed through an incremental encoder, so an export holds one
+day's columns and one chunk of text whatever its range.
+"""
+from itertools import repeat
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+import csv
+import io
+import json
+import logging
+import numpy as np
+
+from app import metrics
+from app.compression import StreamEncoder
+from app.models import Server
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FIELDS = (
+    "date", "region", "hostname", "serial_number", "dbid", "rackID",
+    "machine_type", "percent_built", "status", "assigned_status",
+)
+STRING_FIELDS = ("hostname", "serial_number", "dbid")
+CATEGORICAL_FIELDS = ("rackID", "machine_type")
+STATUS_FIELDS = ("status", "assigned_status")
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# Columns of one region's day in store column format
+DaySource = Callable[[str, str], Dict[str, object]]
+
+
+def servers_columns(servers: Sequence[Server]) -> Dict[str, object]:
+    """Store-format columns of a list of Server models"""
+    columns: Dict[str, object] = {
+        name: np.array([getattr(s, name).encode() for s in servers], dtype="S") for name in STRING_FIELDS
+    }
+    for name in CATEGORICAL_FIELDS + STATUS_FIELDS:
+        labels = sorted({getattr(s, name) for s in servers})
+        columns[name] = (np.array([labels.index(getattr(s, name)) for s in servers], dtype=np.int64), labels)
+    columns["percent_built"] = np.array([s.percent_built for s in servers], dtype=np.uint8)
+    return columns
+
+
+def _selected_rows(columns: Dict[str, object], assigned_only: bool) -> np.ndarray:
+    rows = np.arange(len(columns["hostname"]))
+    if not assigned_only:
+        return rows
+    codes, labels = columns["assigned_status"]
+    if "assigned" not in labels:
+        return rows[:0]
+    return rows[np.asarray(codes) == list(labels).index("assigned")]
+
+
+def row_chunks(
+    dates: Iterable[str],
+    regions: Sequence[str],
+    source: DaySource,
+    chunk_rows: int,
+    assigned_only: bool = False
+) -> Iterator[Tuple[str, str, List[list]]]:
+    """
+    (date, region, values) chunks of at most `chunk_rows` rows, in date
+    then region order; values holds one list per field after date and region
+    """
+    for date in dates:
+        for region in regions:
+            columns = source(date, region)
+            rows = _selected_rows(columns, assigned_only)
+            for start in range(0, len(rows), chunk_rows):
+                index = rows[start:start + chunk_rows]
+                values = []
+                for name in EXPORT_FIELDS[2:]:
+                    if name in STRING_FIELDS:
+                        values.append([v.decode() for v in np.asarray(columns[name][index]).tolist()])
+                    elif name == "percent_built":
+                        values.append(np.asarray(columns[name][index]).tolist())
+                    else:
+                        codes, labels = columns[name]
+                        values.append([labels[c] for c in np.asarray(codes[index]).tolist()])
+                yield date, region, values
+
+
+def format_csv(date: str, region: str, values: List[list]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(zip(repeat(date), repeat(region), *values))
+    return buffer.getvalue()
+
+
+def format_ndjson(date: str, region: str, values: List[list]) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_FIELDS, row)), separators=(",", ":")) + "\n"
+        for row in zip(repeat(date), repeat(region), *values)
+    )
+
+
+def export_stream(
+    dataset: str,
+    chunks: Iterator[Tuple[str, str, List[list]]],
+    format: str,
+    encoding: str
+) -> Iterator[bytes]:
+    """Encoded body of an export, produced chunk by chunk"""
+    encoder = StreamEncoder(encoding)
+    formatter = format_csv if format == "csv" else format_ndjson
+    exported = 0
+    try:
+        header = encoder.compress((",".join(EXPORT_FIELDS) + "\n").encode()) if format == "csv" else b""
+        if header:
+            yield header
+        for date, region, values in chunks:
+            body = encoder.compress(formatter(date, region, values).encode())
+            exported += len(values[0])
+            if body:
+                yield body
+        yield encoder.flush()
+    except Exception as e:
+        # Headers are already sent; the client sees a truncated body
+        logger.error(f"Export of {dataset} failed after {exported} rows: {str(e)}")
+        raise
+    finally:
+        metrics.export_rows_total.inc(dataset, format, amount=exported)
@@ -0,0 +1,299 @@
+"""
+Synthetic fleet simulator
+Deterministic, seedable model of racks, regions, machine types and build
+progress over time for exercising the API at production scale. Per-server
+attributes live in numpy arrays, so generating a 1M server fleet is cheap,
+and are exported column-wise into the BuildStore.
+"""
+from datetime import date as date_type, datetime
+from functools import lru_cache
+from typing import Dict, List
+import calendar
+import numpy as np
+
+from app.config import settings
+from app.models import Server
+
+REGIONS = ("cbg", "dub", "dal")
+SLOTS = "ABCDEFGH"
+SERVERS_PER_SLOT = 4
+SERVERS_PER_RACK = len(SLOTS) * SERVERS_PER_SLOT
+STAGING_RACK_EVERY = 20  # Every 20th rack is a staging rack ("S1-A")
+
+# name, fleet share, mean build hours, failure probability, cpu, ram GB, storage GB
+MACHINE_TYPES = (
+    ("Server", 0.70, 3.0, 0.03, "Intel Xeon Gold 6248R", 128, 4000),
+    ("Storage", 0.15, 5.0, 0.05, "AMD EPYC 7502", 256, 96000),
+    ("GPU", 0.10, 4.0, 0.06, "AMD EPYC 7763", 1024, 16000),
+    ("Network", 0.05, 1.5, 0.02, "Intel Xeon D-2146NT", 64, 480),
+)
+
+BUILD_WINDOW_HOURS = 8  # In-flight builds started within this window before the epoch
+HEARTBEAT_SECONDS = 60
+
+
+def to_timestamp(value: datetime) -> int:
+    """Seconds since the epoch for a naive UTC datetime"""
+    return calendar.timegm(value.utctimetuple())
+
+
+class FleetSimulator:
+    """
+    Array-backed synthetic fleet
+    Server i belongs to region REGIONS[i % len(REGIONS)] and is named
+    "<region>-srv-<i:07d>", so hostname lookups need no index.
+    Build progress is a function of time: each server has a start time,
+    build duration and (for failing builds) the percentage it fails at.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        seed: int = 42,
+        regions: tuple = REGIONS,
+        epoch: datetime | None = None
+    ):
+        self.size = size
+        self.seed = seed
+        self.regions = tuple(regions)
+        self.epoch = (epoch or datetime.utcnow()).replace(microsecond=0)
+        epoch_ts = to_timestamp(self.epoch)
+
+        rng = np.random.default_rng(seed)
+        index = np.arange(size, dtype=np.int64)
+
+        self.region = (index % len(self.regions)).astype(np.uint8)
+        local_index = index // len(self.regions)
+        self.rack = (local_index // SERVERS_PER_RACK + 1).astype(np.int32)
+        self.slot = ((local_index % SERVERS_PER_RACK) // SERVERS_PER_SLOT).astype(np.uint8)
+
+        shares = np.array([m[1] for m in MACHINE_TYPES])
+        self.machine_type = rng.choice(
+            len(MACHINE_TYPES), size=size, p=shares / shares.sum()
+        ).astype(np.uint8)
+
+        mean_hours = np.array([m[2] for m in MACHINE_TYPES], dtype=np.float32)
+        self.duration = (
+            mean_hours[self.machine_type] * 3600
+            * rng.lognormal(0.0, 0.25, size).astype(np.float32)
+        ).astype(np.int32)
+        self.start = epoch_ts - rng.integers(
+            0, BUILD_WINDOW_HOURS * 3600, size, dtype=np.int64
+        )
+
+        fail_probability = np.array([m[3] for m in MACHINE_TYPES])[self.machine_type]
+        failing = rng.random(size) < fail_probability
+        self.fail_at = np.where(
+            failing, rng.integers(5, 95, size), 255
+        ).astype(np.uint8)
+        self.assigned = rng.random(size) < 0.5
+
+    # Progress model
+
+    def _percent(self, rows: np.ndarray, now_ts: int) -> np.ndarray:
+        elapsed = np.maximum(now_ts - self.start[rows], 0)
+        percent = np.minimum(elapsed * 100 // np.maximum(self.duration[rows], 1), 100)
+        return np.minimum(percent, self.fail_at[rows]).astype(np.uint8)
+
+    def _status(self, rows: np.ndarray, percent: np.ndarray) -> np.ndarray:
+        """0 = installing, 1 = complete, 2 = failed"""
+        status = np.zeros(len(rows), dtype=np.uint8)
+        status[percent >= 100] = 1
+        status[percent >= self.fail_at[rows]] = 2
+        return status
+
+    @staticmethod
+    def _now_ts(now: datetime | None) -> int:
+        return to_timestamp(now or datetime.utcnow())
+
+    # Naming
+
+    def hostname(self, i: int) -> str:
+        return f"{self.regions[self.region[i]]}-srv-{i:07d}"
+
+    def rack_id(self, i: int) -> str:
+        rack = int(self.rack[i])
+        prefix = "S" if rack % STAGING_RACK_EVERY == 0 else ""
+        return f"{prefix}{rack}-{SLOTS[self.slot[i]]}"
+
+    def find(self, hostname: str) -> int | None:
+        """Row index for a hostname, or None if not part of the fleet"""
+        region, _, number = hostname.rpartition("-srv-")
+        if not number.isdigit():
+            return None
+        i = int(number)
+        if i >= self.size or self.regions[self.region[i]] != region:
+            return None
+        return i
+
+    # Materialization
+
+    def _server(self, i: int, percent: int, status: int) -> Server:
+        region = self.regions[self.region[i]]
+        return Server(
+            rackID=self.rack_id(i),
+            hostname=self.hostname(i),
+            dbid=str(1000000 + i),
+            serial_number=f"SN-{region.upper()}-{i:07d}",
+            percent_built=int(percent),
+            assigned_status="assigned" if status == 1 and self.assigned[i] else "not assigned",
+            machine_type=MACHINE_TYPES[self.machine_type[i]][0],
+            status=("installing", "complete", "failed")[status],
+        )
+
+    def build_history(self, date: str, region: str) -> List[Server]:
+        """
+        Builds in a region completed on a given day
+        Each day is sampled from the region's servers with a seed derived
+        from the date, so the same date always returns the same servers
+        """
+        return [self._server(i, 100, 1) for i in self.history_rows(date, region).tolist()]
+
+    def finished_rows(self, date: str, region: str) -> np.ndarray:
+        """Rows of the builds in a region that finished (completed or failed) on a given day"""
+        day = date_type.fromisoformat(date).toordinal()
+        code = self.regions.index(region)
+        rng = np.random.default_rng([self.seed, day, code])
+        region_rows = np.arange(code, self.size, len(self.regions))
+        if not len(region_rows):
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(rng.choice(region_rows, size=max(1, len(region_rows) // 10), replace=False))
+
+    def history_rows(self, date: str, region: str) -> np.ndarray:
+        """Rows of the builds in a region completed on a given day"""
+        rows = self.finished_rows(date, region)
+        return rows[self.fail_at[rows] == 255]
+
+    def finished_builds(self, date: str, region: str) -> Dict[str, object]:
+        """
+        Outcome of every build in a region that finished on a given day:
+        machine_type and rack (without slot) as (codes, labels), failed
+        flags and build durations in seconds (up to the failure for failed
+        builds)
+        """
+        rows = self.finished_rows(date, region)
+        racks, rack_codes = np.unique(self.rack[rows], return_inverse=True)
+        rack_labels = [f"S{r}" if r % STAGING_RACK_EVERY == 0 else str(r) for r in racks.tolist()]
+        failed = self.fail_at[rows] != 255
+        duration = self.duration[rows].astype(np.int64)
+        return {
+            "machine_type": (self.machine_type[rows], [m[0] for m in MACHINE_TYPES]),
+            "rack": (rack_codes.reshape(-1), rack_labels),
+            "failed": failed,
+            "duration": np.where(failed, duration * self.fail_at[rows] // 100, duration),
+        }
+
+    def history_columns(self, date: str, region: str) -> Dict[str, object]:
+        """build_history() in store column format"""
+        rows = self.history_rows(date, region)
+        identity = self._identity_columns(rows)
+        return {
+            "hostname": identity["hostname"],
+            "serial_number": identity["serial_number"],
+            "dbid": identity["dbid"],
+            "rackID": identity["rackID"],
+            "machine_type": (self.machine_type[rows], [m[0] for m in MACHINE_TYPES]),
+            "percent_built": np.full(len(rows), 100, dtype=np.uint8),
+            "status": (np.ones(len(rows), dtype=np.uint8), ("installing", "complete", "failed")),
+            "assigned_status": (self.assigned[rows].astype(np.uint8), ("not assigned", "assigned")),
+        }
+
+    def progress(self, now: datetime | None = None) -> Dict[str, object]:
+        """
+        Progress columns of every server at `now`, in store column format
+        """
+        now_ts = self._now_ts(now)
+        rows = np.arange(self.size)
+        percent = self._percent(rows, now_ts)
+        status = self._status(rows, percent)
+
+        last_heartbeat = now_ts - (now_ts - self.start) % HEARTBEAT_SECONDS
+        last_heartbeat = np.where(status == 1, self.start + self.duration, last_heartbeat)
+        failed_at = self.start + self.duration.astype(np.int64) * self.fail_at // 100
+        last_heartbeat = np.where(status == 2, failed_at, last_heartbeat)
+
+        return {
+            "percent_built": percent,
+            "status": (status, ("installing", "complete", "failed")),
+            "assigned_status": (
+                ((status == 1) & self.assigned).astype(np.uint8),
+                ("not assigned", "assigned")
+            ),
+            "last_heartbeat": np.maximum(last_heartbeat, self.start),
+        }
+
+    def _identity_columns(self, index: np.ndarray) -> Dict[str, object]:
+        """
+        hostname, serial_number, dbid and rackID of the given rows
+        Strings are assembled with vectorized numpy operations
+        """
+        if not len(index):
+            empty = np.zeros(0, dtype="S1")
+            return {"hostname": empty, "serial_number": empty, "dbid": empty,
+                    "rackID": (np.zeros(0, dtype=np.int64), [])}
+        number = np.char.zfill(index.astype("S"), 7)
+        region_names = np.array([r.encode() for r in self.regions])[self.region[index]]
+        region_upper = np.array([r.upper().encode() for r in self.regions])[self.region[index]]
+
+        # rackID: intern each distinct (rack, slot) pair once
+        rack_key = self.rack[index].astype(np.int64) * len(SLOTS) + self.slot[index]
+        rack_keys, first, rack_codes = np.unique(rack_key, return_index=True, return_inverse=True)
+        rack_labels = [self.rack_id(int(index[i])) for i in first]
+
+        return {
+            "hostname": np.char.add(np.char.add(region_names, b"-srv-"), number),
+            "serial_number": np.char.add(np.char.add(np.char.add(b"SN-", region_upper), b"-"), number),
+            "dbid": (index + 1000000).astype("S"),
+            "rackID": (rack_codes.reshape(-1), rack_labels),
+        }
+
+    def columns(self, now: datetime | None = None) -> Dict[str, object]:
+        """
+        Full column set of every server for BuildStore.upsert_columns
+        Strings are assembled with vectorized numpy operations
+        """
+        index = np.arange(self.size, dtype=np.int64)
+
+        # MAC 00:1A:xx:xx:xx:xx from the row number
+        octets = np.stack([
+            np.zeros_like(index), np.full_like(index, 0x1A),
+            (index >> 24) & 255, (index >> 16) & 255, (index >> 8) & 255, index & 255
+        ], axis=1)
+        hex_digits = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+        mac = np.full((self.size, 17), ord(":"), dtype=np.uint8)
+        mac[:, 0::3] = hex_digits[octets >> 4]
+        mac[:, 1::3] = hex_digits[octets & 15]
+
+        ip = np.char.add(b"10.", ((index >> 16) & 255).astype("S"))
+        ip = np.char.add(np.char.add(ip, b"."), ((index >> 8) & 255).astype("S"))
+        ip = np.char.add(np.char.add(ip, b"."), (index & 255).astype("S"))
+
+        machine_names = [m[0] for m in MACHINE_TYPES]
+        return {
+            **self._identity_columns(index),
+            "region": (self.region, self.regions),
+            "machine_type": (self.machine_type, machine_names),
+            "cpu_model": (self.machine_type, [m[4] for m in MACHINE_TYPES]),
+            "ram_gb": np.array([m[5] for m in MACHINE_TYPES], dtype=np.int32)[self.machine_type],
+            "storage_gb": np.array([m[6] for m in MACHINE_TYPES], dtype=np.int32)[self.machine_type],
+            "ip_address": ip,
+            "mac_address": mac.view("S17").reshape(-1),
+            "install_start_time": self.start,
+            **self.progress(now),
+        }
+
+
+@lru_cache()
+def _create_fleet_simulator(size: int, seed: int) -> FleetSimulator:
+    return FleetSimulator(size, seed)
+
+
+def get_fleet_simulator() -> FleetSimulator | None:
+    """
+    Shared simulator instance, when enabled
+    Only active in development with FLEET_SIMULATOR=true; routers fall
+    back to their fixed mock data otherwise
+    """
+    if settings.ENVIRONMENT != "development" or not settings.FLEET_SIMULATOR:
+        return None
+    return _create_fleet_simulator(settings.FLEET_SIZE, settings.FLEET_SEED)
@@ -0,0 +1,279 @@
+"""
+Heartbeat ingestion
+Installers report build progress every few seconds. Reports are coalesced
+in memory, keeping only the latest one per host, and written to the build
+store of each region in one bulk transaction per flush window, so write
+volume scales with the number of hosts reporting rather than the number of
+heartbeats.
+
+Each gunicorn worker has a build store of its own, so with SHARED_STATE_DIR
+a flush goes through a heartbeat log shared between workers: a worker
+publishes the reports it received, then applies every host changed since
+its last flush (its own and other workers') to its store. All workers, and
+the stale detector in each of them, see every heartbeat within one flush
+window.
+"""
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from app import metrics
+from app.config import settings
+from app.models import HeartbeatReport
+from app.shards import RegionShards, get_region_shards
+from app.store import BuildStore, NULL_TIME, to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Fields only applied when present in the latest report for a host
+OPTIONAL_FIELDS = ("rackID", "machine_type", "serial_number", "dbid")
+
+Pending = Dict[str, Tuple[int, HeartbeatReport]]
+
+
+class HeartbeatLog:
+    """
+    Latest report per host in an SQLite file shared between worker processes
+    Every publish stamps its hosts with the next sequence number, so a
+    worker reads what changed since its last flush with one indexed range
+    scan. A worker's cursor is inherited on fork together with the store it
+    describes, and a fresh process starts at zero and catches up on every
+    host. Connections are opened lazily per process, like SharedTTLCache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cursor = 0
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS heartbeats ("
+                "hostname TEXT PRIMARY KEY, timestamp INTEGER NOT NULL, seq INTEGER NOT NULL, report TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS heartbeats_seq ON heartbeats (seq)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def publish(self, pending: Pending):
+        """Store reports, unless a newer one is already stored for the host"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM heartbeats").fetchone()[0]
+                conn.executemany(
+                    "INSERT INTO heartbeats (hostname, timestamp, seq, report) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (hostname) DO UPDATE SET "
+                    "timestamp = excluded.timestamp, seq = excluded.seq, report = excluded.report "
+                    "WHERE excluded.timestamp >= heartbeats.timestamp",
+                    [
+                        (hostname, timestamp, seq, report.model_dump_json(exclude_none=True))
+                        for hostname, (timestamp, report) in pending.items()
+                    ]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def changes(self) -> Tuple[Pending, int]:
+        """Reports stored since the cursor, and the cursor to move to once they are applied"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT hostname, timestamp, seq, report FROM heartbeats WHERE seq > ? ORDER BY seq",
+                (self.cursor,)
+            ).fetchall()
+        changed = {
+            hostname: (timestamp, HeartbeatReport.model_validate_json(report))
+            for hostname, timestamp, _, report in rows
+        }
+        return changed, rows[-1][2] if rows else self.cursor
+
+
+@lru_cache(maxsize=1)
+def get_heartbeat_log() -> HeartbeatLog | None:
+    """Heartbeat log shared across workers, None without SHARED_STATE_DIR"""
+    if settings.SHARED_STATE_DIR:
+        try:
+            os.makedirs(settings.SHARED_STATE_DIR, exist_ok=True)
+            return HeartbeatLog(os.path.join(settings.SHARED_STATE_DIR, "heartbeats.sqlite3"))
+        except OSError as e:
+            logger.warning(f"Shared heartbeat log unavailable, heartbeats stay per worker: {str(e)}")
+    return None
+
+
+class HeartbeatCoalescer:
+    """
+    Latest pending report per host, flushed to the build store in bulk
+    Reports are only ever touched from the event loop; flushes swap the
+    pending map out before writing, so ingestion never waits on the store.
+    Like the build store it writes to, a coalescer belongs to one process;
+    without a shared heartbeat log, each worker's store only sees the
+    heartbeats that worker received.
+    """
+
+    def __init__(self):
+        self._pending: Pending = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, reports: List[HeartbeatReport]) -> int:
+        """Queue reports; a host's older reports are superseded. Returns the count accepted."""
+        received = int(time.time())
+        for report in reports:
+            timestamp = to_epoch(report.timestamp) if report.timestamp else received
+            pending = self._pending.get(report.hostname)
+            if pending is None or pending[0] <= timestamp:
+                self._pending[report.hostname] = (timestamp, report)
+        metrics.heartbeats_received_total.inc(amount=len(reports))
+        return len(reports)
+
+    def take(self) -> Pending:
+        """Remove and return everything pending"""
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def requeue(self, pending: Pending):
+        """Put back a window that failed to write, unless newer reports arrived since"""
+        for hostname, entry in pending.items():
+            current = self._pending.get(hostname)
+            if current is None or current[0] < entry[0]:
+                self._pending[hostname] = entry
+
+    @classmethod
+    def write(cls, shards: RegionShards, pending: Pending) -> int:
+        """
+        Write one flush window, one transaction per region shard
+        Reports are routed by their region, or by the shard already holding
+        the host; reports for unknown hosts without a region are dropped.
+        Returns the number of hosts written.
+        """
+        by_region: Dict[str, Pending] = {}
+        for hostname, entry in pending.items():
+            region = entry[1].region
+            if region is None:
+                found = shards.find(hostname)
+                if found is None:
+                    continue
+                region = found[0]
+            by_region.setdefault(region, {})[hostname] = entry
+
+        dropped = len(pending) - sum(len(entries) for entries in by_region.values())
+        if dropped:
+            logger.warning(f"Dropped heartbeats for {dropped} unknown hosts without a region")
+        for region, entries in by_region.items():
+            cls.write_shard(shards.shard(region), region, entries)
+        return len(pending) - dropped
+
+    @staticmethod
+    def write_shard(
+        store: BuildStore,
+        region: str,
+        pending: Pending
+    ) -> np.ndarray:
+        """Write one region's reports to its store in a single transaction"""
+        from app.eta import get_eta_estimator
+        from app.timeline import get_build_timeline
+
+        # A shard created by this write starts recording before its first rows
+        get_build_timeline(store)
+
+        hostnames = list(pending)
+        timestamps = np.array([pending[h][0] for h in hostnames], dtype=np.int64)
+        reports = [pending[h][1] for h in hostnames]
+        percent = np.array([r.percent_built for r in reports], dtype=np.uint8)
+        status = [
+            r.status.value if r.status else ("complete" if r.percent_built == 100 else "installing")
+            for r in reports
+        ]
+
+        with store.lock:
+            rows = store.upsert_columns(
+                hostnames,
+                percent_built=percent,
+                status=status,
+                last_heartbeat=timestamps,
+                region=(np.zeros(len(hostnames), dtype=np.uint8), [region])
+            )
+            for name in OPTIONAL_FIELDS:
+                given = [i for i, r in enumerate(reports) if getattr(r, name) is not None]
+                if given:
+                    store.update_rows(rows[given], **{name: [getattr(reports[i], name) for i in given]})
+            # Builds first seen through a heartbeat start at that heartbeat
+            unstarted = store.numbers["install_start_time"][rows] == NULL_TIME
+            if unstarted.any():
+                store.update_rows(rows[unstarted], install_start_time=timestamps[unstarted])
+
+            estimator = get_eta_estimator(store)
+            # Only the builds just reported; the rest are re-estimated by run_eta_refresh
+            estimator.observe(rows)
+            estimator.refresh(rows)
+        return rows
+
+    @classmethod
+    def sync(cls, log: HeartbeatLog, shards: RegionShards, pending: Pending) -> int:
+        """
+        Publish this worker's window to the shared log, then write every
+        host changed since the last sync to the build store
+        Returns the number of hosts written.
+        """
+        if pending:
+            log.publish(pending)
+        changed, cursor = log.changes()
+        hosts = cls.write(shards, changed) if changed else 0
+        log.cursor = cursor
+        return hosts
+
+    async def flush(self) -> int:
+        """
+        Write pending reports to the build store; returns the number of hosts written
+        With a shared heartbeat log this also applies other workers'
+        reports. A window that fails to write is queued again for the next
+        flush (rewriting what did succeed is harmless, as writes are upserts
+        of the latest report).
+        """
+        pending = self.take()
+        log = get_heartbeat_log()
+        if not pending and log is None:
+            return 0
+        try:
+            with metrics.heartbeat_flush_seconds.time():
+                if log is None:
+                    hosts = await asyncio.to_thread(self.write, get_region_shards(), pending)
+                else:
+                    hosts = await asyncio.to_thread(self.sync, log, get_region_shards(), pending)
+        except BaseException:
+            self.requeue(pending)
+            raise
+        metrics.heartbeat_hosts_flushed_total.inc(amount=len(pending))
+        return hosts
+
+    async def run_flusher(self, interval: float):
+        """Flush every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                hosts = await self.flush()
+                if hosts:
+                    logger.debug(f"Flushed heartbeats for {hosts} hosts")
+            except Exception as e:
+                logger.error(f"Heartbeat flush failed: {str(e)}")
+
+
+# Global coalescer instance
+heartbeat_coalescer = HeartbeatCoalescer()
@@ -0,0 +1,165 @@
+"""
+Idempotency-Key support for mutating endpoints
+The first request with a key claims it in a cache shared across workers,
+runs the operation and stores its outcome; retries with the same key get
+the stored outcome back without repeating the operation, and duplicates
+arriving while it runs wait for it to finish. The claim is refreshed for
+as long as the operation runs, so it only lapses if its worker dies. Cache
+access runs in a thread, as the shared cache is an SQLite file.
+"""
+from typing import Awaitable, Callable
+import asyncio
+import hashlib
+import logging
+import time
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app import metrics
+from app.cache import create_cache
+from app.config import settings
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """
+    Outcomes of idempotent requests, keyed by user, endpoint and key
+    Entries are {'state': 'pending' | 'done', 'digest': <request digest>}
+    plus the status code and JSON body once done. Only outcomes the client
+    should see again are stored: successes and 4xx errors. Server errors
+    release the key so the request can be retried.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int, wait_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self._results = create_cache("idempotency", max_entries, ttl_seconds)
+
+    async def _wait(self, endpoint: str, key: str, digest: str) -> dict | None:
+        """
+        Stored outcome for a duplicate request, waiting while the first one
+        is in progress. Returns None if the key was released.
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            entry = await asyncio.to_thread(self._results.get, key)
+            if entry is None:
+                return None
+            if entry['digest'] != digest:
+                metrics.idempotent_requests_total.inc(endpoint, "mismatch")
+                raise HTTPException(
+                    status_code=422,  # Unprocessable Content
+                    detail="Idempotency-Key was already used for a different request"
+                )
+            if entry['state'] == 'done':
+                return entry
+            if time.monotonic() > deadline:
+                metrics.idempotent_requests_total.inc(endpoint, "conflict")
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still in progress",
+                    headers={"Retry-After": "1"}
+                )
+            await asyncio.sleep(0.05)
+
+    def _claim_ttl(self) -> float:
+        # Short, so a claim whose worker died lapses soon after
+        return 2 * self.wait_seconds
+
+    async def _hold_claim(self, key: str, claim: dict, done: asyncio.Event):
+        """Refresh a claim every wait_seconds until `done` is set"""
+        while True:
+            try:
+                await asyncio.wait_for(done.wait(), self.wait_seconds)
+                return
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._results.set, key, claim, self._claim_ttl())
+
+    async def _store(self, key: str, entry: dict | None):
+        """Store an outcome, or release the key when there is none"""
+        if entry is None:
+            await asyncio.to_thread(self._results.delete, key)
+        else:
+            await asyncio.to_thread(self._results.set, key, entry)
+
+    async def run(
+        self,
+        endpoint: str,
+        idempotency_key: str | None,
+        user: User,
+        payload: BaseModel,
+        operation: Callable[[], Awaitable[BaseModel]]
+    ) -> BaseModel | JSONResponse:
+        """
+        Run `operation` at most once per Idempotency-Key
+        Without a key the operation simply runs. A replayed outcome is
+        returned with an Idempotent-Replayed: true header.
+        """
+        if idempotency_key is None:
+            return await operation()
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"
+            )
+
+        key = f"{user.email}:{endpoint}:{idempotency_key}"
+        digest = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+        claim = {'state': 'pending', 'digest': digest}
+        while not await asyncio.to_thread(self._results.add, key, claim, self._claim_ttl()):
+            entry = await self._wait(endpoint, key, digest)
+            if entry is not None:
+                metrics.idempotent_requests_total.inc(endpoint, "replayed")
+                logger.info(
+                    f"Replayed {endpoint} result for Idempotency-Key by {user.email}",
+                    extra={"user": user.email, "action": endpoint}
+                )
+                return JSONResponse(
+                    status_code=entry['status_code'],
+                    content=entry['body'],
+                    headers={"Idempotent-Replayed": "true"}
+                )
+
+        metrics.idempotent_requests_total.inc(endpoint, "new")
+        done = asyncio.Event()
+        holder = asyncio.create_task(self._hold_claim(key, claim, done))
+        outcome = None
+        try:
+            result = await operation()
+            outcome = {
+                'state': 'done',
+                'digest': digest,
+                'status_code': status.HTTP_200_OK,
+                'body': result.model_dump(mode="json")
+            }
+            return result
+        except HTTPException as e:
+            if e.status_code < 500:
+                outcome = {
+                    'state': 'done',
+                    'digest': digest,
+                    'status_code': e.status_code,
+                    'body': {"detail": e.detail}
+                }
+            raise
+        finally:
+            # The holder finishes any refresh in flight before the outcome
+            # replaces the claim
+            done.set()
+            await asyncio.shield(holder)
+            await self._store(key, outcome)
+
+
+# Global idempotency store instance
+idempotency_store = IdempotencyStore(
+    settings.IDEMPOTENCY_TTL_SECONDS,
+    settings.IDEMPOTENCY_CACHE_SIZE,
+    settings.IDEMPOTENCY_WAIT_SECONDS
+)
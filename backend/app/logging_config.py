@@ -0,0 +1,131 @@
+"""
+Logging pipeline
+Records are handed to a queue by the calling code and written to stdout by a
+background listener thread, so request handlers never block on log I/O.
+Output is one JSON object per line. INFO records emitted while serving a
+high-volume read route are sampled per request; audit records never are.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+
+from app.config import settings
+
+# Per-request logging state, set by RequestLoggingMiddleware
+request_log_state: ContextVar[Dict[str, Any] | None] = ContextVar("request_log_state", default=None)
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_queue_handler: QueueHandler | None = None
+_listener: QueueListener | None = None
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as single-line JSON, including `extra=` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestSamplingFilter(logging.Filter):
+    """
+    Drop INFO and DEBUG records of unsampled requests
+    The keep/drop decision is made once per request from LOG_SAMPLE_RATES,
+    keyed by route template, so a request's lines are kept or dropped together.
+    Warnings, errors and records logged with extra={"audit": True} always pass.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or getattr(record, "audit", False):
+            return True
+
+        state = request_log_state.get()
+        if state is None:
+            return True
+
+        if "sampled" not in state:
+            # Imported here to avoid a cycle (middleware logs through this module)
+            from app.middleware import route_template
+            route = route_template(state["scope"])
+            if route == "unmatched":
+                return True
+            rate = settings.LOG_SAMPLE_RATES.get(route, 1.0)
+            state["route"] = route
+            state["sampled"] = rate >= 1.0 or random.random() < rate
+
+        return state["sampled"]
+
+
+def _start_listener():
+    """Create a fresh queue and listener thread for this process"""
+    global _listener
+    log_queue: queue.Queue = queue.Queue(-1)
+    _queue_handler.queue = log_queue
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(
+            logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        )
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_listener_after_fork():
+    # Listener threads don't survive fork; gunicorn workers start their own
+    if _queue_handler is not None:
+        _start_listener()
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging():
+    """
+    Route all logging through a non-blocking queue handler
+    Safe to call more than once
+    """
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+
+    _queue_handler = QueueHandler(queue.Queue(-1))
+    _queue_handler.addFilter(RequestSamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    _start_listener()
+    atexit.register(stop_logging)
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
@@ -0,0 +1,285 @@
+"""
+Unified asset lookup index
+One sorted index per build store over hostname, serial_number, dbid,
+mac_address and ip_address, so an operator can search by whatever is
+printed on the box. Keys are normalized (lowercase; MAC addresses without
+separators, so 00:1A:2B, 00-1a-2b and 001a.2b.. all match) and prefixed
+with a field tag byte, which keeps each field's keys contiguous. Exact and
+prefix lookups are binary searches over the sorted keys.
+
+Writes don't re-sort the index: changed keys go to a small sorted pending
+list that is merged in once it grows past a threshold. Entries left behind
+by a changed key are filtered out by checking candidates against the
+store, and dropped at the next merge.
+"""
+from bisect import bisect_left
+from typing import Iterable, List, Sequence, Tuple
+import threading
+import numpy as np
+
+from app.config import settings
+from app.store import BuildStore
+
+LOOKUP_FIELDS = ("hostname", "serial_number", "dbid", "mac_address", "ip_address")
+MAC_SEPARATORS = b":-. "
+
+# (key, row) written since the last merge
+Pending = List[Tuple[bytes, int]]
+
+
+def _matrix(values: np.ndarray) -> np.ndarray:
+    """Fixed-width bytes array as a (rows, width) uint8 matrix"""
+    width = values.dtype.itemsize
+    return np.ascontiguousarray(values).view(np.uint8).reshape(len(values), width)
+
+
+def normalize_column(field: str, values: np.ndarray) -> np.ndarray:
+    """Vectorized normalize() of a fixed-width bytes array"""
+    data = _matrix(values).copy()
+    data[(data >= ord("A")) & (data <= ord("Z"))] += ord("a") - ord("A")
+    if field == "mac_address":
+        # Move separators to the end (keeping the order of the rest) and
+        # clear them, so they become NUL padding
+        separator = np.isin(data, np.frombuffer(MAC_SEPARATORS, dtype=np.uint8))
+        order = np.argsort(separator, axis=1, kind="stable")
+        data = np.take_along_axis(data, order, axis=1)
+        data[np.take_along_axis(separator, order, axis=1)] = 0
+    # Drop padding columns no value uses, so wide source columns don't
+    # widen every key in the index
+    used = np.flatnonzero(data.any(axis=0))
+    width = int(used[-1]) + 1 if len(used) else 1
+    return np.ascontiguousarray(data[:, :width]).view(f"S{width}").reshape(-1)
+
+
+def normalize(field: str, value: str) -> str:
+    """Lookup form of a value: lowercase, and MAC addresses without separators"""
+    value = value.strip().lower()
+    if field == "mac_address":
+        value = value.translate({c: None for c in MAC_SEPARATORS})
+    return value
+
+
+def tag(code: int) -> bytes:
+    """Key prefix of a field (never NUL, which is padding)"""
+    return bytes([code + 1])
+
+
+def tagged_keys(code: int, values: np.ndarray) -> np.ndarray:
+    """Prefix every value with a field's tag byte"""
+    data = np.zeros((len(values), values.dtype.itemsize + 1), dtype=np.uint8)
+    data[:, 0] = code + 1
+    data[:, 1:] = _matrix(values)
+    return data.view(f"S{data.shape[1]}").reshape(-1)
+
+
+class AssetIndex:
+    """
+    Multi-key lookup index over a BuildStore
+    The merged index is a (keys, rows) pair of arrays sorted by key and
+    replaced as a whole, like the pending list, so lookups read a
+    consistent snapshot without taking a lock.
+    """
+
+    SMALL_BATCH = 64  # Candidates up to this many are checked one by one
+
+    def __init__(self, store: BuildStore, merge_threshold: int):
+        self.store = store
+        self.merge_threshold = merge_threshold
+        self.lock = threading.Lock()
+        self._base: Tuple[np.ndarray, np.ndarray] = (np.zeros(0, dtype="S1"), np.zeros(0, dtype=np.int64))
+        self._pending: Pending = []
+        # Rows per field whose key changed since the last merge
+        self._dirty: List[List[np.ndarray]] = [[] for _ in LOOKUP_FIELDS]
+        with store.lock:
+            store.subscribe(self._on_write)
+            self.rebuild()
+
+    def __len__(self) -> int:
+        return len(self._base[0]) + len(self._pending)
+
+    def _current(self, code: int, rows: np.ndarray) -> np.ndarray:
+        """Tagged keys the store holds now for one field of `rows`"""
+        field = LOOKUP_FIELDS[code]
+        return tagged_keys(code, normalize_column(field, self.store.strings[field].data[rows]))
+
+    def _current_key(self, code: int, row: int) -> bytes:
+        """_current() for a single row, without numpy's per-call overhead"""
+        field = LOOKUP_FIELDS[code]
+        value = self.store.strings[field].data[row].lower()
+        if field == "mac_address":
+            value = value.translate(None, MAC_SEPARATORS)
+        return tag(code) + value
+
+    def _entries(self, rows: np.ndarray, codes: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted (keys, rows) for the non-empty fields of `rows`"""
+        keys, key_rows = [], []
+        for code in codes:
+            field = LOOKUP_FIELDS[code]
+            present = rows[self.store.strings[field].data[rows] != b""]
+            field_keys = self._current(code, present)
+            # Keys of one field share a tag, so sorting each field and
+            # concatenating in tag order sorts the whole index
+            order = np.argsort(field_keys, kind="stable")
+            keys.append(field_keys[order])
+            key_rows.append(present[order])
+        if not keys:
+            return np.zeros(0, dtype="S1"), np.zeros(0, dtype=np.int64)
+        return np.concatenate(keys), np.concatenate(key_rows).astype(np.int64)
+
+    def rebuild(self):
+        """Re-index every row of the store (called under the store lock)"""
+        base = self._entries(np.arange(self.store.size), range(len(LOOKUP_FIELDS)))
+        with self.lock:
+            self._base = base
+            self._pending = []
+            self._dirty = [[] for _ in LOOKUP_FIELDS]
+
+    def _valid(self, keys: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Mask of (key, row) entries that still match the store"""
+        valid = np.zeros(len(keys), dtype=bool)
+        if not len(keys):
+            return valid
+        if len(keys) <= self.SMALL_BATCH:
+            for i, (key, row) in enumerate(zip(keys.tolist(), rows.tolist())):
+                valid[i] = self._current_key(key[0] - 1, row) == key
+            return valid
+        codes = _matrix(keys)[:, 0].astype(np.int64) - 1
+        for code in np.unique(codes).tolist():
+            selected = np.flatnonzero(codes == code)
+            valid[selected] = self._current(code, rows[selected]) == keys[selected]
+        return valid
+
+    def _merge(self, pending: Pending):
+        """Fold the pending list into the sorted arrays, dropping stale entries"""
+        keys, rows = self._base
+        # Only rows whose key changed can have left a stale entry behind, and
+        # each field is a contiguous range of the index
+        valid = np.ones(len(keys), dtype=bool)
+        bounds = np.searchsorted(keys, [tag(code) for code in range(len(LOOKUP_FIELDS) + 1)])
+        for code, dirty in enumerate(self._dirty):
+            if not dirty:
+                continue
+            start, end = bounds[code], bounds[code + 1]
+            check = start + np.flatnonzero(np.isin(rows[start:end], np.concatenate(dirty)))
+            valid[check] = self._current(code, rows[check]) == keys[check]
+        keys, rows = keys[valid], rows[valid]
+        self._dirty = [[] for _ in LOOKUP_FIELDS]
+
+        new_keys = np.array([key for key, _ in pending], dtype="S")
+        new_rows = np.array([row for _, row in pending], dtype=np.int64)
+        keep = self._valid(new_keys, new_rows)
+        new_keys, new_rows = new_keys[keep], new_rows[keep]
+        keys = keys.astype(np.promote_types(keys.dtype, new_keys.dtype))
+        positions = np.searchsorted(keys, new_keys, side="right")
+        self._base = (np.insert(keys, positions, new_keys), np.insert(rows, positions, new_rows))
+
+    def _on_write(self, rows: np.ndarray, columns: Tuple[str, ...]):
+        codes = [code for code, field in enumerate(LOOKUP_FIELDS) if field in columns]
+        if not codes:
+            return
+        rows = np.unique(rows)
+        base_keys, base_rows = self._base
+        added: Pending = []
+        changed = {}
+        for code in codes:
+            keys = self._current(code, rows)
+            # Most writes repeat the key a row already has
+            indexed = np.zeros(len(rows), dtype=bool)
+            width = base_keys.dtype.itemsize
+            fits = ~_matrix(keys)[:, width:].any(axis=1)
+            if len(base_keys) and fits.any():
+                short = keys[fits].astype(base_keys.dtype)
+                position = np.minimum(np.searchsorted(base_keys, short), len(base_keys) - 1)
+                indexed[fits] = (base_keys[position] == short) & (base_rows[position] == rows[fits])
+            changed[code] = np.flatnonzero(~indexed)
+            present = changed[code][self.store.strings[LOOKUP_FIELDS[code]].data[rows[changed[code]]] != b""]
+            added += zip(keys[present].tolist(), rows[present].tolist())
+            changed[code] = rows[changed[code]]
+        with self.lock:
+            for code, dirty in changed.items():
+                if len(dirty):
+                    self._dirty[code].append(dirty)
+            if not added:
+                return
+            pending = sorted(set(self._pending).union(added))
+            if len(pending) > self.merge_threshold:
+                self._merge(pending)
+                pending = []
+            self._pending = pending
+
+    def _search(self, search_keys: List[bytes], prefix: bool, limit: int) -> List[Tuple[bytes, int]]:
+        """Up to `limit` valid (key, row) entries per tagged key from the merged index"""
+        keys, rows = self._base
+        # A needle wider than the keys would make numpy copy the whole
+        # array to compare; no indexed key is longer than the width anyway
+        width = keys.dtype.itemsize
+        search_keys = [key for key in search_keys if len(key) <= width]
+        if not search_keys:
+            return []
+        upper = [key + b"\xff" if prefix and len(key) < width else key for key in search_keys]
+        starts = np.searchsorted(keys, np.array(search_keys, dtype=keys.dtype), side="left").tolist()
+        ends = np.searchsorted(keys, np.array(upper, dtype=keys.dtype), side="right").tolist()
+
+        found: List[Tuple[bytes, int]] = []
+        chunk = max(limit, 16)
+        for start, end in zip(starts, ends):
+            matched: List[Tuple[bytes, int]] = []
+            while start < end and len(matched) < limit:
+                stop = min(start + chunk, end)
+                valid = self._valid(keys[start:stop], rows[start:stop])
+                matched += zip(keys[start:stop][valid].tolist(), rows[start:stop][valid].tolist())
+                start = stop
+            found += matched[:limit]
+        return found
+
+    def _search_pending(self, key: bytes, prefix: bool) -> List[Tuple[bytes, int]]:
+        """Candidate (key, row) entries for a tagged key from the pending list"""
+        pending = self._pending
+        found = []
+        for i in range(bisect_left(pending, (key,)), len(pending)):
+            entry = pending[i]
+            if not (entry[0].startswith(key) if prefix else entry[0] == key):
+                break
+            found.append(entry)
+        return found
+
+    def lookup(
+        self,
+        query: str,
+        prefix: bool = False,
+        fields: Sequence[str] = LOOKUP_FIELDS,
+        limit: int = 20
+    ) -> List[Tuple[str, int]]:
+        """
+        (field, row) of the assets whose fields equal (or, with `prefix`,
+        start with) the query, ordered by matched value
+        """
+        search_keys = []
+        for code, field in enumerate(LOOKUP_FIELDS):
+            value = normalize(field, query)
+            if field in fields and value:
+                search_keys.append(tag(code) + value.encode())
+
+        found = self._search(search_keys, prefix, limit)
+        for key in search_keys:
+            found += [
+                (k, row) for k, row in self._search_pending(key, prefix)
+                if self._current_key(k[0] - 1, row) == k
+            ]
+
+        results = []
+        seen = set()
+        for key, row in sorted(found):
+            if (key[0], row) not in seen:
+                seen.add((key[0], row))
+                results.append((LOOKUP_FIELDS[key[0] - 1], row))
+        return results[:limit]
+
+    def memory_bytes(self) -> int:
+        keys, rows = self._base
+        return keys.nbytes + rows.nbytes
+
+
+def get_asset_index(store: BuildStore) -> AssetIndex:
+    """Lookup index attached to a build store"""
+    return store.attachment("asset_index", lambda store: AssetIndex(store, settings.LOOKUP_MERGE_THRESHOLD))
@@ -0,0 +1,455 @@
+"""
+Prometheus-style metrics
+Each worker updates plain in-process counters (no locks on the hot path) and
+periodically writes a snapshot file to a shared directory; /metrics merges
+the snapshots of all gunicorn workers into the text exposition format.
+Counters and histograms of exited workers are folded into one retired
+snapshot, so totals never go backwards and the directory doesn't grow with
+every worker ever started.
+"""
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+import asyncio
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+RETIRED_SNAPSHOT = "retired.json"
+LOCK_FILE = "snapshots.lock"
+
+
+class Metric:
+    """Base metric family"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def snapshot(self) -> Dict[str, object]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing counter"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def snapshot(self) -> Dict[str, object]:
+        return {json.dumps(k): v for k, v in list(self._values.items())}
+
+
+class Gauge(Metric):
+    """Value that can go up and down, or is read from a callback at snapshot time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Callable[[], float] | None = None
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the unlabelled value from a callback instead of storing it"""
+        self._function = function
+
+    def snapshot(self) -> Dict[str, object]:
+        if self._function is not None:
+            self._values[()] = float(self._function())
+        return {json.dumps(k): v for k, v in list(self._values.items())}
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last is +Inf), sum, count]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager observing the elapsed time of a block"""
+        return _Timer(self, labels)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            json.dumps(k): [list(v[0]), v[1], v[2]]
+            for k, v in list(self._values.items())
+        }
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class MetricsRegistry:
+    """
+    Collection of metric families for this process
+    Snapshots are written to METRICS_DIR/worker_<pid>.json and merged on read.
+    An exited worker's snapshot is retired by gunicorn's child_exit hook
+    (before its pid can be reused), or by the next scrape that finds it dead.
+    """
+
+    def __init__(self, directory: str | None):
+        self.directory = directory
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def _snapshot(self) -> Dict[str, object]:
+        return {
+            "pid": os.getpid(),
+            "metrics": {name: metric.snapshot() for name, metric in self._metrics.items()}
+        }
+
+    def write_snapshot(self):
+        """Atomically replace this worker's snapshot file"""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"worker_{os.getpid()}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {str(e)}")
+
+    def _read_snapshots(self) -> List[Dict[str, object]]:
+        own = self._snapshot()
+        if not self.directory:
+            return [own]
+
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.directory, "worker_*.json")):
+            snapshot = self._load(path)
+            if snapshot is not None and snapshot.get("pid") != own["pid"]:
+                snapshots.append(snapshot)
+        return snapshots
+
+    @staticmethod
+    def _load(path: str) -> Dict[str, object] | None:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Serialize retiring snapshots with reading them, across processes"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _retire(self, pid: int):
+        """Fold an exited worker's counters and histograms into the retired snapshot (lock held)"""
+        path = os.path.join(self.directory, f"worker_{pid}.json")
+        snapshot = self._load(path)
+        if snapshot is not None:
+            retired_path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+            retired = self._load(retired_path) or {"pid": None, "metrics": {}}
+            for name, metric in self._metrics.items():
+                if metric.kind == "gauge" or name not in snapshot["metrics"]:
+                    continue
+                merged = retired["metrics"].setdefault(name, {})
+                for key, value in snapshot["metrics"][name].items():
+                    if metric.kind == "histogram":
+                        state = merged.setdefault(key, [[0] * len(value[0]), 0.0, 0])
+                        for i, c in enumerate(value[0][:len(state[0])]):
+                            state[0][i] += c
+                        state[1] += value[1]
+                        state[2] += value[2]
+                    else:
+                        merged[key] = merged.get(key, 0.0) + value
+            tmp_path = f"{retired_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(retired, f)
+            os.replace(tmp_path, retired_path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def retire_snapshot(self, pid: int):
+        """Retire the snapshot of an exited worker (called from gunicorn's child_exit)"""
+        if not self.directory:
+            return
+        try:
+            with self._locked():
+                self._retire(pid)
+        except OSError as e:
+            logger.warning(f"Failed to retire metrics snapshot of worker {pid}: {str(e)}")
+
+    def _collect(self) -> Tuple[List[Dict[str, object]], List[Dict[str, object]]]:
+        """Snapshots of live workers, and those of exited ones"""
+        if not self.directory:
+            return self._read_snapshots(), []
+        try:
+            with self._locked():
+                live = []
+                for snapshot in self._read_snapshots():
+                    if self._pid_alive(snapshot["pid"]):
+                        live.append(snapshot)
+                    else:
+                        self._retire(snapshot["pid"])
+                retired = self._load(os.path.join(self.directory, RETIRED_SNAPSHOT))
+        except OSError as e:
+            logger.warning(f"Failed to retire metrics snapshots: {str(e)}")
+            return self._read_snapshots(), []
+        return live, [retired] if retired else []
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def render(self) -> str:
+        """
+        Merge all worker snapshots into Prometheus text format
+        Counters and histograms are summed over live workers and the retired
+        snapshot of exited ones; gauges only over live workers
+        """
+        live, retired = self._collect()
+        lines: List[str] = []
+
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            sources = live if metric.kind == "gauge" else live + retired
+
+            if metric.kind == "histogram":
+                merged: Dict[str, list] = {}
+                for snapshot in sources:
+                    for key, (counts, total, count) in snapshot["metrics"].get(name, {}).items():
+                        state = merged.setdefault(key, [[0] * len(counts), 0.0, 0])
+                        for i, c in enumerate(counts[:len(state[0])]):
+                            state[0][i] += c
+                        state[1] += total
+                        state[2] += count
+                for key, (counts, total, count) in sorted(merged.items()):
+                    labels = self._labels(metric, key)
+                    cumulative = 0
+                    for bound, c in zip(list(metric.buckets) + ["+Inf"], counts):
+                        cumulative += c
+                        le = bound if bound == "+Inf" else repr(float(bound))
+                        lines.append(f"{name}_bucket{self._format(labels + [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{self._format(labels)} {total}")
+                    lines.append(f"{name}_count{self._format(labels)} {count}")
+            else:
+                values: Dict[str, float] = {}
+                for snapshot in sources:
+                    for key, value in snapshot["metrics"].get(name, {}).items():
+                        values[key] = values.get(key, 0.0) + value
+                for key, value in sorted(values.items()):
+                    lines.append(f"{name}{self._format(self._labels(metric, key))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(metric: Metric, key: str) -> List[Tuple[str, str]]:
+        return list(zip(metric.labelnames, json.loads(key)))
+
+    @staticmethod
+    def _format(labels: List[Tuple[str, str]]) -> str:
+        if not labels:
+            return ""
+        escaped = (
+            k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in labels
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    async def run_flusher(self, interval: float):
+        """Write this worker's snapshot every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            self.write_snapshot()
+
+
+def _metrics_directory() -> str | None:
+    if settings.METRICS_DIR:
+        return settings.METRICS_DIR
+    if settings.SHARED_STATE_DIR:
+        return os.path.join(settings.SHARED_STATE_DIR, "metrics")
+    return None
+
+
+# Global registry and metric families
+registry = MetricsRegistry(_metrics_directory())
+
+http_requests_total = registry.counter(
+    "dashboard_http_requests_total",
+    "HTTP requests by method, route template and status code",
+    ("method", "route", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "dashboard_http_request_duration_seconds",
+    "HTTP request latency by method and route template",
+    ("method", "route")
+)
+http_requests_in_flight = registry.gauge(
+    "dashboard_http_requests_in_flight",
+    "HTTP requests currently being processed"
+)
+rate_limit_rejections_total = registry.counter(
+    "dashboard_rate_limit_rejections_total",
+    "Requests rejected by the rate limiter"
+)
+sessions_active = registry.gauge(
+    "dashboard_sessions_active",
+    "Sessions held in the in-memory session store"
+)
+saml_verification_seconds = registry.histogram(
+    "dashboard_saml_verification_seconds",
+    "Time spent validating SAML responses",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+heartbeats_received_total = registry.counter(
+    "dashboard_heartbeats_received_total",
+    "Heartbeat reports received from installers"
+)
+heartbeat_hosts_flushed_total = registry.counter(
+    "dashboard_heartbeat_hosts_flushed_total",
+    "Hosts flushed from the heartbeat windows of each worker"
+)
+heartbeat_flush_seconds = registry.histogram(
+    "dashboard_heartbeat_flush_seconds",
+    "Time spent writing a heartbeat flush window to the build store"
+)
+stale_builds_total = registry.counter(
+    "dashboard_stale_builds_total",
+    "In-flight builds marked stale after missing heartbeats"
+)
+shard_query_seconds = registry.histogram(
+    "dashboard_shard_query_seconds",
+    "Time spent querying one region shard",
+    ("region",)
+)
+shard_query_failures_total = registry.counter(
+    "dashboard_shard_query_failures_total",
+    "Region shard queries that timed out or failed",
+    ("region", "reason")
+)
+single_flight_requests_total = registry.counter(
+    "dashboard_single_flight_requests_total",
+    "Coalescable reads by path and role (leader computed it, follower shared it)",
+    ("path", "role")
+)
+idempotent_requests_total = registry.counter(
+    "dashboard_idempotent_requests_total",
+    "Requests carrying an Idempotency-Key by endpoint and outcome",
+    ("endpoint", "outcome")
+)
+export_rows_total = registry.counter(
+    "dashboard_export_rows_total",
+    "Rows streamed by exports by dataset and format",
+    ("dataset", "format")
+)
+audit_records_total = registry.counter(
+    "dashboard_audit_records_total",
+    "Audit records appended by action and outcome",
+    ("action", "outcome")
+)
+audit_flush_seconds = registry.histogram(
+    "dashboard_audit_flush_seconds",
+    "Time spent writing and fsyncing a batch of audit records"
+)
+admission_in_flight = registry.gauge(
+    "dashboard_admission_in_flight",
+    "Requests holding an admission slot by lane",
+    ("lane",)
+)
+admission_queue_depth = registry.gauge(
+    "dashboard_admission_queue_depth",
+    "Requests waiting for an admission slot by lane",
+    ("lane",)
+)
+admission_shed_total = registry.counter(
+    "dashboard_admission_shed_total",
+    "Requests shed with 503 by lane and reason (queue_full/timeout)",
+    ("lane", "reason")
+)
@@ -4,15 +4,71 @@ Security middleware following DevSecOps best practices
 from fastapi import Request, Response, HTTPException, status
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
-from typing import Callable, Dict
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlencode
+import asyncio
+import cProfile
+import os
 import time
 import logging
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
 from datetime import datetime, timedelta
 
+from app import metrics
+from app.compression import IDENTITY, compress, compressible, negotiate
+from app.logging_config import request_log_state
+from app.profiling import StackSampler, profile_name, prune_profiles, write_collapsed
+from app.session import get_session
+
 logger = logging.getLogger(__name__)
 
 
+def route_template(scope: Scope) -> str:
+    """
+    Get the matched route's path template, e.g. /api/build-history/{date}
+    Routes of prefixed routers may report their path without the prefix,
+    so the prefix is recovered from the request path
+    """
+    route = scope.get("route")
+    route_path = getattr(route, "path", None)
+    if not route_path:
+        return "unmatched"
+    
+    path_format = getattr(route, "path_format", route_path)
+    try:
+        rendered = path_format.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return route_path
+    request_path = scope.get("path", "")
+    if rendered and request_path.endswith(rendered):
+        return request_path[:len(request_path) - len(rendered)] + route_path
+    return route_path
+
+
+def header_value(scope: Scope, name: bytes) -> str | None:
+    """First value of a request header, by lower-case name"""
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def session_user(scope: Scope) -> dict | None:
+    """User data of the request's session cookie, None without a valid session"""
+    for name, value in scope.get("headers", []):
+        if name != b"cookie":
+            continue
+        for part in value.decode("latin-1").split(";"):
+            key, _, token = part.strip().partition("=")
+            if key == "session_token" and token:
+                user = get_session(token)
+                if user:
+                    return user
+    return None
+
+
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     """
     Add security headers to all responses
@@ -85,8 +141,8 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         self.last_cleanup = time.time()
     
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Skip rate limiting for health check
-        if request.url.path == "/health":
+        # Skip rate limiting for health check and metrics scrapes
+        if request.url.path in ("/health", "/metrics"):
             return await call_next(request)
         
         client_id = self._get_client_identifier(request)
@@ -104,6 +160,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         # Check rate limit
         if len(recent_requests) >= self.burst:
             logger.warning(f"Rate limit exceeded for client: {client_id}")
+            metrics.rate_limit_rejections_total.inc()
             return JSONResponse(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 content={
@@ -133,42 +190,429 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         return response
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """
     Log all requests for audit purposes
+    Emits one structured access record per request and holds the per-request
+    state used by the log sampling filter
     """
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Log request
-        logger.info(
-            f"Request: {request.method} {request.url.path} "
-            f"Client: {request.client.host if request.client else 'unknown'}"
-        )
+        start_time = time.perf_counter()
+        state = {"scope": scope}
+        token = request_log_state.set(state)
+        status_code = 500
         
-        # Process request
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Add timing header
+                process_time = time.perf_counter() - start_time
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-process-time", str(process_time).encode())
+                ]
+            await send(message)
+        
+        client = scope.get("client")
         try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-            
-            # Log response
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            logger.error(
+                f"Request failed: {scope['method']} {scope['path']} Error: {str(e)}",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "duration_ms": round((time.perf_counter() - start_time) * 1000, 3),
+                }
+            )
+            raise
+        else:
+            process_time = time.perf_counter() - start_time
+            logger.log(
+                logging.WARNING if status_code >= 500 else logging.INFO,
+                f"Response: {scope['method']} {scope['path']} Status: {status_code}",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": state.get("route") or route_template(scope),
+                    "status": status_code,
+                    "duration_ms": round(process_time * 1000, 3),
+                    "client": client[0] if client else "unknown",
+                }
+            )
+        finally:
+            request_log_state.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Record per-route request counts, latency and in-flight requests
+    Plain ASGI middleware to keep per-request overhead low. Routes are
+    labelled by their path template so label cardinality stays bounded.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status_code = 500
+        
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        start_time = time.perf_counter()
+        metrics.http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.http_requests_in_flight.dec()
+            route_path = route_template(scope)
+            metrics.http_request_duration_seconds.observe(
+                time.perf_counter() - start_time, scope["method"], route_path
+            )
+            metrics.http_requests_total.inc(scope["method"], route_path, str(status_code))
+
+
+class SingleFlightMiddleware:
+    """
+    Share one in-flight computation between identical concurrent reads
+    Requests with the same method, path, query parameters and authorization
+    scope (the session's role and groups) that arrive while the first one
+    is still running wait for it and get a copy of its serialized response.
+    The computation runs in its own task, so it completes for the waiting
+    requests even if the first client disconnects.
+    """
+    
+    # Route scope keys copied to coalesced requests, so logging and metrics
+    # still see the matched route
+    ROUTE_KEYS = ("route", "endpoint", "path_params")
+    
+    def __init__(self, app: ASGIApp, paths: List[str]):
+        self.app = app
+        self.paths = paths
+        self.in_flight: Dict[tuple, asyncio.Future] = {}
+    
+    def _match(self, path: str) -> str | None:
+        """Configured path (or path prefix, when it ends in /) matching a request"""
+        for candidate in self.paths:
+            if path == candidate or (candidate.endswith("/") and path.startswith(candidate)):
+                return candidate
+        return None
+    
+    @staticmethod
+    def _authorization_scope(scope: Scope) -> str:
+        user = session_user(scope)
+        if user:
+            return f"{user.get('role', 'user')}:{','.join(sorted(user.get('groups', [])))}"
+        return "anonymous"
+    
+    async def _compute(self, scope: Scope) -> Tuple[Message, bytes, dict]:
+        start: Message = {}
+        body: List[bytes] = []
+        requested = False
+        
+        async def receive() -> Message:
+            # GET requests have no body; never report a disconnect, since
+            # the result may still be wanted by other requests
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await asyncio.Event().wait()
+        
+        async def capture(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+        
+        await self.app(scope, receive, capture)
+        return start, b"".join(body), {k: scope[k] for k in self.ROUTE_KEYS if k in scope}
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        path = self._match(scope.get("path", "")) if scope["type"] == "http" else None
+        if path is None or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        
+        query = urlencode(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"))))
+        # Responses are encoded for the client, so only share between
+        # requests that negotiate the same encoding
+        encoding = negotiate(header_value(scope, b"accept-encoding"))
+        key = (scope["path"], query, self._authorization_scope(scope), encoding)
+        future = self.in_flight.get(key)
+        if future is None:
+            metrics.single_flight_requests_total.inc(path, "leader")
+            future = asyncio.ensure_future(self._compute(dict(scope)))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            metrics.single_flight_requests_total.inc(path, "follower")
+        
+        start, body, route = await asyncio.shield(future)
+        scope.update(route)
+        await send(dict(start, headers=list(start.get("headers", []))))
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+
+
+class AdmissionLane:
+    """
+    Concurrency limit with a bounded FIFO queue
+    A released slot is handed straight to the oldest waiter, so queued
+    requests can't be overtaken by new arrivals.
+    """
+    
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters: deque = deque()
+    
+    async def acquire(self, timeout: float) -> str | None:
+        """Take a slot, waiting up to `timeout`; returns the shed reason if none was free"""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            metrics.admission_in_flight.set(self.active, self.name)
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        metrics.admission_queue_depth.set(len(self.waiters), self.name)
+        try:
+            await asyncio.wait((waiter,), timeout=timeout)
+        except asyncio.CancelledError:
+            # A slot handed over as the request was cancelled is passed on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            metrics.admission_queue_depth.set(len(self.waiters), self.name)
+        return None if not waiter.cancelled() else "timeout"
+    
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        metrics.admission_in_flight.set(self.active, self.name)
+
+
+class AdmissionControlMiddleware:
+    """
+    Bound the concurrent requests a worker works on
+    Each configured path (or path prefix, ending in /) has its own lane and
+    the remaining paths share a default lane, so a storm on one read route
+    can't take every slot. Reserved paths (operator mutations, health
+    checks) have a lane of their own that reads never occupy. A request
+    that finds its lane's queue full, or waits longer than `timeout`, gets
+    an immediate 503 with Retry-After instead of piling up.
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        limits: Dict[str, int],
+        default_limit: int,
+        reserved_paths: List[str],
+        reserved_limit: int,
+        queue_size: int,
+        timeout: float,
+        retry_after: int
+    ):
+        self.app = app
+        self.reserved_paths = set(reserved_paths)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.lanes = {path: AdmissionLane(path, limit, queue_size) for path, limit in limits.items()}
+        self.reserved = AdmissionLane("reserved", reserved_limit, queue_size)
+        self.default = AdmissionLane("default", default_limit, queue_size)
+    
+    def _lane(self, path: str) -> AdmissionLane:
+        if path in self.reserved_paths:
+            return self.reserved
+        lane = self.lanes.get(path)
+        if lane is not None:
+            return lane
+        for candidate, lane in self.lanes.items():
+            if candidate.endswith("/") and path.startswith(candidate):
+                return lane
+        return self.default
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        lane = self._lane(scope.get("path", ""))
+        reason = await lane.acquire(self.timeout)
+        if reason is not None:
+            metrics.admission_shed_total.inc(lane.name, reason)
+            response = JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"error": "Server busy", "detail": "Too many concurrent requests, retry shortly"},
+                headers={"Retry-After": str(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release()
+
+
+class ProfilingMiddleware:
+    """
+    Profile single requests for admins
+    A request with an X-Profile header or profile query parameter (`sample`
+    or `1` for the stack sampler, `cprofile` for cProfile) from a session
+    with the admin role is profiled. The profile is written to `directory`
+    once the response is sent, and its name returned in X-Profile-Id for
+    download from /api/profiles/{name}. Both profilers also see whatever
+    else the worker runs meanwhile, and cProfile only sees the event loop
+    thread, not work handed to worker threads. One request is profiled at
+    a time per worker; the flag is ignored while another one is.
+    """
+    
+    MODES = {"1": "sample", "true": "sample", "sample": "sample", "cprofile": "cprofile"}
+    
+    def __init__(self, app: ASGIApp, directory: str, interval: float, max_files: int):
+        self.app = app
+        self.directory = directory
+        self.interval = interval
+        self.max_files = max_files
+        self.active = False
+    
+    def _mode(self, scope: Scope) -> str | None:
+        value = header_value(scope, b"x-profile")
+        if value is None:
+            query = parse_qsl(scope.get("query_string", b"").decode("latin-1"))
+            value = next((v for key, v in query if key == "profile"), None)
+        return self.MODES.get(value.strip().lower()) if value else None
+    
+    def _write(self, name: str, profiler: cProfile.Profile | None, stacks: Counter | None):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        if profiler is not None:
+            profiler.dump_stats(path)
+        else:
+            write_collapsed(path, stacks)
+        prune_profiles(self.directory, self.max_files)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        mode = self._mode(scope) if scope["type"] == "http" else None
+        user = session_user(scope) if mode and not self.active else None
+        if user is None or user.get("role") != "admin":
+            await self.app(scope, receive, send)
+            return
+        
+        self.active = True
+        name = profile_name("request", ".prof" if mode == "cprofile" else ".collapsed")
+        
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", name.encode())]
+            await send(message)
+        
+        profiler = sampler = stacks = None
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = StackSampler(self.interval)
+            sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            else:
+                stacks = sampler.stop()
+            self.active = False
             logger.info(
-                f"Response: {request.method} {request.url.path} "
-                f"Status: {response.status_code} "
-                f"Time: {process_time:.3f}s"
+                f"Profiled {scope['method']} {scope['path']} for {user['email']} ({mode}): {name}",
+                extra={"user": user["email"], "profile": name}
             )
+            try:
+                await asyncio.to_thread(self._write, name, profiler, stacks)
+            except Exception as e:
+                logger.error(f"Writing profile {name} failed: {str(e)}")
+
+
+class CompressionMiddleware:
+    """
+    Compress responses in the encoding negotiated from Accept-Encoding
+    Only complete (non-streamed) bodies of compressible content types and
+    at least `minimum_size` bytes are compressed; responses that already
+    carry a Content-Encoding, such as precompressed cached bodies, pass
+    through untouched.
+    """
+    
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(header_value(scope, b"accept-encoding"))
+        if encoding == IDENTITY:
+            await self.app(scope, receive, send)
+            return
+        
+        start: Message | None = None
+        
+        async def send_wrapper(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held back until the first body message shows whether it can be compressed
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
             
-            # Add timing header
-            response.headers["X-Process-Time"] = str(process_time)
-            
-            return response
-            
-        except Exception as e:
-            process_time = time.time() - start_time
-            logger.error(
-                f"Request failed: {request.method} {request.url.path} "
-                f"Error: {str(e)} "
-                f"Time: {process_time:.3f}s"
+            headers = MutableHeaders(raw=list(start.get("headers", [])))
+            body = message.get("body", b"")
+            eligible = (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and compressible(headers.get("content-type"))
             )
-            raise
\ No newline at end of file
+            if eligible:
+                body = await asyncio.to_thread(compress, body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = dict(message, body=body)
+            await send(dict(start, headers=headers.raw))
+            start = None
+            await send(message)
+        
+        await self.app(scope, receive, send_wrapper)
@@ -1,7 +1,7 @@
 """
 Pydantic models for request/response validation
 """
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import BaseModel, EmailStr, Field, RootModel, validator
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from enum import Enum
@@ -23,6 +23,7 @@ class ServerStatus(str, Enum):
     INSTALLING = "installing"
     COMPLETE = "complete"
     FAILED = "failed"
+    STALLED = "stalled"
 
 
 class AssignedStatus(str, Enum):
@@ -61,18 +62,133 @@ class ServerDetails(Server):
     last_heartbeat: Optional[datetime] = None
 
 
-class BuildStatus(BaseModel):
-    """Build status response model"""
-    cbg: List[Server] = []
-    dub: List[Server] = []
-    dal: List[Server] = []
+class TimelineSample(BaseModel):
+    """Build progress of a server at one point in time"""
+    timestamp: datetime
+    percent_built: int
+    status: str
+
+
+class ServerTimeline(BaseModel):
+    """Server build progress timeline response model"""
+    hostname: str
+    region: str
+    start: datetime
+    end: datetime
+    samples: List[TimelineSample] = Field(
+        ..., description="Changes of progress or status; older days hold the last sample per minute or hour"
+    )
+
+
+class LookupField(str, Enum):
+    """Fields searched by asset lookup"""
+    HOSTNAME = "hostname"
+    SERIAL_NUMBER = "serial_number"
+    DBID = "dbid"
+    MAC_ADDRESS = "mac_address"
+    IP_ADDRESS = "ip_address"
+
+
+class AssetMatch(BaseModel):
+    """Server found by asset lookup"""
+    field: LookupField = Field(..., description="Field the query matched")
+    value: str = Field(..., description="Matched value as stored")
+    region: str
+    server: Server
+
+
+class AssetLookupResponse(BaseModel):
+    """Asset lookup response model"""
+    query: str
+    prefix: bool
+    matches: List[AssetMatch]
+
+
+class BuildStatus(RootModel[Dict[str, List[Server]]]):
+    """Build status response model, servers keyed by region (e.g., cbg, dub, dal)"""
+
+
+class BuildHistory(RootModel[Dict[str, List[Server]]]):
+    """Build history response model, servers keyed by region (e.g., cbg, dub, dal)"""
+
+
+# Rollup Models
+class DailyBuilds(BaseModel):
+    """Builds finished in a region on one day"""
+    date: str
+    builds: int
+    complete: int
+    failed: int
+    partial: bool = Field(..., description="Day not closed yet; refreshed periodically")
+
+
+class FailureRate(BaseModel):
+    """Build failures of one machine type or rack"""
+    name: str
+    builds: int
+    failed: int
+    failure_rate: float
+
+
+class CompletionPercentiles(BaseModel):
+    """Time to complete of successful builds in seconds (to the rollup bucket size)"""
+    p50: int
+    p90: int
+    p99: int
+
+
+class BuildRollup(BaseModel):
+    """Build throughput of one region over a date range"""
+    builds: int
+    complete: int
+    failed: int
+    failure_rate: float
+    days: List[DailyBuilds]
+    machine_types: List[FailureRate]
+    racks: List[FailureRate] = Field(..., description="Racks with the most failed builds")
+    time_to_complete: Optional[CompletionPercentiles] = None
+
+
+class BuildRollups(RootModel[Dict[str, BuildRollup]]):
+    """Build throughput rollups keyed by region (e.g., cbg, dub, dal)"""
 
 
-class BuildHistory(BaseModel):
-    """Build history response model"""
-    cbg: List[Server] = []
-    dub: List[Server] = []
-    dal: List[Server] = []
+# Export Models
+class ExportDataset(str, Enum):
+    """Datasets that can be exported"""
+    BUILD_HISTORY = "build-history"
+    ASSIGNMENTS = "assignments"
+
+
+class ExportFormat(str, Enum):
+    """Export file formats"""
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+# Rack Models
+class RackSlot(BaseModel):
+    """Occupancy of one rack slot"""
+    slot: str
+    servers: int
+    percent_built: int = Field(..., description="Average build progress of the slot")
+    status_counts: Dict[str, int]
+
+
+class Rack(BaseModel):
+    """Occupancy of one rack"""
+    rack: str = Field(..., description="Rack identifier without slot (e.g., '1', 'S1')")
+    small: bool = Field(..., description="Small (S-prefixed) rack")
+    servers: int
+    percent_built: int = Field(..., description="Average build progress of the rack")
+    status_counts: Dict[str, int]
+    slots: List[RackSlot]
+
+
+class RackOccupancy(BaseModel):
+    """Rack occupancy response model"""
+    region: str
+    racks: List[Rack]
 
 
 # Preconfig Models
@@ -123,6 +239,66 @@ class AssignResponse(BaseModel):
     message: str
 
 
+# Audit Models
+class AuditRecord(BaseModel):
+    """One audited mutation"""
+    timestamp: datetime
+    action: str
+    user: str
+    outcome: str = Field(..., description="success, rejected or error")
+    hostname: Optional[str] = None
+    dbid: Optional[str] = None
+    serial_number: Optional[str] = None
+    depot: Optional[int] = None
+    region: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class AuditLogResponse(BaseModel):
+    """Audit records of a time range, oldest first"""
+    records: List[AuditRecord]
+    truncated: bool = Field(..., description="More records matched than were returned")
+
+
+# Profiling Models
+class ProfileInfo(BaseModel):
+    """A stored profile"""
+    name: str
+    bytes: int
+    modified: datetime
+
+
+class ProfileList(BaseModel):
+    """Stored profiles, newest first"""
+    profiles: List[ProfileInfo]
+
+
+# Heartbeat Models
+class HeartbeatReport(BaseModel):
+    """Build progress report from an installer"""
+    hostname: str = Field(..., min_length=1)
+    percent_built: int = Field(..., ge=0, le=100)
+    status: Optional[ServerStatus] = Field(
+        default=None, description="Defaults to complete at 100%, installing otherwise"
+    )
+    timestamp: Optional[datetime] = Field(default=None, description="Defaults to time received")
+    region: Optional[str] = None
+    rackID: Optional[str] = None
+    machine_type: Optional[str] = None
+    serial_number: Optional[str] = None
+    dbid: Optional[str] = None
+
+
+class HeartbeatBatch(BaseModel):
+    """Batched heartbeat reports"""
+    heartbeats: List[HeartbeatReport] = Field(..., max_length=10000)
+
+
+class HeartbeatResponse(BaseModel):
+    """Heartbeat ingestion response model"""
+    accepted: int
+
+
 # Generic Response Models
 class SuccessResponse(BaseModel):
     """Generic success response"""
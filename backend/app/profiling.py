@@ -0,0 +1,170 @@
+"""
+On-demand profiling
+Admins can profile a single request (see ProfilingMiddleware), and a
+periodic sampler can record what every thread of a worker is doing. Both
+use a stack sampler that reads every thread's current frame at a fixed
+interval and counts collapsed stacks (root;...;leaf count, the input format
+of flamegraph tools); single requests can use cProfile instead. Profiles
+are written under PROFILING_DIR, and nothing runs unless ENVIRONMENT is one
+of PROFILING_ENVIRONMENTS.
+"""
+from collections import Counter
+from typing import Dict, List
+import asyncio
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIXES = (".collapsed", ".prof")
+SAMPLER_THREAD = "stack-sampler"
+
+
+def profiling_enabled() -> bool:
+    return settings.ENVIRONMENT in settings.PROFILING_ENVIRONMENTS
+
+
+def profile_directory() -> str | None:
+    if settings.PROFILING_DIR:
+        return settings.PROFILING_DIR
+    if settings.SHARED_STATE_DIR:
+        return os.path.join(settings.SHARED_STATE_DIR, "profiles")
+    return None
+
+
+def profile_name(kind: str, suffix: str) -> str:
+    """Unique file name of a new profile, sortable by creation time"""
+    return f"{int(time.time() * 1000):013d}-{os.getpid()}-{kind}-{secrets.token_hex(4)}{suffix}"
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+    return f"{code.co_qualname} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def collapse(thread_name: str, frame) -> str:
+    """Stack of a frame from the thread root down, joined by semicolons"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Sample the stacks of every other thread from a background thread
+    Overhead is one pass over the live frames per interval, so it is safe
+    to leave running at intervals of a few milliseconds and up.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=SAMPLER_THREAD, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """Stop sampling and return the stacks counted since the last take"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.take()
+
+    def take(self) -> Counter:
+        """Stacks counted so far, resetting the counts"""
+        with self.lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            # Samplers (this one and any other running) are left out
+            stacks = [
+                collapse(names.get(ident, f"thread-{ident}"), frame)
+                for ident, frame in sys._current_frames().items()
+                if names.get(ident) != SAMPLER_THREAD
+            ]
+            with self.lock:
+                self._counts.update(stacks)
+
+
+def write_collapsed(path: str, counts: Counter):
+    """Write stack counts in collapsed format, most frequent first"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(temporary, path)
+
+
+def list_profiles(directory: str) -> List[Dict[str, object]]:
+    """Profiles in a directory, newest first"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        if not name.endswith(PROFILE_SUFFIXES):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        profiles.append({"name": name, "bytes": stat.st_size, "modified": stat.st_mtime})
+    return sorted(profiles, key=lambda profile: profile["name"], reverse=True)
+
+
+def prune_profiles(directory: str, keep: int):
+    """Delete all but the newest `keep` profiles"""
+    for profile in list_profiles(directory)[keep:]:
+        try:
+            os.remove(os.path.join(directory, profile["name"]))
+        except FileNotFoundError:
+            pass
+
+
+def _write_window(directory: str, counts: Counter):
+    os.makedirs(directory, exist_ok=True)
+    write_collapsed(os.path.join(directory, profile_name("sampled", ".collapsed")), counts)
+    prune_profiles(directory, settings.PROFILING_MAX_FILES)
+
+
+async def run_sampler(window: float):
+    """
+    Lifespan task sampling this worker's threads, writing one collapsed
+    stacks file per window
+    """
+    directory = profile_directory()
+    if directory is None:
+        return
+    sampler = StackSampler(settings.PROFILING_SAMPLE_INTERVAL_MS / 1000)
+    sampler.start()
+    logger.info(f"Sampling stacks every {settings.PROFILING_SAMPLE_INTERVAL_MS} ms into {directory}")
+    try:
+        while True:
+            await asyncio.sleep(window)
+            counts = sampler.take()
+            if counts:
+                try:
+                    await asyncio.to_thread(_write_window, directory, counts)
+                except Exception as e:
+                    logger.error(f"Writing sampled stacks failed: {str(e)}")
+    finally:
+        sampler.stop()
@@ -0,0 +1,191 @@
+"""
+Rack occupancy aggregates
+Per (region, rackID) server counts, status counts and summed progress,
+maintained incrementally from build store writes: each write subtracts the
+rows' previously counted contribution and adds the new one, so requests
+never rescan the fleet. Each region's response is serialized once and
+reused until that region's aggregates change.
+"""
+from typing import Dict, List, Tuple
+import json
+import threading
+import numpy as np
+
+from app.store import BuildStore
+
+AGGREGATED_COLUMNS = {"hostname", "region", "rackID", "status", "percent_built"}
+
+
+def parse_rack_id(rack_id: str) -> Tuple[str, str]:
+    """Split a rackID such as "1-E" or "S1-A" into rack and slot"""
+    rack, _, slot = rack_id.partition("-")
+    return rack, slot
+
+
+def rack_sort_key(rack: str) -> Tuple[int, int, str]:
+    """Normal racks in numeric order, then small (S-prefixed) racks"""
+    small = rack.startswith("S")
+    number = rack[1:] if small else rack
+    return (int(small), int(number) if number.isdigit() else 0, rack)
+
+
+def slot_sort_key(slot: str) -> Tuple[int, str]:
+    """Numbered slots first, then lettered slots"""
+    return (int(slot), "") if slot.isdigit() else (1 << 30, slot)
+
+
+class RackAggregator:
+    """
+    Incrementally maintained rack/slot aggregates over a BuildStore
+    Arrays are indexed by [region code, rackID code] (and status code for
+    the status counts). The contribution each row was last counted with is
+    remembered so updates can be reversed exactly.
+    """
+
+    def __init__(self, store: BuildStore):
+        self.store = store
+        self.lock = threading.Lock()
+        self.servers = np.zeros((0, 0), dtype=np.int64)
+        self.percent = np.zeros((0, 0), dtype=np.int64)
+        self.statuses = np.zeros((0, 0, 0), dtype=np.int64)
+        # Per-row contribution as last counted
+        self.counted = np.zeros(0, dtype=bool)
+        self.row_region = np.zeros(0, dtype=np.int64)
+        self.row_rack = np.zeros(0, dtype=np.int64)
+        self.row_status = np.zeros(0, dtype=np.int64)
+        self.row_percent = np.zeros(0, dtype=np.int64)
+        self.region_versions: Dict[int, int] = {}
+        self._responses: Dict[str, Tuple[int, bytes]] = {}
+        self._parsed_labels: List[Tuple[str, str]] = []
+        with store.lock:
+            store.subscribe(self._on_write)
+            self.apply(np.arange(store.size))
+
+    def _grow(self):
+        store = self.store
+        shape = (
+            len(store.pools["region"].values),
+            len(store.pools["rackID"].values),
+            len(store.pools["status"].values),
+        )
+        if self.statuses.shape != shape:
+            for name in ("servers", "percent", "statuses"):
+                old = getattr(self, name)
+                grown = np.zeros(shape[:old.ndim], dtype=np.int64)
+                grown[tuple(slice(0, n) for n in old.shape)] = old
+                setattr(self, name, grown)
+        if len(self.counted) < store.capacity:
+            for name in ("counted", "row_region", "row_rack", "row_status", "row_percent"):
+                old = getattr(self, name)
+                grown = np.zeros(store.capacity, dtype=old.dtype)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+
+    def _add(self, rows: np.ndarray, sign: int):
+        region, rack, status = self.row_region[rows], self.row_rack[rows], self.row_status[rows]
+        np.add.at(self.servers, (region, rack), sign)
+        np.add.at(self.percent, (region, rack), sign * self.row_percent[rows])
+        np.add.at(self.statuses, (region, rack, status), sign)
+
+    def apply(self, rows: np.ndarray):
+        """Recount `rows` from the store (called under the store lock)"""
+        store = self.store
+        with self.lock:
+            self._grow()
+            rows = np.unique(rows)
+            previous = rows[self.counted[rows]]
+            self._add(previous, -1)
+            changed_regions = set(self.row_region[previous].tolist())
+
+            self.row_region[rows] = store.codes["region"][rows]
+            self.row_rack[rows] = store.codes["rackID"][rows]
+            self.row_status[rows] = store.codes["status"][rows]
+            self.row_percent[rows] = store.numbers["percent_built"][rows]
+            self.counted[rows] = True
+            self._add(rows, 1)
+
+            changed_regions.update(self.row_region[rows].tolist())
+            for region in changed_regions:
+                self.region_versions[region] = self.region_versions.get(region, 0) + 1
+
+    def _on_write(self, rows: np.ndarray, columns: Tuple[str, ...]):
+        if AGGREGATED_COLUMNS.intersection(columns):
+            self.apply(rows)
+
+    def _parsed(self) -> List[Tuple[str, str]]:
+        """(rack, slot) for every rackID code, parsed once per label"""
+        labels = self.store.pools["rackID"].values
+        for label in labels[len(self._parsed_labels):]:
+            self._parsed_labels.append(parse_rack_id(label))
+        return self._parsed_labels
+
+    def _build(self, region_code: int, region: str) -> dict:
+        """RackOccupancy-shaped payload for one region"""
+        status_labels = self.store.pools["status"].values
+        codes = np.flatnonzero(self.servers[region_code])
+        parsed = self._parsed()
+        names = [parsed[code][0] for code in codes.tolist()]
+        slot_names = [parsed[code][1] for code in codes.tolist()]
+
+        servers = self.servers[region_code, codes]
+        percent = self.percent[region_code, codes]
+        counts = self.statuses[region_code][codes]
+
+        # Rack totals: sum the slots of each rack
+        racks, rack_index = np.unique(np.array(names, dtype=object), return_inverse=True)
+        rack_servers = np.bincount(rack_index, servers, len(racks)).astype(np.int64)
+        rack_percent = np.bincount(rack_index, percent, len(racks)).astype(np.int64)
+        rack_counts = np.zeros((len(racks), counts.shape[1]), dtype=np.int64)
+        np.add.at(rack_counts, rack_index, counts)
+
+        def status_counts(row: List[int]) -> Dict[str, int]:
+            return {status_labels[s]: n for s, n in enumerate(row) if n}
+
+        slots: List[List[dict]] = [[] for _ in racks]
+        for i, slot, n, p, c in zip(
+            rack_index.tolist(), slot_names, servers.tolist(), percent.tolist(), counts.tolist()
+        ):
+            slots[i].append({
+                "slot": slot, "servers": n, "percent_built": p // n, "status_counts": status_counts(c)
+            })
+
+        result = []
+        for i, (rack, n, p, c) in enumerate(zip(
+            racks.tolist(), rack_servers.tolist(), rack_percent.tolist(), rack_counts.tolist()
+        )):
+            result.append({
+                "rack": rack,
+                "small": rack.startswith("S"),
+                "servers": n,
+                "percent_built": p // n,
+                "status_counts": status_counts(c),
+                "slots": sorted(slots[i], key=lambda s: slot_sort_key(s["slot"])),
+            })
+        result.sort(key=lambda r: rack_sort_key(r["rack"]))
+        return {"region": region, "racks": result}
+
+    def occupancy(self, region: str) -> bytes | None:
+        """
+        Rack occupancy for a region as serialized RackOccupancy JSON, or None
+        if the region is unknown. Serialized once per change to the region.
+        """
+        region_code = self.store.pools["region"].lookup(region)
+        if region_code is None:
+            return None
+        with self.lock:
+            version = self.region_versions.get(region_code, 0)
+            cached = self._responses.get(region)
+            if cached and cached[0] == version:
+                return cached[1]
+            if region_code < self.servers.shape[0]:
+                payload = self._build(region_code, region)
+            else:
+                payload = {"region": region, "racks": []}
+            body = json.dumps(payload, separators=(",", ":")).encode()
+            self._responses[region] = (version, body)
+            return body
+
+
+def get_rack_aggregator(store: BuildStore) -> RackAggregator:
+    """Aggregator attached to a build store"""
+    return store.attachment("rack_aggregator", RackAggregator)
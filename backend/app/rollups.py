@@ -0,0 +1,316 @@
+"""
+Materialized build throughput rollups
+Per region and day: builds finished, failures by machine_type and rack, and
+a histogram of time-to-complete. Each day is aggregated once from the build
+source and stored in an SQLite table shared by the workers; closed days
+are final, today's row is a partial rollup refreshed every
+ROLLUP_REFRESH_SECONDS. Range queries combine the stored rows (counts add
+up, percentiles come from the summed histograms) without touching build
+rows.
+"""
+from datetime import date as date_type, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from app.config import settings
+from app.fleet import get_fleet_simulator
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+
+# Outcome columns of the builds of one region's day, as returned by
+# FleetSimulator.finished_builds
+BuildSource = Callable[[str, str], Dict[str, object]]
+
+# (date, closed, rollup) rows of one region
+Days = List[Tuple[str, bool, dict]]
+
+
+def _counts(codes: np.ndarray, labels: List[str], failed: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """Labels that occur and their (builds, failed) counts as a (2, labels) array"""
+    codes = np.asarray(codes, dtype=np.int64)
+    counts = np.stack([
+        np.bincount(codes, minlength=len(labels)),
+        np.bincount(codes, weights=failed, minlength=len(labels)).astype(np.int64),
+    ])
+    used = np.flatnonzero(counts[0])
+    return [labels[i] for i in used.tolist()], counts[:, used]
+
+
+def rollup_day(columns: Dict[str, object], bucket_seconds: int) -> dict:
+    """
+    Aggregate one region's day of finished builds
+    Racks are kept as (labels, counts) until they are stored, since a site
+    has thousands of them; see RollupTable.put.
+    """
+    failed = np.asarray(columns["failed"], dtype=bool)
+    machine_types, counts = _counts(*columns["machine_type"], failed)
+    rollup = {
+        "builds": len(failed),
+        "failed": int(failed.sum()),
+        "machine_types": dict(zip(machine_types, counts.T.tolist())),
+        "racks": _counts(*columns["rack"], failed),
+        "bucket_seconds": bucket_seconds,
+        "durations": None,
+    }
+    if "duration" in columns:
+        # Sparse histogram of completed builds' durations
+        buckets = np.asarray(columns["duration"])[~failed] // bucket_seconds
+        values, counts = np.unique(buckets, return_counts=True)
+        rollup["durations"] = [values.tolist(), counts.tolist()]
+    return rollup
+
+
+def encode_racks(racks: Tuple[List[str], np.ndarray], codes: Dict[str, int]) -> np.ndarray:
+    """
+    Rack counts as a dense (2, racks) array indexed by rack code; racks
+    missing from `codes` are given the next free codes
+    """
+    labels, counts = racks
+    for label in labels:
+        if label not in codes:
+            codes[label] = len(codes)
+    index = np.array([codes[label] for label in labels], dtype=np.int64)
+    dense = np.zeros((2, int(index.max()) + 1 if len(index) else 0), dtype=np.int32)
+    dense[:, index] = counts
+    return dense
+
+
+def _add(total: Dict[str, List[int]], counts: Dict[str, List[int]]):
+    for name, (builds, failed) in counts.items():
+        entry = total.get(name)
+        if entry is None:
+            total[name] = [builds, failed]
+        else:
+            entry[0] += builds
+            entry[1] += failed
+
+
+def percentiles(histogram: Dict[int, int], bucket_seconds: int) -> Dict[str, int] | None:
+    """Percentiles of a duration histogram, as the upper bound of their bucket"""
+    if not histogram:
+        return None
+    buckets = np.array(sorted(histogram))
+    cumulative = np.cumsum([histogram[b] for b in buckets.tolist()])
+    ranks = np.ceil(np.array(PERCENTILES) / 100 * cumulative[-1])
+    found = buckets[np.searchsorted(cumulative, ranks)]
+    return {f"p{p}": int((b + 1) * bucket_seconds) for p, b in zip(PERCENTILES, found.tolist())}
+
+
+def combine(days: Days, rack_count: int) -> dict:
+    """Sum the rollups of a range of days (racks as dense arrays of `rack_count` codes)"""
+    machine_types: Dict[str, List[int]] = {}
+    racks = np.zeros((2, rack_count), dtype=np.int64)
+    histogram: Dict[int, int] = {}
+    bucket_seconds = settings.ROLLUP_DURATION_BUCKET_SECONDS
+    daily = []
+    timed = bool(days)
+    for date, closed, rollup in days:
+        daily.append({
+            "date": date,
+            "builds": rollup["builds"],
+            "complete": rollup["builds"] - rollup["failed"],
+            "failed": rollup["failed"],
+            "partial": not closed,
+        })
+        _add(machine_types, rollup["machine_types"])
+        racks[:, :rollup["racks"].shape[1]] += rollup["racks"]
+        if rollup["durations"] is None:
+            timed = False
+            continue
+        bucket_seconds = rollup["bucket_seconds"]
+        for bucket, count in zip(*rollup["durations"]):
+            histogram[bucket] = histogram.get(bucket, 0) + count
+
+    builds = sum(day["builds"] for day in daily)
+    failed = sum(day["failed"] for day in daily)
+    return {
+        "builds": builds,
+        "complete": builds - failed,
+        "failed": failed,
+        "days": daily,
+        "machine_types": machine_types,
+        "racks": racks,
+        "time_to_complete": percentiles(histogram, bucket_seconds) if timed else None,
+    }
+
+
+class RollupTable:
+    """
+    Daily rollups in an SQLite file shared between worker processes
+    Rack counts are stored as a dense int32 blob indexed by rack codes that
+    are assigned once per region (rollup_racks), so combining a range is an
+    array sum rather than a merge of thousands of keys per day. Connections
+    are opened lazily per process, like SharedTTLCache, so an instance
+    created before a gunicorn fork stays usable.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self._rack_codes: Dict[str, Dict[str, int]] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                "region TEXT NOT NULL, date TEXT NOT NULL, closed INTEGER NOT NULL, "
+                "rollup TEXT NOT NULL, racks BLOB NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (region, date))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollup_racks ("
+                "region TEXT NOT NULL, rack TEXT NOT NULL, code INTEGER NOT NULL, PRIMARY KEY (region, rack))"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+            self._rack_codes = {}
+        return self._conn
+
+    def _load_rack_codes(self, conn: sqlite3.Connection, region: str) -> Dict[str, int]:
+        rows = conn.execute("SELECT rack, code FROM rollup_racks WHERE region = ?", (region,)).fetchall()
+        codes = self._rack_codes[region] = dict(rows)
+        return codes
+
+    def rack_labels(self, region: str) -> List[str]:
+        """Rack of each code of a region"""
+        with self._lock:
+            codes = self._load_rack_codes(self._connection(), region)
+        labels = [""] * len(codes)
+        for rack, code in codes.items():
+            labels[code] = rack
+        return labels
+
+    def put(self, region: str, date: str, closed: bool, rollup: dict):
+        """Store a day's rollup; a closed day is never overwritten"""
+        with self._lock:
+            conn = self._connection()
+            codes = self._rack_codes.get(region)
+            if codes is None or any(rack not in codes for rack in rollup["racks"][0]):
+                # New racks get codes under a write lock, so workers agree on them
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    codes = self._load_rack_codes(conn, region)
+                    known = len(codes)
+                    dense = encode_racks(rollup["racks"], codes)
+                    conn.executemany(
+                        "INSERT INTO rollup_racks (region, rack, code) VALUES (?, ?, ?)",
+                        [(region, rack, code) for rack, code in codes.items() if code >= known]
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    self._rack_codes.pop(region, None)
+                    raise
+            else:
+                dense = encode_racks(rollup["racks"], codes)
+            summary = dict(rollup, racks=None)
+            conn.execute(
+                "INSERT INTO rollups (region, date, closed, rollup, racks, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (region, date) DO UPDATE SET closed = excluded.closed, rollup = excluded.rollup, "
+                "racks = excluded.racks, updated_at = excluded.updated_at WHERE rollups.closed = 0",
+                (region, date, int(closed), json.dumps(summary, separators=(",", ":")),
+                 dense.tobytes(), time.time())
+            )
+
+    def closed_dates(self, region: str, start: str, end: str) -> set:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT date FROM rollups WHERE region = ? AND date BETWEEN ? AND ? AND closed = 1",
+                (region, start, end)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def version(self, start: str, end: str) -> Tuple[int, float]:
+        """Changes whenever a rollup in the range is written"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(MAX(updated_at), 0) FROM rollups WHERE date BETWEEN ? AND ?",
+                (start, end)
+            ).fetchone()
+        return row[0], row[1]
+
+    def days(self, region: str, start: str, end: str) -> Days:
+        """Stored rollups of a region between start and end, in date order, racks as dense arrays"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT date, closed, rollup, racks FROM rollups "
+                "WHERE region = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (region, start, end)
+            ).fetchall()
+        days = []
+        for date, closed, summary, racks in rows:
+            rollup = json.loads(summary)
+            rollup["racks"] = np.frombuffer(racks, dtype=np.int32).reshape(2, -1)
+            days.append((date, bool(closed), rollup))
+        return days
+
+
+def materialize(table: RollupTable, regions: List[str], source: BuildSource, today: date_type) -> int:
+    """
+    Roll up every closed day in the backfill window that isn't final yet,
+    then refresh today's partial rollup. Returns the closed days written.
+    """
+    bucket_seconds = settings.ROLLUP_DURATION_BUCKET_SECONDS
+    first = today - timedelta(days=settings.ROLLUP_BACKFILL_DAYS)
+    yesterday = (today - timedelta(days=1)).isoformat()
+    written = 0
+    for region in regions:
+        closed = table.closed_dates(region, first.isoformat(), yesterday)
+        day = first
+        while day < today:
+            date = day.isoformat()
+            if date not in closed:
+                table.put(region, date, True, rollup_day(source(date, region), bucket_seconds))
+                written += 1
+            day += timedelta(days=1)
+        date = today.isoformat()
+        table.put(region, date, False, rollup_day(source(date, region), bucket_seconds))
+    return written
+
+
+@lru_cache(maxsize=4)
+def get_rollup_table(seed: int, size: int) -> RollupTable:
+    """
+    Rollup table of a simulated fleet, shared across workers or per process
+    without SHARED_STATE_DIR. Closed days are never rewritten, so each seed
+    and size gets a table of its own.
+    """
+    if settings.SHARED_STATE_DIR:
+        try:
+            os.makedirs(settings.SHARED_STATE_DIR, exist_ok=True)
+            return RollupTable(os.path.join(settings.SHARED_STATE_DIR, f"rollups-{seed}-{size}.sqlite3"))
+        except OSError as e:
+            logger.warning(f"Shared rollup table unavailable, using per-process table: {str(e)}")
+    return RollupTable(":memory:")
+
+
+async def run_rollups(interval: float):
+    """Lifespan task materializing closed days and refreshing today's rollup"""
+    fleet = get_fleet_simulator()
+    if fleet is None:
+        return
+    table = get_rollup_table(fleet.seed, fleet.size)
+    while True:
+        try:
+            today = datetime.now(timezone.utc).date()
+            written = await asyncio.to_thread(materialize, table, list(fleet.regions), fleet.finished_builds, today)
+            if written:
+                logger.info(f"Materialized {written} daily build rollups")
+        except Exception as e:
+            logger.error(f"Build rollup refresh failed: {str(e)}")
+        await asyncio.sleep(interval)
@@ -1,6 +1,6 @@
 """
 Router package initialization
 """
-from . import build, preconfig, assign, server
+from . import build, preconfig, assign, server, heartbeat, racks
 
-__all__ = ["build", "preconfig", "assign", "server"]
\ No newline at end of file
+__all__ = ["build", "preconfig", "assign", "server", "heartbeat", "racks"]
\ No newline at end of file
@@ -1,11 +1,15 @@
 """
 Server assignment endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 import logging
 
 from app.models import User, AssignRequest, AssignResponse
-from app.auth import get_current_user
+from app.session import get_current_user
+from app.idempotency import idempotency_store
+from app.audit import audit
+from app.fleet import get_fleet_simulator
+from app.shards import get_region_shards
 
 logger = logging.getLogger(__name__)
 
@@ -20,18 +24,31 @@ router = APIRouter()
 )
 async def assign_server(
     request: AssignRequest,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_user)
 ) -> AssignResponse:
     """
     Assign a server to a customer
-    Updates server status and creates assignment record
+    Retries carrying the same Idempotency-Key get the first result back
     """
+    return await idempotency_store.run(
+        "assign", idempotency_key, current_user, request,
+        lambda: perform_assignment(request, current_user)
+    )
+
+
+async def perform_assignment(request: AssignRequest, current_user: User) -> AssignResponse:
+    """
+    Assign a server to a customer
+    Updates server status and creates assignment record; every outcome
+    is recorded in the audit log
+    """
+    audit_fields = {
+        "hostname": request.hostname,
+        "dbid": request.dbid,
+        "serial_number": request.serial_number,
+    }
     try:
-        logger.info(
-            f"Server assignment requested by {current_user.email}: "
-            f"hostname={request.hostname}, dbid={request.dbid}, sn={request.serial_number}"
-        )
-        
         # Validate request data
         if not all([request.serial_number, request.hostname, request.dbid]):
             raise HTTPException(
@@ -39,6 +56,14 @@ async def assign_server(
                 detail="Serial number, hostname, and DBID are required"
             )
         
+        # Verify server exists when running against the simulated fleet
+        # (heartbeat-fed shards don't yet hold hosts that haven't reported)
+        if get_fleet_simulator() and get_region_shards().find(request.hostname) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Server {request.hostname} not found"
+            )
+        
         # Simulate assignment operation
         # In production, this would:
         # 1. Verify server exists and is available
@@ -49,20 +74,22 @@ async def assign_server(
         # 6. Potentially trigger provisioning workflows
         # 7. Send notifications
         
-        logger.info(
-            f"Server assigned successfully: hostname={request.hostname}, "
-            f"dbid={request.dbid} by {current_user.email}"
-        )
+        await audit("assign", current_user.email, "success", **audit_fields)
         
         return AssignResponse(
             status="success",
             message=f"Server {request.hostname} assigned successfully"
         )
         
-    except HTTPException:
+    except HTTPException as e:
+        await audit("assign", current_user.email, "rejected", detail=str(e.detail), **audit_fields)
         raise
     except Exception as e:
-        logger.error(f"Error assigning server: {str(e)}")
+        logger.error(
+            f"Error assigning server: {str(e)}",
+            extra={"action": "assign", "user": current_user.email, "hostname": request.hostname}
+        )
+        await audit("assign", current_user.email, "error", **audit_fields)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to assign server"
@@ -0,0 +1,76 @@
+"""
+Audit log endpoints
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+
+from app.config import settings
+from app.models import User, AuditRecord, AuditLogResponse
+from app.session import require_admin
+from app.audit import as_datetime, get_audit_log, timestamp_ms
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def utc(moment: datetime) -> datetime:
+    """Timestamps without a zone are taken as UTC"""
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+@router.get(
+    "/audit",
+    response_model=AuditLogResponse,
+    summary="Query the audit log",
+    description=(
+        "Get audited assignments and preconfig pushes between `from` and `to` (ISO 8601, "
+        "default the last 24 hours), optionally by user and hostname. Admins only."
+    )
+)
+async def get_audit_records(
+    from_: datetime | None = Query(None, alias="from", description="Start (ISO 8601, default `to` - 24h)"),
+    to: datetime | None = Query(None, description="End (ISO 8601, default now)"),
+    user: str | None = Query(None, description="Email of the acting user"),
+    hostname: str | None = Query(None, description="Affected server"),
+    limit: int = Query(1000, ge=1, le=settings.AUDIT_MAX_RESULTS),
+    current_user: User = Depends(require_admin)
+) -> AuditLogResponse:
+    """
+    Query the audit log
+    Reads only the segments overlapping the range, from the indexed offset
+    nearest its start
+    """
+    end = utc(to) if to else datetime.now(timezone.utc)
+    start = utc(from_) if from_ else end - timedelta(hours=24)
+    if start > end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from must not be after to"
+        )
+
+    audit_log = get_audit_log()
+    if audit_log is None:
+        return AuditLogResponse(records=[], truncated=False)
+
+    logger.info(
+        f"Audit log for {start.isoformat()} to {end.isoformat()} requested by {current_user.email}",
+        extra={"user": current_user.email}
+    )
+
+    try:
+        entries, truncated = await asyncio.to_thread(
+            audit_log.query, timestamp_ms(start), timestamp_ms(end), user, hostname, limit
+        )
+    except Exception as e:
+        logger.error(f"Error reading audit log: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to read audit log"
+        )
+    return AuditLogResponse(
+        records=[AuditRecord(timestamp=as_datetime(entry.pop("ts")), **entry) for entry in entries],
+        truncated=truncated
+    )
@@ -2,13 +2,20 @@
 Build status endpoints
 Returns mock data simulating database responses
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Dict, List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from pydantic import RootModel
+from typing import Callable, Dict, Hashable, List, Tuple, Type
+import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
+from app.config import settings
 from app.models import User, BuildStatus, BuildHistory, Server
-from app.auth import get_current_user
+from app.session import get_current_user
+from app.compression import CachedBody, encoded_response, response_cache
+from app.fleet import get_fleet_simulator
+from app.archive import get_history_archive
+from app.shards import fan_out, get_region_shards, parse_regions
 
 logger = logging.getLogger(__name__)
 
@@ -155,13 +162,93 @@ def generate_mock_build_history(date: str) -> Dict[str, List[Server]]:
     }
 
 
+def history_source(date: str) -> Tuple[List[str], Callable[[str], List[Server]], Hashable]:
+    """
+    (regions, per-region query, cache version) of a day's build history
+    Archived days are read from their memory-mapped partitions, the rest
+    from the primary source
+    """
+    fleet = get_fleet_simulator()
+    if not fleet:
+        mock = generate_mock_build_history(date)
+        return list(mock), lambda region: mock.get(region, []), "mock"
+
+    archive = get_history_archive()
+
+    def query(region: str) -> List[Server]:
+        partition = archive.partition(region, date) if archive else None
+        if partition is not None:
+            return partition.servers()
+        return fleet.build_history(date, region)
+
+    # History is a function of the fleet's seed and size
+    return list(fleet.regions), query, ("fleet", fleet.seed, fleet.size)
+
+
+def parse_date(value: str, name: str = "date") -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid {name} format. Use YYYY-MM-DD"
+        )
+
+
+async def query_regions(
+    regions: str | None,
+    available: List[str],
+    query: Callable[[str], List[Server]],
+    response: Response
+) -> Dict[str, List[Server]]:
+    """
+    Fan a per-region query out to the requested (default: all) regions
+    Regions that time out or fail come back empty and are listed in the
+    X-Degraded-Regions response header
+    """
+    requested = parse_regions(regions) or available
+    data, degraded = await fan_out([r for r in requested if r in available], query)
+    if degraded:
+        response.headers["X-Degraded-Regions"] = ",".join(degraded)
+    return {region: data.get(region, []) for region in requested}
+
+
+async def cached_regions(
+    request: Request,
+    response: Response,
+    key: Hashable,
+    version: Hashable,
+    regions: str | None,
+    available: List[str],
+    query: Callable[[str], List[Server]],
+    model: Type[RootModel]
+) -> RootModel | Response:
+    """
+    Regions response served from the response cache while `version` holds
+    Complete responses are serialized once per version and cached with
+    their compressed variants; degraded ones are returned uncached.
+    """
+    key = (key, tuple(parse_regions(regions) or available))
+    cached = response_cache.get(key, version)
+    if cached is None:
+        result = model(await query_regions(regions, available, query, response))
+        if "X-Degraded-Regions" in response.headers:
+            return result
+        cached = CachedBody(await asyncio.to_thread(lambda: result.model_dump_json().encode()))
+        response_cache.set(key, version, cached)
+    return await encoded_response(request, cached)
+
+
 @router.get(
     "/build-status",
     response_model=BuildStatus,
     summary="Get current build status",
-    description="Get current build status across all regions"
+    description="Get current build status across all regions, or those listed in `regions`"
 )
 async def get_build_status(
+    request: Request,
+    response: Response,
+    regions: str | None = Query(None, description="Comma-separated regions (default: all)"),
     current_user: User = Depends(get_current_user)
 ) -> BuildStatus:
     """
@@ -169,12 +256,24 @@ async def get_build_status(
     Returns active server builds with progress
     """
     try:
-        logger.info(f"Build status requested by {current_user.email}")
+        logger.info(f"Build status requested by {current_user.email}", extra={"user": current_user.email})
         
-        # Simulate database query
-        data = generate_mock_build_status()
+        # Query each region's shard concurrently; the response is cached
+        # until any shard is written to or replaced
+        shards = get_region_shards()
+        if shards:
+            available = shards.regions()
+            version = tuple((shards.get(region).generation, shards.get(region).version) for region in available)
+            query = lambda region: shards.get(region).build_status().get(region, [])
+        else:
+            mock = generate_mock_build_status()
+            available = list(mock)
+            version = "mock"
+            query = mock.get
         
-        return BuildStatus(**data)
+        return await cached_regions(
+            request, response, "build-status", version, regions, available, query, BuildStatus
+        )
         
     except Exception as e:
         logger.error(f"Error fetching build status: {str(e)}")
@@ -188,10 +287,13 @@ async def get_build_status(
     "/build-history/{date}",
     response_model=BuildHistory,
     summary="Get build history",
-    description="Get build history for a specific date (YYYY-MM-DD format)"
+    description="Get build history for a specific date (YYYY-MM-DD format), optionally filtered by `regions`"
 )
 async def get_build_history(
     date: str,
+    request: Request,
+    response: Response,
+    regions: str | None = Query(None, description="Comma-separated regions (default: all)"),
     current_user: User = Depends(get_current_user)
 ) -> BuildHistory:
     """
@@ -200,20 +302,85 @@ async def get_build_history(
     """
     try:
         # Validate date format
-        try:
-            datetime.strptime(date, "%Y-%m-%d")
-        except ValueError:
+        parse_date(date)
+        
+        logger.info(
+            f"Build history for {date} requested by {current_user.email}",
+            extra={"user": current_user.email, "date": date}
+        )
+        
+        # Query each region concurrently
+        available, query, version = history_source(date)
+        
+        # Past days no longer change, so they are served from the response cache
+        if date < datetime.now(timezone.utc).strftime("%Y-%m-%d"):
+            return await cached_regions(
+                request, response, ("build-history", date), version, regions, available, query, BuildHistory
+            )
+        data = await query_regions(regions, available, query, response)
+        
+        return BuildHistory(data)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching build history: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch build history"
+        )
+
+
+@router.get(
+    "/build-history",
+    response_model=BuildHistory,
+    summary="Get build history for a date range",
+    description="Get build history from `start` to `end` inclusive (YYYY-MM-DD format), optionally filtered by `regions`"
+)
+async def get_build_history_range(
+    request: Request,
+    response: Response,
+    start: str = Query(..., description="First day (YYYY-MM-DD)"),
+    end: str = Query(..., description="Last day (YYYY-MM-DD)"),
+    regions: str | None = Query(None, description="Comma-separated regions (default: all)"),
+    current_user: User = Depends(get_current_user)
+) -> BuildHistory:
+    """
+    Get build history for a range of days
+    Returns completed builds per region, in date order
+    """
+    try:
+        first, last = parse_date(start, "start"), parse_date(end, "end")
+        if first > last:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid date format. Use YYYY-MM-DD"
+                detail="start must not be after end"
             )
+        days = (last - first).days + 1
+        if days > settings.ARCHIVE_MAX_RANGE_DAYS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Range exceeds {settings.ARCHIVE_MAX_RANGE_DAYS} days"
+            )
+        
+        logger.info(
+            f"Build history for {start} to {end} requested by {current_user.email}",
+            extra={"user": current_user.email, "date": start}
+        )
         
-        logger.info(f"Build history for {date} requested by {current_user.email}")
+        # Each region reads its days in order; archived days only touch
+        # their own partitions
+        sources = [history_source((first + timedelta(days=i)).strftime("%Y-%m-%d")) for i in range(days)]
+        available = sources[0][0]
+        query = lambda region: [server for _, day_query, _ in sources for server in day_query(region)]
         
-        # Simulate database query
-        data = generate_mock_build_history(date)
+        if end < datetime.now(timezone.utc).strftime("%Y-%m-%d"):
+            return await cached_regions(
+                request, response, ("build-history", start, end), sources[0][2], regions, available, query, BuildHistory
+            )
+        data = await query_regions(regions, available, query, response)
         
-        return BuildHistory(**data)
+        return BuildHistory(data)
         
     except HTTPException:
         raise
@@ -222,4 +389,4 @@ async def get_build_history(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch build history"
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,54 @@
+"""
+Heartbeat ingestion endpoints
+Called by installers rather than dashboard users, so they authenticate with
+a shared installer token instead of a SAML session
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Header
+from typing import Union
+import hmac
+import logging
+
+from app.config import settings
+from app.heartbeat import heartbeat_coalescer
+from app.models import HeartbeatReport, HeartbeatBatch, HeartbeatResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def verify_installer_token(x_installer_token: str | None = Header(default=None)):
+    """
+    Dependency checking the X-Installer-Token header against HEARTBEAT_TOKEN
+    """
+    if not settings.HEARTBEAT_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Heartbeat ingestion is not configured"
+        )
+    if not x_installer_token or not hmac.compare_digest(x_installer_token, settings.HEARTBEAT_TOKEN):
+        logger.warning("Heartbeat rejected: invalid installer token")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid installer token"
+        )
+
+
+@router.post(
+    "/heartbeat",
+    response_model=HeartbeatResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Report build progress",
+    description="Accept a single heartbeat or a batch of heartbeats from installers"
+)
+async def ingest_heartbeat(
+    body: Union[HeartbeatBatch, HeartbeatReport],
+    _: None = Depends(verify_installer_token)
+) -> HeartbeatResponse:
+    """
+    Queue heartbeats for the next bulk write
+    Only the latest report per host within a flush window is written
+    """
+    reports = body.heartbeats if isinstance(body, HeartbeatBatch) else [body]
+    accepted = heartbeat_coalescer.submit(reports)
+    return HeartbeatResponse(accepted=accepted)
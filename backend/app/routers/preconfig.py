@@ -1,7 +1,8 @@
 """
 Preconfig management endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from pydantic import TypeAdapter
 from typing import List
 import logging
 from datetime import datetime
@@ -12,12 +13,18 @@ from app.models import (
     PushPreconfigRequest, 
     PushPreconfigResponse
 )
-from app.auth import get_current_user
+from app.session import get_current_user
+from app.compression import cached_response
+from app.idempotency import idempotency_store
+from app.audit import audit
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Bumped whenever the preconfig catalog changes (fixed for the mock catalog)
+PRECONFIG_CATALOG_VERSION = 1
+
 
 def generate_mock_preconfigs() -> List[PreconfigData]:
     """
@@ -87,6 +94,7 @@ def generate_mock_preconfigs() -> List[PreconfigData]:
     description="Get all preconfigurations across all depots"
 )
 async def get_preconfigs(
+    request: Request,
     current_user: User = Depends(get_current_user)
 ) -> List[PreconfigData]:
     """
@@ -94,12 +102,16 @@ async def get_preconfigs(
     Returns list of preconfig records
     """
     try:
-        logger.info(f"Preconfigs requested by {current_user.email}")
-        
-        # Simulate database query
-        preconfigs = generate_mock_preconfigs()
+        logger.info(f"Preconfigs requested by {current_user.email}", extra={"user": current_user.email})
         
-        return preconfigs
+        # Simulate database query; the catalog is serialized and compressed
+        # once per version
+        return await cached_response(
+            request,
+            "preconfigs",
+            PRECONFIG_CATALOG_VERSION,
+            lambda: TypeAdapter(List[PreconfigData]).dump_json(generate_mock_preconfigs())
+        )
         
     except Exception as e:
         logger.error(f"Error fetching preconfigs: {str(e)}")
@@ -117,17 +129,26 @@ async def get_preconfigs(
 )
 async def push_preconfig(
     request: PushPreconfigRequest,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_user)
 ) -> PushPreconfigResponse:
     """
     Push preconfig to a specific depot
-    Simulates pushing configuration to build system
+    Retries carrying the same Idempotency-Key get the first result back
+    """
+    return await idempotency_store.run(
+        "push_preconfig", idempotency_key, current_user, request,
+        lambda: perform_push(request, current_user)
+    )
+
+
+async def perform_push(request: PushPreconfigRequest, current_user: User) -> PushPreconfigResponse:
+    """
+    Push preconfig to a specific depot
+    Simulates pushing configuration to build system; every outcome is
+    recorded in the audit log
     """
     try:
-        logger.info(
-            f"Push preconfig to depot {request.depot} requested by {current_user.email}"
-        )
-        
         # Map depot to region for logging
         depot_map = {1: "CBG", 2: "DUB", 4: "DAL"}
         region = depot_map.get(request.depot, "Unknown")
@@ -139,7 +160,7 @@ async def push_preconfig(
         # 3. Update database status
         # 4. Potentially trigger webhooks/notifications
         
-        logger.info(f"Preconfig pushed to depot {request.depot} ({region}) successfully")
+        await audit("push_preconfig", current_user.email, "success", depot=request.depot, region=region)
         
         return PushPreconfigResponse(
             status="success",
@@ -147,7 +168,11 @@ async def push_preconfig(
         )
         
     except Exception as e:
-        logger.error(f"Error pushing preconfig: {str(e)}")
+        logger.error(
+            f"Error pushing preconfig: {str(e)}",
+            extra={"action": "push_preconfig", "user": current_user.email, "depot": request.depot}
+        )
+        await audit("push_preconfig", current_user.email, "error", depot=request.depot)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to push preconfig"
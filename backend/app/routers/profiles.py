@@ -0,0 +1,71 @@
+"""
+Profile download endpoints
+Profiles of single requests and periodic stack samples, for admins and only
+where ENVIRONMENT allows profiling
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from datetime import datetime, timezone
+import asyncio
+import logging
+import os
+
+from app.models import User, ProfileInfo, ProfileList
+from app.session import require_admin
+from app.profiling import list_profiles, profile_directory, profiling_enabled
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def profiles_directory() -> str:
+    """Profile directory, 404 where profiling is disabled"""
+    directory = profile_directory()
+    if not profiling_enabled() or directory is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return directory
+
+
+@router.get(
+    "/profiles",
+    response_model=ProfileList,
+    summary="List profiles",
+    description="List stored request profiles and sampled stacks, newest first. Admins only."
+)
+async def get_profiles(current_user: User = Depends(require_admin)) -> ProfileList:
+    """List stored profiles"""
+    directory = profiles_directory()
+    profiles = await asyncio.to_thread(list_profiles, directory)
+    return ProfileList(profiles=[
+        ProfileInfo(
+            name=profile["name"],
+            bytes=profile["bytes"],
+            modified=datetime.fromtimestamp(profile["modified"], tz=timezone.utc)
+        )
+        for profile in profiles
+    ])
+
+
+@router.get(
+    "/profiles/{name}",
+    response_class=FileResponse,
+    summary="Download a profile",
+    description=(
+        "Download a profile: `.collapsed` files hold collapsed stacks for flamegraph tools, "
+        "`.prof` files cProfile stats for pstats or snakeviz. Admins only."
+    )
+)
+async def get_profile(name: str, current_user: User = Depends(require_admin)) -> FileResponse:
+    """Download a stored profile"""
+    directory = profiles_directory()
+    # Only names listed in the directory are served, so paths can't escape it
+    names = {profile["name"] for profile in await asyncio.to_thread(list_profiles, directory)}
+    if name not in names:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {name} not found"
+        )
+    logger.info(f"Profile {name} downloaded by {current_user.email}", extra={"user": current_user.email})
+    media_type = "text/plain" if name.endswith(".collapsed") else "application/octet-stream"
+    return FileResponse(os.path.join(directory, name), media_type=media_type, filename=name)
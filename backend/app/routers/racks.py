@@ -0,0 +1,74 @@
+"""
+Rack occupancy endpoints
+Precomputed rack/slot aggregates for RackVisualization, so large sites
+render from a small payload instead of the full server list
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from functools import lru_cache
+import logging
+
+from app.models import User, RackOccupancy
+from app.session import get_current_user
+from app.racks import get_rack_aggregator
+from app.routers.build import generate_mock_build_status
+from app.shards import get_region_shards
+from app.store import BuildStore
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@lru_cache()
+def generate_mock_rack_store() -> BuildStore:
+    """
+    Build store holding the mock build status
+    Used while the shared store is empty, matching /api/build-status
+    """
+    store = BuildStore()
+    for region, servers in generate_mock_build_status().items():
+        rows = store.upsert(servers)
+        store.update_rows(rows, region=[region] * len(rows))
+    return store
+
+
+@router.get(
+    "/racks",
+    response_model=RackOccupancy,
+    summary="Get rack occupancy",
+    description="Get per-rack and per-slot server counts, status counts and progress for a region"
+)
+async def get_racks(
+    region: str = Query(..., description="Region code (e.g., cbg)"),
+    current_user: User = Depends(get_current_user)
+) -> Response:
+    """
+    Get rack occupancy for a region
+    Served from aggregates maintained as builds change
+    """
+    try:
+        logger.info(
+            f"Rack occupancy for {region} requested by {current_user.email}",
+            extra={"user": current_user.email, "region": region}
+        )
+        
+        shards = get_region_shards()
+        store = shards.get(region) if shards else generate_mock_rack_store()
+        body = get_rack_aggregator(store).occupancy(region) if store is not None else None
+        if body is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Region {region} not found"
+            )
+        
+        # Already serialized as RackOccupancy by the aggregator
+        return Response(content=body, media_type="application/json")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching rack occupancy: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch rack occupancy"
+        )
@@ -0,0 +1,162 @@
+"""
+Build throughput rollup endpoints
+Served from the materialized daily rollups, so management views never
+rescan build history
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+import asyncio
+import logging
+import numpy as np
+
+from app.config import settings
+from app.models import User, BuildRollup, BuildRollups, FailureRate
+from app.session import get_current_user
+from app.compression import cached_response
+from app.fleet import get_fleet_simulator
+from app.racks import parse_rack_id, rack_sort_key
+from app.rollups import Days, RollupTable, combine, encode_racks, get_rollup_table, rollup_day
+from app.routers.build import generate_mock_build_history, parse_date
+from app.shards import parse_regions
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def mock_finished_builds(date: str, region: str) -> Dict[str, object]:
+    """Outcome columns of the mock build history (no build durations)"""
+    servers = generate_mock_build_history(date).get(region, [])
+    machine_types = sorted({server.machine_type for server in servers})
+    racks = sorted({parse_rack_id(server.rackID)[0] for server in servers}, key=rack_sort_key)
+    return {
+        "machine_type": (
+            np.array([machine_types.index(s.machine_type) for s in servers], dtype=np.int64), machine_types
+        ),
+        "rack": (np.array([racks.index(parse_rack_id(s.rackID)[0]) for s in servers], dtype=np.int64), racks),
+        "failed": np.array([s.status == "failed" for s in servers], dtype=bool),
+    }
+
+
+def failure_rates(counts: Dict[str, List[int]]) -> List[FailureRate]:
+    return [
+        FailureRate(name=name, builds=builds, failed=failed, failure_rate=round(failed / builds, 4))
+        for name, (builds, failed) in counts.items()
+    ]
+
+
+def region_rollup(days: Days, rack_labels: List[str], racks: int) -> BuildRollup:
+    """Response model of a region's combined rollups"""
+    total = combine(days, len(rack_labels))
+    builds, failed = total["racks"]
+    # Racks with the most failures, then the highest failure rate
+    rate = failed / np.maximum(builds, 1)
+    order = np.lexsort((-rate, -failed))[:racks]
+    order = order[failed[order] > 0]
+    worst_racks = [
+        FailureRate(name=rack_labels[i], builds=b, failed=f, failure_rate=round(r, 4))
+        for i, b, f, r in zip(order.tolist(), builds[order].tolist(), failed[order].tolist(), rate[order].tolist())
+    ]
+    return BuildRollup(
+        builds=total["builds"],
+        complete=total["complete"],
+        failed=total["failed"],
+        failure_rate=round(total["failed"] / total["builds"], 4) if total["builds"] else 0.0,
+        days=total["days"],
+        machine_types=sorted(failure_rates(total["machine_types"]), key=lambda m: -m.builds),
+        racks=worst_racks,
+        time_to_complete=total["time_to_complete"],
+    )
+
+
+def stored_region_rollup(table: RollupTable, region: str, start: str, end: str, racks: int) -> BuildRollup:
+    """Rollup of a region from the materialized days"""
+    days = table.days(region, start, end)
+    # Labels are read after the rows, so they cover every rack code in them
+    return region_rollup(days, table.rack_labels(region), racks)
+
+
+def mock_region_rollup(region: str, dates: List[str], today: str, racks: int) -> BuildRollup:
+    """Rollup of the mock build history, computed on request since it is tiny"""
+    codes: Dict[str, int] = {}
+    days = []
+    for date in dates:
+        rollup = rollup_day(mock_finished_builds(date, region), settings.ROLLUP_DURATION_BUCKET_SECONDS)
+        rollup["racks"] = encode_racks(rollup["racks"], codes)
+        days.append((date, date < today, rollup))
+    labels = sorted(codes, key=codes.get)
+    return region_rollup(days, labels, racks)
+
+
+@router.get(
+    "/build-rollups",
+    response_model=BuildRollups,
+    summary="Get build throughput rollups",
+    description=(
+        "Get builds per day, failure rates by machine type and rack, and time-to-complete "
+        "percentiles from `start` to `end` inclusive (YYYY-MM-DD, default the last 7 days)"
+    )
+)
+async def get_build_rollups(
+    request: Request,
+    start: str | None = Query(None, description="First day (YYYY-MM-DD)"),
+    end: str | None = Query(None, description="Last day (YYYY-MM-DD, default today)"),
+    regions: str | None = Query(None, description="Comma-separated regions (default: all)"),
+    racks: int = Query(20, ge=0, le=1000, description="Racks with the most failures to list"),
+    current_user: User = Depends(get_current_user)
+) -> Response:
+    """
+    Get build throughput rollups per region
+    Combined from the materialized daily rollups
+    """
+    try:
+        today = datetime.now(timezone.utc).date()
+        last = parse_date(end, "end").date() if end else today
+        first = parse_date(start, "start").date() if start else last - timedelta(days=6)
+        if first > last:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="start must not be after end"
+            )
+        if (last - first).days + 1 > settings.ROLLUP_MAX_RANGE_DAYS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Range exceeds {settings.ROLLUP_MAX_RANGE_DAYS} days"
+            )
+        start, end = first.isoformat(), last.isoformat()
+
+        logger.info(
+            f"Build rollups for {start} to {end} requested by {current_user.email}",
+            extra={"user": current_user.email, "date": start}
+        )
+
+        fleet = get_fleet_simulator()
+        if fleet:
+            table = get_rollup_table(fleet.seed, fleet.size)
+            available = list(fleet.regions)
+            version = (fleet.seed, fleet.size, await asyncio.to_thread(table.version, start, end))
+            rollup = lambda region: stored_region_rollup(table, region, start, end, racks)
+        else:
+            dates = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+            available = list(generate_mock_build_history(start))
+            version = ("mock", today)
+            rollup = lambda region: mock_region_rollup(region, dates, today.isoformat(), racks)
+
+        # Combined rollups are serialized once per change of the stored rows
+        requested = [region for region in parse_regions(regions) or available if region in available]
+        return await cached_response(
+            request,
+            ("build-rollups", start, end, tuple(requested), racks),
+            version,
+            lambda: BuildRollups({region: rollup(region) for region in requested}).model_dump_json().encode()
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching build rollups: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch build rollups"
+        )
@@ -1,12 +1,22 @@
 """
-Server details endpoints
+Server details, build timeline and asset lookup endpoints
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from typing import List, Tuple
 import logging
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, timedelta, timezone
 
-from app.models import User, ServerDetails
-from app.auth import get_current_user
+from app.config import settings
+from app.models import (
+    User, ServerDetails, ServerTimeline, TimelineSample, LookupField, AssetMatch, AssetLookupResponse
+)
+from app.session import get_current_user
+from app.lookup import LOOKUP_FIELDS, get_asset_index, normalize
+from app.routers.racks import generate_mock_rack_store
+from app.shards import get_region_shards
+from app.store import BuildStore, to_epoch, from_epoch
+from app.timeline import get_build_timeline
 
 logger = logging.getLogger(__name__)
 
@@ -59,10 +69,24 @@ async def get_server_details(
                 detail="Hostname is required"
             )
         
-        logger.info(f"Server details for {hostname} requested by {current_user.email}")
+        logger.info(
+            f"Server details for {hostname} requested by {current_user.email}",
+            extra={"user": current_user.email, "hostname": hostname}
+        )
         
         # Simulate database query
-        server_details = generate_mock_server_details(hostname)
+        shards = get_region_shards()
+        if shards:
+            found = shards.find(hostname)
+            if found is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Server {hostname} not found"
+                )
+            _, store, row = found
+            server_details = store.details(row)
+        else:
+            server_details = generate_mock_server_details(hostname)
         
         return server_details
         
@@ -73,4 +97,159 @@ async def get_server_details(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch server details"
-        )
\ No newline at end of file
+        )
+
+def naive_utc(moment: datetime) -> datetime:
+    """Timestamps with a zone are converted to UTC; those without are taken as UTC"""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def generate_mock_timeline(details: ServerDetails, start: datetime, end: datetime) -> List[TimelineSample]:
+    """
+    Generate a mock build timeline
+    Progress rising evenly from the install start to the current value
+    """
+    now = datetime.utcnow()
+    elapsed = (now - details.install_start_time).total_seconds()
+    samples = []
+    for step in range(details.percent_built + 1):
+        timestamp = details.install_start_time + timedelta(seconds=elapsed * step / max(details.percent_built, 1))
+        if start <= timestamp <= end:
+            samples.append(TimelineSample(timestamp=timestamp, percent_built=step, status=details.status))
+    return samples
+
+
+@router.get(
+    "/server-details/{hostname}/timeline",
+    response_model=ServerTimeline,
+    summary="Get server build timeline",
+    description="Get the build progress and status changes of a server over a time range"
+)
+async def get_server_timeline(
+    hostname: str,
+    start: datetime | None = Query(None, description="Range start (UTC), default 24 hours before end"),
+    end: datetime | None = Query(None, description="Range end (UTC), default now"),
+    current_user: User = Depends(get_current_user)
+) -> ServerTimeline:
+    """
+    Get the build progress timeline of a server
+    Only the day segments overlapping the range are read
+    """
+    try:
+        end = naive_utc(end) if end else datetime.utcnow()
+        start = naive_utc(start) if start else end - timedelta(days=1)
+        if start > end:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="start must not be after end"
+            )
+        
+        logger.info(
+            f"Build timeline for {hostname} requested by {current_user.email}",
+            extra={"user": current_user.email, "hostname": hostname}
+        )
+        
+        shards = get_region_shards()
+        if shards:
+            found = shards.find(hostname)
+            if found is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Server {hostname} not found"
+                )
+            region, store, row = found
+            samples = [
+                TimelineSample.model_construct(timestamp=from_epoch(timestamp), percent_built=percent, status=state)
+                for timestamp, percent, state in get_build_timeline(store).samples(row, to_epoch(start), to_epoch(end))
+            ]
+        else:
+            region = "cbg"
+            samples = generate_mock_timeline(generate_mock_server_details(hostname), start, end)
+        
+        return ServerTimeline(hostname=hostname, region=region, start=start, end=end, samples=samples)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching build timeline: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch build timeline"
+        )
+
+
+def lookup_store(
+    store: BuildStore,
+    region: str | None,
+    q: str,
+    prefix: bool,
+    fields: List[str],
+    limit: int
+) -> List[Tuple[Tuple[int, str], AssetMatch]]:
+    """Matches from one store, with the key they are ordered by"""
+    found = get_asset_index(store).lookup(q, prefix, fields, limit)
+    if not found:
+        return []
+    servers = store.servers(np.array([row for _, row in found], dtype=np.int64))
+    results = []
+    for (field, row), server in zip(found, servers):
+        value = store.strings[field].get(row)
+        match = AssetMatch(
+            field=field,
+            value=value,
+            region=region or store.label("region", row),
+            server=server
+        )
+        results.append(((LOOKUP_FIELDS.index(field), normalize(field, value)), match))
+    return results
+
+
+@router.get(
+    "/lookup",
+    response_model=AssetLookupResponse,
+    summary="Look up assets",
+    description="Find servers by hostname, serial number, dbid, MAC address or IP address"
+)
+async def lookup_assets(
+    q: str = Query(..., min_length=1, description="Value to look up (case-insensitive, any MAC format)"),
+    prefix: bool = Query(False, description="Match values starting with q"),
+    field: List[LookupField] | None = Query(None, description="Only search these fields"),
+    limit: int = Query(20, ge=1, le=settings.LOOKUP_MAX_RESULTS),
+    current_user: User = Depends(get_current_user)
+) -> AssetLookupResponse:
+    """
+    Look up servers by any identifier printed on the box
+    Served from per-region lookup indexes kept in sync with the build store
+    """
+    try:
+        logger.info(
+            f"Asset lookup for {q} requested by {current_user.email}",
+            extra={"user": current_user.email, "query": q}
+        )
+        
+        fields = [f.value for f in field] if field else list(LOOKUP_FIELDS)
+        shards = get_region_shards()
+        if shards:
+            stores = [(region, shards.get(region)) for region in shards.regions()]
+        else:
+            stores = [(None, generate_mock_rack_store())]
+        
+        results = []
+        for region, store in stores:
+            results += lookup_store(store, region, q, prefix, fields, limit)
+        results.sort(key=lambda result: result[0])
+        
+        return AssetLookupResponse(
+            query=q,
+            prefix=prefix,
+            matches=[match for _, match in results[:limit]]
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error looking up assets: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to look up assets"
+        )
@@ -0,0 +1,100 @@
+"""
+Session store and request authentication
+Validates the session cookie set at SAML login. Kept apart from app.auth
+so routers, middleware and tooling can authenticate requests without
+loading the SAML/XML stack, which is only imported on first login.
+"""
+from fastapi import HTTPException, status, Request
+from typing import Dict, Any
+import logging
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.models import User
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# In-memory session store (use Redis in production)
+_sessions: Dict[str, Dict[str, Any]] = {}
+
+metrics.sessions_active.set_function(lambda: len(_sessions))
+
+
+def store_session(session_token: str, user_data: Dict[str, Any]):
+    """
+    Store session data
+    In production, use Redis or similar
+    """
+    _sessions[session_token] = {
+        'user_data': user_data,
+        'created_at': datetime.utcnow(),
+        'expires_at': datetime.utcnow() + timedelta(seconds=settings.SESSION_LIFETIME_SECONDS)
+    }
+
+    logger.info(f"Session created for user: {user_data['email']}")
+
+
+def get_session(session_token: str) -> Dict[str, Any] | None:
+    """
+    Retrieve session data
+    Returns None if session doesn't exist or is expired
+    """
+    if session_token not in _sessions:
+        return None
+
+    session = _sessions[session_token]
+
+    # Check expiration
+    if datetime.utcnow() > session['expires_at']:
+        del _sessions[session_token]
+        logger.info("Session expired and removed")
+        return None
+
+    return session['user_data']
+
+
+def delete_session(session_token: str):
+    """Delete session"""
+    if session_token in _sessions:
+        del _sessions[session_token]
+        logger.info("Session deleted")
+
+
+async def get_current_user(request: Request) -> User:
+    """
+    Dependency to get current authenticated user
+    Validates session token from cookie
+    """
+    session_token = request.cookies.get("session_token")
+
+    if not session_token:
+        logger.warning("No session token in request")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "SAML"}
+        )
+
+    user_data = get_session(session_token)
+
+    if not user_data:
+        logger.warning(f"Invalid or expired session token")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session expired or invalid",
+            headers={"WWW-Authenticate": "SAML"}
+        )
+
+    return User(**user_data)
+
+
+async def require_admin(request: Request) -> User:
+    """Dependency admitting only authenticated users with the admin role"""
+    user = await get_current_user(request)
+    if user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin role required"
+        )
+    return user
@@ -0,0 +1,174 @@
+"""
+Region-sharded build state
+Each region has its own BuildStore (its own lock, indexes, ETA estimator,
+stale detector and rack aggregates), and multi-region reads fan out to the
+shards concurrently with a per-shard timeout. A slow or failing region only
+degrades its own slice of a response. Regions are discovered from the data,
+so a new depot needs no model change.
+"""
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence, Tuple, TypeVar
+import asyncio
+import logging
+import threading
+import time
+import numpy as np
+
+from app import metrics
+from app.config import settings
+from app.store import BuildStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class RegionShards:
+    """One BuildStore per region"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shards: Dict[str, BuildStore] = {}
+
+    def __len__(self) -> int:
+        return sum(len(store) for store in list(self.shards.values()))
+
+    def regions(self) -> List[str]:
+        return list(self.shards)
+
+    def get(self, region: str) -> BuildStore | None:
+        return self.shards.get(region)
+
+    def shard(self, region: str, capacity: int = 1024) -> BuildStore:
+        """Store for a region, created on first use"""
+        store = self.shards.get(region)
+        if store is None:
+            with self.lock:
+                store = self.shards.get(region)
+                if store is None:
+                    store = BuildStore(capacity=capacity)
+                    self.shards[region] = store
+        return store
+
+    def find(self, hostname: str) -> Tuple[str, BuildStore, int] | None:
+        """Region, shard and row holding a hostname"""
+        for region, store in list(self.shards.items()):
+            row = store.row(hostname)
+            if row is not None:
+                return region, store, row
+        return None
+
+    def memory_bytes(self) -> int:
+        return sum(store.memory_bytes() for store in list(self.shards.values()))
+
+
+def select_rows(columns: Dict[str, object], rows: np.ndarray) -> Dict[str, object]:
+    """Subset of upsert_columns-style columns (arrays or (codes, labels) pairs)"""
+    return {
+        name: (value[0][rows], value[1]) if isinstance(value, tuple) else value[rows]
+        for name, value in columns.items()
+    }
+
+
+def _update_estimates(store: BuildStore, rows: np.ndarray):
+    from app.eta import get_eta_estimator
+
+    estimator = get_eta_estimator(store)
+    estimator.observe(rows)
+    estimator.refresh()
+
+
+@lru_cache(maxsize=1)
+def _create_region_shards(fleet) -> RegionShards:
+    shards = RegionShards()
+    if fleet is None:
+        return shards
+    columns = fleet.columns()
+    for code, region in enumerate(fleet.regions):
+        selected = np.flatnonzero(fleet.region == code)
+        store = shards.shard(region, capacity=max(len(selected), 1))
+        rows = store.upsert_columns(**select_rows(columns, selected))
+        _update_estimates(store, rows)
+    return shards
+
+
+def get_region_shards() -> RegionShards:
+    """
+    Shared region shards
+    Seeded from the fleet simulator when it is enabled, otherwise filled by
+    heartbeat ingestion. Routers fall back to their fixed mock data while
+    the shards are empty.
+    """
+    from app.fleet import get_fleet_simulator
+
+    return _create_region_shards(get_fleet_simulator())
+
+
+def _refresh_from_fleet(shards: RegionShards, fleet):
+    progress = fleet.progress()
+    for code, region in enumerate(fleet.regions):
+        # Shard rows follow simulator order within the region
+        selected = np.flatnonzero(fleet.region == code)
+        store = shards.shard(region)
+        rows = np.arange(len(selected))
+        store.update_rows(rows, **select_rows(progress, selected))
+        _update_estimates(store, rows)
+
+
+async def refresh_region_shards(interval: int):
+    """Periodically advance simulated build progress and ETAs in every shard"""
+    from app.fleet import get_fleet_simulator
+
+    while True:
+        await asyncio.sleep(interval)
+        fleet = get_fleet_simulator()
+        if fleet is None:
+            continue
+        try:
+            await asyncio.to_thread(_refresh_from_fleet, get_region_shards(), fleet)
+        except Exception as e:
+            logger.error(f"Build store refresh failed: {str(e)}")
+
+
+async def fan_out(
+    regions: Sequence[str],
+    query: Callable[[str], T],
+    timeout: float | None = None
+) -> Tuple[Dict[str, T], List[str]]:
+    """
+    Run query(region) for every region concurrently in worker threads
+    Returns results for the regions that answered in time and the list of
+    regions that timed out or failed.
+    """
+    timeout = settings.SHARD_TIMEOUT_SECONDS if timeout is None else timeout
+
+    async def run(region: str):
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(query, region), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Region {region} did not answer within {timeout}s")
+            metrics.shard_query_failures_total.inc(region, "timeout")
+        except Exception as e:
+            logger.error(f"Region {region} query failed: {str(e)}")
+            metrics.shard_query_failures_total.inc(region, "error")
+        finally:
+            metrics.shard_query_seconds.observe(time.perf_counter() - start, region)
+        return None
+
+    answers = await asyncio.gather(*(run(region) for region in regions))
+    results: Dict[str, T] = {}
+    degraded: List[str] = []
+    for region, answer in zip(regions, answers):
+        if answer is None:
+            degraded.append(region)
+        else:
+            results[region] = answer
+    return results, degraded
+
+
+def parse_regions(regions: str | None) -> List[str] | None:
+    """Comma-separated regions query parameter, None when not given"""
+    if not regions:
+        return None
+    return [region.strip() for region in regions.split(",") if region.strip()]
@@ -0,0 +1,136 @@
+"""
+Stale build detection
+In-flight builds sit in a min-heap keyed by the deadline for their next
+heartbeat, so each scan only pops the entries that have expired instead of
+walking the whole fleet. A popped build that has heartbeated since it was
+pushed is re-queued with its new deadline; one that hasn't is marked stale
+in the build store, which publishes the change to its listeners.
+"""
+from typing import Dict, List, Tuple
+import asyncio
+import heapq
+import logging
+import time
+import numpy as np
+
+from app import metrics
+from app.config import settings
+from app.shards import get_region_shards
+from app.store import BuildStore, NULL_TIME
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLUMNS = {"status", "last_heartbeat", "install_start_time"}
+
+
+class StaleBuildDetector:
+    """
+    Heartbeat deadline tracker for in-flight builds
+    Heap entries are (deadline, row). Entries are never updated in place:
+    heartbeats only move a row's deadline later, so the stale entry is
+    simply re-pushed when it reaches the top of the heap.
+    """
+
+    def __init__(self, store: BuildStore, timeout_seconds: int, stale_status: str):
+        self.store = store
+        self.timeout_seconds = timeout_seconds
+        self.stale_status = stale_status
+        self._heap: List[Tuple[int, int]] = []
+        self._tracked = np.zeros(0, dtype=bool)
+        with store.lock:
+            store.subscribe(self._on_write)
+            self.track(np.arange(store.size))
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _deadlines(self, rows: np.ndarray) -> np.ndarray:
+        numbers = self.store.numbers
+        last_seen = numbers["last_heartbeat"][rows]
+        last_seen = np.where(last_seen != NULL_TIME, last_seen, numbers["install_start_time"][rows])
+        return np.where(last_seen != NULL_TIME, last_seen + self.timeout_seconds, NULL_TIME)
+
+    def _installing(self, rows: np.ndarray) -> np.ndarray:
+        return self.store.codes["status"][rows] == self.store.pools["status"].code("installing")
+
+    def track(self, rows: np.ndarray):
+        """Start watching the in-flight builds among `rows` (called under the store lock)"""
+        if len(self._tracked) < self.store.capacity:
+            grown = np.zeros(self.store.capacity, dtype=bool)
+            grown[:len(self._tracked)] = self._tracked
+            self._tracked = grown
+
+        rows = np.unique(rows)
+        rows = rows[~self._tracked[rows] & self._installing(rows)]
+        deadlines = self._deadlines(rows)
+        rows, deadlines = rows[deadlines != NULL_TIME], deadlines[deadlines != NULL_TIME]
+        if not len(rows):
+            return
+        self._tracked[rows] = True
+
+        entries = list(zip(deadlines.tolist(), rows.tolist()))
+        if len(entries) > len(self._heap):
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+
+    def _on_write(self, rows: np.ndarray, columns: Tuple[str, ...]):
+        if WATCHED_COLUMNS.intersection(columns):
+            self.track(rows)
+
+    def scan(self, now: int | None = None) -> np.ndarray:
+        """Mark builds whose heartbeat deadline has passed; returns their rows"""
+        now = int(time.time()) if now is None else now
+        store = self.store
+        with store.lock:
+            expired: List[int] = []
+            while self._heap and self._heap[0][0] <= now:
+                expired.append(heapq.heappop(self._heap)[1])
+            rows = np.array(expired, dtype=np.int64)
+
+            # Finished builds drop out; builds that heartbeated since go back in
+            installing = self._installing(rows)
+            deadlines = self._deadlines(rows)
+            requeue = installing & (deadlines > now)
+            for entry in zip(deadlines[requeue].tolist(), rows[requeue].tolist()):
+                heapq.heappush(self._heap, entry)
+
+            self._tracked[rows[~requeue]] = False
+            rows = rows[installing & ~requeue]
+            if len(rows):
+                store.update_rows(rows, status=(np.zeros(len(rows), dtype=np.uint8), [self.stale_status]))
+        return rows
+
+
+def get_stale_detector(store: BuildStore) -> StaleBuildDetector:
+    """Detector attached to a build store"""
+    return store.attachment(
+        "stale_detector",
+        lambda store: StaleBuildDetector(store, settings.STALE_HEARTBEAT_SECONDS, settings.STALE_BUILD_STATUS)
+    )
+
+
+def scan_region_shards() -> Dict[str, np.ndarray]:
+    """Scan every region shard; returns the rows marked stale per region"""
+    shards = get_region_shards()
+    return {region: get_stale_detector(shards.get(region)).scan() for region in shards.regions()}
+
+
+async def run_stale_detector(interval: float):
+    """Lifespan task scanning every region shard"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Off the event loop: a detector's first scan tracks its whole shard
+            results = await asyncio.to_thread(scan_region_shards)
+            for region, rows in results.items():
+                if len(rows):
+                    metrics.stale_builds_total.inc(amount=len(rows))
+                    logger.warning(
+                        f"Marked {len(rows)} builds in {region} {settings.STALE_BUILD_STATUS}: "
+                        f"no heartbeat for {settings.STALE_HEARTBEAT_SECONDS}s"
+                    )
+        except Exception as e:
+            logger.error(f"Stale build scan failed: {str(e)}")
@@ -0,0 +1,492 @@
+"""
+Columnar in-memory build store
+Build state is held column-wise in numpy arrays instead of one pydantic
+object per server: categorical fields (region, rackID, machine_type, status,
+assigned_status, cpu_model) are interned to small integer codes, progress
+is a uint8 array, timestamps are int64 epoch seconds, and hostname,
+serial_number and dbid are hash-indexed. Response models are materialized
+only for the rows being returned.
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple, TypeVar
+import calendar
+import itertools
+import logging
+import threading
+import numpy as np
+
+from app.models import Server, ServerDetails
+
+logger = logging.getLogger(__name__)
+
+NULL_TIME = np.iinfo(np.int64).min  # Missing timestamp
+NULL_INT = -1  # Missing ram_gb/storage_gb
+
+# Pre-coded categorical values: (codes array, labels)
+Categorical = Tuple[np.ndarray, Sequence[str]]
+
+# Called with (rows, column names) after every write batch, under the store lock
+Listener = Callable[[np.ndarray, Tuple[str, ...]], None]
+
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def to_epoch(value: datetime | None) -> int:
+    """Epoch seconds for a naive UTC datetime, NULL_TIME for None"""
+    if value is None:
+        return int(NULL_TIME)
+    return calendar.timegm(value.utctimetuple())
+
+
+def from_epoch(value: int) -> datetime | None:
+    """Naive UTC datetime for epoch seconds, None for NULL_TIME"""
+    if value == NULL_TIME:
+        return None
+    return datetime.utcfromtimestamp(int(value))
+
+
+def hash_strings(values: np.ndarray) -> np.ndarray:
+    """
+    Vectorized FNV-1a hash of a fixed-width bytes array
+    NUL padding is skipped, so the hash doesn't depend on the array width
+    """
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    width = values.dtype.itemsize
+    data = np.ascontiguousarray(values).view(np.uint8).reshape(len(values), width)
+    hashes = np.full(len(values), _FNV_OFFSET, dtype=np.uint64)
+    for j in range(width):
+        byte = data[:, j].astype(np.uint64)
+        hashes = np.where(byte != 0, (hashes ^ byte) * _FNV_PRIME, hashes)
+    return hashes
+
+
+def to_bytes_array(values: Iterable[str] | np.ndarray) -> np.ndarray:
+    """Convert strings to a fixed-width bytes array"""
+    if isinstance(values, np.ndarray) and values.dtype.kind == "S":
+        return values
+    return np.array([v.encode() for v in values], dtype="S")
+
+
+class StringPool:
+    """Interns string values to small integer codes"""
+
+    def __init__(self, dtype=np.uint8):
+        self.dtype = dtype
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            if code > np.iinfo(self.dtype).max:
+                raise OverflowError(f"Too many distinct values for {np.dtype(self.dtype).name} codes")
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str) -> int | None:
+        """Code of an existing value, or None if it was never interned"""
+        return self._codes.get(value)
+
+    def encode(self, values: Sequence[str] | Categorical) -> np.ndarray:
+        """Encode strings, or remap pre-coded (codes, labels) to this pool"""
+        if isinstance(values, tuple) and len(values) == 2 and isinstance(values[0], np.ndarray):
+            codes, labels = values
+            mapping = np.array([self.code(label) for label in labels], dtype=self.dtype)
+            return mapping[codes]
+        return np.array([self.code(v) for v in values], dtype=self.dtype)
+
+
+class StringColumn:
+    """Fixed-width byte strings, widened when a longer value arrives"""
+
+    def __init__(self, capacity: int, width: int = 8):
+        self.data = np.zeros(capacity, dtype=f"S{width}")
+
+    def resize(self, capacity: int):
+        data = np.zeros(capacity, dtype=self.data.dtype)
+        data[:len(self.data)] = self.data[:capacity]
+        self.data = data
+
+    def set(self, rows: np.ndarray, values: np.ndarray):
+        if values.dtype.itemsize > self.data.dtype.itemsize:
+            self.data = self.data.astype(values.dtype)
+        self.data[rows] = values
+
+    def get(self, row: int) -> str:
+        return self.data[row].decode()
+
+
+class HashIndex:
+    """
+    Open-addressing hash index from a StringColumn's values to row numbers
+    Inserts, removals and lookups are vectorized over batches of keys.
+    Removed entries leave a tombstone that probes step over, until the
+    next resize drops them.
+    """
+
+    EMPTY = -1
+    REMOVED = -2
+
+    def __init__(self, column: StringColumn, capacity: int = 1024):
+        self.column = column
+        self.count = 0
+        self.removed = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        size = 1
+        while size < capacity * 2:
+            size <<= 1
+        self.slots = np.full(size, self.EMPTY, dtype=np.int64)
+        self.mask = np.uint64(size - 1)
+
+    def _place(self, rows: np.ndarray, keys: np.ndarray):
+        # Empty keys (e.g. no serial number yet) are never looked up
+        present = keys != b""
+        rows, keys = rows[present], keys[present]
+        self.count += len(rows)
+        position = hash_strings(keys) & self.mask
+        while len(rows):
+            empty = self.slots[position.astype(np.int64)] == self.EMPTY
+            candidates = np.flatnonzero(empty)
+            # When several keys probe the same empty slot, the first one takes it
+            slots, first = np.unique(position[candidates], return_index=True)
+            placed = candidates[first]
+            self.slots[slots.astype(np.int64)] = rows[placed]
+            keep = np.ones(len(rows), dtype=bool)
+            keep[placed] = False
+            rows, keys = rows[keep], keys[keep]
+            position = (position[keep] + np.uint64(1)) & self.mask
+
+    def insert(self, rows: np.ndarray):
+        """Index newly added rows, or rows whose key changed after `remove`"""
+        if (self.count + self.removed + len(rows)) * 2 > len(self.slots):
+            indexed = self.slots[self.slots >= 0]
+            self._allocate(self.count + len(rows))
+            self.count = 0
+            self.removed = 0
+            self._place(indexed, self.column.data[indexed])
+        self._place(rows, self.column.data[rows])
+
+    def remove(self, rows: np.ndarray, keys: np.ndarray):
+        """Unindex rows under their current `keys`, before those keys change"""
+        present = keys != b""
+        rows, keys = rows[present], keys[present]
+        position = hash_strings(keys) & self.mask
+        while len(rows):
+            slot_rows = self.slots[position.astype(np.int64)]
+            found = slot_rows == rows
+            self.slots[position[found].astype(np.int64)] = self.REMOVED
+            self.count -= int(found.sum())
+            self.removed += int(found.sum())
+            more = ~found & (slot_rows != self.EMPTY)
+            rows = rows[more]
+            position = (position[more] + np.uint64(1)) & self.mask
+
+    def lookup_many(self, keys: np.ndarray) -> np.ndarray:
+        """Row for each key, -1 where the key is not indexed"""
+        result = np.full(len(keys), -1, dtype=np.int64)
+        position = hash_strings(keys) & self.mask
+        active = np.arange(len(keys))
+        while len(active):
+            slot_rows = self.slots[position.astype(np.int64)]
+            empty = slot_rows == self.EMPTY
+            vacant = slot_rows < 0
+            matched = ~vacant & (self.column.data[np.where(vacant, 0, slot_rows)] == keys[active])
+            result[active[matched]] = slot_rows[matched]
+            more = ~empty & ~matched
+            active = active[more]
+            position = (position[more] + np.uint64(1)) & self.mask
+        return result
+
+    def lookup(self, key: str) -> int | None:
+        row = int(self.lookup_many(np.array([key.encode()]))[0])
+        return None if row < 0 else row
+
+
+T = TypeVar("T")
+
+# Distinct generation of every store created in this process
+_generations = itertools.count(1)
+
+
+class BuildStore:
+    """
+    Columnar store of build state, one row per server
+    Writers hold the store lock; readers see a consistent row count.
+    `version` increases on every write batch so caches can detect changes;
+    `generation` is unique per store, so a replaced store starting over at
+    the same version is still told apart. Subscribed listeners are told which rows and columns were written.
+    Helpers maintained from those notifications are attached to the store,
+    so they live exactly as long as it does.
+    """
+
+    INDEXED = ("hostname", "serial_number", "dbid")
+    CATEGORICAL = {
+        "region": np.uint8,
+        "rackID": np.uint32,
+        "machine_type": np.uint8,
+        "status": np.uint8,
+        "assigned_status": np.uint8,
+        "cpu_model": np.uint16,
+    }
+    # Code 0 of each categorical column, used for rows that don't set it
+    CATEGORICAL_DEFAULTS = {
+        "region": "",
+        "rackID": "",
+        "machine_type": "Server",
+        "status": "installing",
+        "assigned_status": "not assigned",
+        "cpu_model": "",
+    }
+    STRINGS = ("hostname", "serial_number", "dbid", "ip_address", "mac_address")
+    NUMERIC = {
+        "percent_built": (np.uint8, 0),
+        "ram_gb": (np.int32, NULL_INT),
+        "storage_gb": (np.int32, NULL_INT),
+        "install_start_time": (np.int64, NULL_TIME),
+        "estimated_completion": (np.int64, NULL_TIME),
+        "last_heartbeat": (np.int64, NULL_TIME),
+    }
+    TIMESTAMPS = ("install_start_time", "estimated_completion", "last_heartbeat")
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.size = 0
+        self.version = 0
+        self.generation = next(_generations)
+        self.lock = threading.RLock()
+        self.pools = {name: StringPool(dtype) for name, dtype in self.CATEGORICAL.items()}
+        self.codes = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.CATEGORICAL.items()}
+        self.strings = {name: StringColumn(capacity) for name in self.STRINGS}
+        self.numbers = {
+            name: np.full(capacity, default, dtype=dtype)
+            for name, (dtype, default) in self.NUMERIC.items()
+        }
+        self.indexes = {name: HashIndex(self.strings[name], capacity) for name in self.INDEXED}
+        self.listeners: List[Listener] = []
+        self.attachments: Dict[str, Any] = {}
+        for name, default in self.CATEGORICAL_DEFAULTS.items():
+            self.pools[name].code(default)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def subscribe(self, listener: Listener):
+        """Call `listener(rows, columns)` after every write batch"""
+        with self.lock:
+            self.listeners.append(listener)
+
+    def attachment(self, name: str, factory: Callable[["BuildStore"], T]) -> T:
+        """Helper attached to this store under `name`, created by `factory(store)` on first use"""
+        with self.lock:
+            helper = self.attachments.get(name)
+            if helper is None:
+                helper = self.attachments[name] = factory(self)
+            return helper
+
+    def _publish(self, rows: np.ndarray, columns: Iterable[str]):
+        self.version += 1
+        names = tuple(columns)
+        for listener in self.listeners:
+            try:
+                listener(rows, names)
+            except Exception as e:
+                logger.error(f"Build store listener failed: {str(e)}")
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2)
+        for name, array in self.codes.items():
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.codes[name] = grown
+        for name, array in self.numbers.items():
+            grown = np.full(capacity, self.NUMERIC[name][1], dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.numbers[name] = grown
+        for column in self.strings.values():
+            column.resize(capacity)
+        self.capacity = capacity
+
+    # Writes
+
+    def upsert_columns(self, hostname: Sequence[str] | np.ndarray, **columns) -> np.ndarray:
+        """
+        Insert or update rows keyed by hostname
+        Each column is a sequence aligned with `hostname`; categorical columns
+        may also be given pre-coded as (codes, labels) and timestamp columns
+        as int64 epoch seconds. Columns that aren't given keep their value
+        (or default, for new rows). Returns the row of each hostname.
+        """
+        keys = to_bytes_array(hostname)
+        with self.lock:
+            rows = self.indexes["hostname"].lookup_many(keys)
+            new = np.flatnonzero(rows < 0)
+            if len(new):
+                # New hostnames get rows in order of first appearance; a
+                # hostname repeated within the batch maps to one row
+                unique_keys, first, inverse = np.unique(
+                    keys[new], return_index=True, return_inverse=True
+                )
+                order = np.argsort(first)
+                rank = np.empty_like(order)
+                rank[order] = np.arange(len(order))
+                start = self.size
+                self._grow(start + len(unique_keys))
+                new_rows = np.arange(start, start + len(unique_keys), dtype=np.int64)
+                self.strings["hostname"].set(new_rows, unique_keys[order])
+                self.size += len(unique_keys)
+                self.indexes["hostname"].insert(new_rows)
+                rows[new] = start + rank[inverse.reshape(-1)]
+            else:
+                new_rows = np.zeros(0, dtype=np.int64)
+
+            for name, values in columns.items():
+                self._set_column(name, rows, values, new_rows)
+
+            self._publish(rows, ("hostname", *columns) if len(new_rows) else columns)
+        return rows
+
+    def _set_column(self, name: str, rows: np.ndarray, values, new_rows: np.ndarray):
+        if name in self.codes:
+            self.codes[name][rows] = self.pools[name].encode(values)
+        elif name in self.strings:
+            encoded = to_bytes_array(values)
+            if name not in self.indexes:
+                self.strings[name].set(rows, encoded)
+                return
+            # Only rows whose key changed are re-indexed, never the whole column
+            changed = ~np.isin(rows, new_rows)
+            changed[changed] = self.strings[name].data[rows[changed]] != encoded[changed]
+            changed_rows = rows[changed]
+            self.indexes[name].remove(changed_rows, self.strings[name].data[changed_rows])
+            self.strings[name].set(rows, encoded)
+            reindexed = np.concatenate([changed_rows, new_rows]).astype(np.int64)
+            if len(reindexed):
+                self.indexes[name].insert(reindexed)
+        elif name in self.numbers:
+            array = np.asarray(values)
+            if name in self.TIMESTAMPS and array.dtype == object:
+                array = np.array([to_epoch(v) for v in values], dtype=np.int64)
+            elif array.dtype == object:
+                array = np.array([NULL_INT if v is None else v for v in values])
+            self.numbers[name][rows] = array
+        else:
+            raise KeyError(f"Unknown column: {name}")
+
+    def upsert(self, servers: Sequence[Server]) -> np.ndarray:
+        """Insert or update rows from Server/ServerDetails models"""
+        if not servers:
+            return np.zeros(0, dtype=np.int64)
+        fields = list(Server.model_fields)
+        if all(isinstance(s, ServerDetails) for s in servers):
+            fields = list(ServerDetails.model_fields)
+        columns = {
+            name: [getattr(s, name) for s in servers]
+            for name in fields if name != "hostname"
+        }
+        if "cpu_model" in columns:
+            columns["cpu_model"] = [v or "" for v in columns["cpu_model"]]
+        for name in ("ip_address", "mac_address"):
+            if name in columns:
+                columns[name] = [v or "" for v in columns[name]]
+        return self.upsert_columns([s.hostname for s in servers], **columns)
+
+    def update_rows(self, rows: np.ndarray, **columns):
+        """Update existing rows in place (same column formats as upsert_columns)"""
+        with self.lock:
+            for name, values in columns.items():
+                self._set_column(name, rows, values, np.zeros(0, dtype=np.int64))
+            self._publish(rows, columns)
+
+    # Reads
+
+    def row(self, hostname: str) -> int | None:
+        return self.indexes["hostname"].lookup(hostname)
+
+    def row_by(self, field: str, value: str) -> int | None:
+        """Row for an indexed field (hostname, serial_number or dbid)"""
+        return self.indexes[field].lookup(value)
+
+    def select(self, region: str | None = None, status: Sequence[str] | None = None) -> np.ndarray:
+        """Rows matching a region and/or set of statuses"""
+        size = self.size
+        mask = np.ones(size, dtype=bool)
+        if region is not None:
+            code = self.pools["region"].lookup(region)
+            if code is None:
+                return np.zeros(0, dtype=np.int64)
+            mask &= self.codes["region"][:size] == code
+        if status is not None:
+            codes = [c for c in (self.pools["status"].lookup(s) for s in status) if c is not None]
+            mask &= np.isin(self.codes["status"][:size], codes)
+        return np.flatnonzero(mask)
+
+    def label(self, name: str, row: int) -> str:
+        return self.pools[name].values[self.codes[name][row]]
+
+    def servers(self, rows: np.ndarray) -> List[Server]:
+        """Materialize Server models for the given rows"""
+        labels = {name: self.pools[name].values for name in
+                  ("rackID", "machine_type", "status", "assigned_status")}
+        columns = {name: self.codes[name][rows].tolist() for name in labels}
+        hostnames = self.strings["hostname"].data[rows].tolist()
+        dbids = self.strings["dbid"].data[rows].tolist()
+        serials = self.strings["serial_number"].data[rows].tolist()
+        percents = self.numbers["percent_built"][rows].tolist()
+
+        return [
+            Server.model_construct(
+                rackID=labels["rackID"][columns["rackID"][i]],
+                hostname=hostnames[i].decode(),
+                dbid=dbids[i].decode(),
+                serial_number=serials[i].decode(),
+                percent_built=percents[i],
+                assigned_status=labels["assigned_status"][columns["assigned_status"][i]],
+                machine_type=labels["machine_type"][columns["machine_type"][i]],
+                status=labels["status"][columns["status"][i]],
+            )
+            for i in range(len(rows))
+        ]
+
+    def details(self, row: int) -> ServerDetails:
+        """Materialize ServerDetails for one row"""
+        server = self.servers(np.array([row]))[0]
+        ram = int(self.numbers["ram_gb"][row])
+        storage = int(self.numbers["storage_gb"][row])
+        return ServerDetails.model_construct(
+            **server.__dict__,
+            ip_address=self.strings["ip_address"].get(row) or None,
+            mac_address=self.strings["mac_address"].get(row) or None,
+            cpu_model=self.label("cpu_model", row) or None,
+            ram_gb=None if ram == NULL_INT else ram,
+            storage_gb=None if storage == NULL_INT else storage,
+            install_start_time=from_epoch(self.numbers["install_start_time"][row]),
+            estimated_completion=from_epoch(self.numbers["estimated_completion"][row]),
+            last_heartbeat=from_epoch(self.numbers["last_heartbeat"][row]),
+        )
+
+    def build_status(self) -> Dict[str, List[Server]]:
+        """All rows as Server models, grouped by region"""
+        size = self.size
+        region_codes = self.codes["region"][:size]
+        return {
+            region: self.servers(np.flatnonzero(region_codes == code))
+            for code, region in enumerate(self.pools["region"].values)
+            if region
+        }
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the column arrays and indexes"""
+        total = sum(a.nbytes for a in self.codes.values())
+        total += sum(a.nbytes for a in self.numbers.values())
+        total += sum(c.data.nbytes for c in self.strings.values())
+        total += sum(i.slots.nbytes for i in self.indexes.values())
+        return total
+
@@ -0,0 +1,286 @@
+"""
+Build progress time series
+Every change to a server's percent_built or status is appended as a
+(row, timestamp, percent, status) sample to the segment of its UTC day.
+Segments are parallel numpy arrays: samples arrive in an append-only tail,
+and every full tail is sorted by (row, time) into an immutable chunk
+(chunks of equal size are merged), so a server's samples in a day are found
+by a few binary searches. Closed days are
+compacted into one chunk and, as they age, downsampled to the last sample
+per minute and then per hour, until they expire.
+"""
+from typing import Dict, List, Tuple
+import asyncio
+import logging
+import threading
+import time
+import numpy as np
+
+from app.config import settings
+from app.shards import get_region_shards
+from app.store import BuildStore, NULL_TIME
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+RECORDED_COLUMNS = {"percent_built", "status"}
+
+# Seconds per sample of each resolution (0 keeps every sample)
+RAW, MINUTE, HOUR = 0, 60, 3600
+
+
+class Samples:
+    """Parallel sample arrays; times are seconds into the segment's day"""
+
+    FIELDS = ("rows", "seconds", "percent", "status")
+
+    def __init__(self, rows: np.ndarray, seconds: np.ndarray, percent: np.ndarray, status: np.ndarray):
+        self.rows = rows
+        self.seconds = seconds
+        self.percent = percent
+        self.status = status
+
+    @classmethod
+    def empty(cls, capacity: int = 0) -> "Samples":
+        return cls(
+            np.zeros(capacity, dtype=np.int32),
+            np.zeros(capacity, dtype=np.int32),
+            np.zeros(capacity, dtype=np.uint8),
+            np.zeros(capacity, dtype=np.uint8),
+        )
+
+    @classmethod
+    def concat(cls, parts: List["Samples"]) -> "Samples":
+        if not parts:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(p, name) for p in parts]) for name in cls.FIELDS))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def take(self, index) -> "Samples":
+        return Samples(self.rows[index], self.seconds[index], self.percent[index], self.status[index])
+
+    def sorted(self) -> "Samples":
+        """Copy ordered by (row, time), keeping arrival order for equal times"""
+        return self.take(np.lexsort((self.seconds, self.rows)))
+
+    def for_row(self, row: int) -> "Samples":
+        """A row's samples (chunks are sorted by row)"""
+        # Same dtype as the rows, or numpy would convert the whole array
+        start, end = np.searchsorted(self.rows, np.array([row, row + 1], dtype=self.rows.dtype))
+        return self.take(slice(start, end))
+
+    def downsample(self, resolution: int) -> "Samples":
+        """Last sample of each row per `resolution` seconds (chunks are sorted by row)"""
+        bucket = self.seconds // resolution
+        last = np.ones(len(self), dtype=bool)
+        last[:-1] = (self.rows[1:] != self.rows[:-1]) | (bucket[1:] != bucket[:-1])
+        return self.take(last)
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.FIELDS)
+
+
+class Segment:
+    """Samples of one UTC day"""
+
+    def __init__(self, day: int, tail_capacity: int):
+        self.day = day
+        self.tail_capacity = tail_capacity
+        self.resolution = RAW
+        self.chunks: List[Samples] = []
+        self.tail = Samples.empty(tail_capacity)
+        self.tail_size = 0
+
+    def __len__(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks) + self.tail_size
+
+    def append(self, samples: Samples):
+        if not len(self.tail):
+            # Late samples for a compacted day
+            self.tail = Samples.empty(self.tail_capacity)
+        capacity = len(self.tail)
+        written = 0
+        while written < len(samples):
+            count = min(capacity - self.tail_size, len(samples) - written)
+            for name in Samples.FIELDS:
+                target = getattr(self.tail, name)
+                target[self.tail_size:self.tail_size + count] = getattr(samples, name)[written:written + count]
+            self.tail_size += count
+            written += count
+            if self.tail_size == capacity:
+                self.chunks.append(self.tail.sorted())
+                self.tail = Samples.empty(capacity)
+                self.tail_size = 0
+                # Merge equal-sized neighbours, keeping a logarithmic number
+                # of chunks for reads to search
+                while len(self.chunks) > 1 and len(self.chunks[-2]) <= len(self.chunks[-1]):
+                    self.chunks[-2:] = [Samples.concat(self.chunks[-2:]).sorted()]
+
+    def for_row(self, row: int) -> Samples:
+        """A row's samples in time order"""
+        parts = [chunk.for_row(row) for chunk in self.chunks]
+        tail = self.tail.take(slice(0, self.tail_size))
+        parts.append(tail.take(tail.rows == row))
+        samples = Samples.concat(parts)
+        return samples.take(np.argsort(samples.seconds, kind="stable"))
+
+    def compact(self, resolution: int):
+        """Merge all samples into one sorted chunk at (at least) `resolution`"""
+        if self.tail_size == 0 and len(self.chunks) <= 1 and resolution <= self.resolution:
+            return
+        tail = self.tail.take(slice(0, self.tail_size))
+        merged = Samples.concat(self.chunks + [tail]).sorted()
+        self.resolution = max(self.resolution, resolution)
+        if self.resolution:
+            merged = merged.downsample(self.resolution)
+        self.chunks = [merged]
+        self.tail = Samples.empty(0)
+        self.tail_size = 0
+
+    def nbytes(self) -> int:
+        return sum(chunk.nbytes() for chunk in self.chunks) + self.tail.nbytes()
+
+
+class BuildTimeline:
+    """
+    Progress samples of every server in a BuildStore, by day
+    A sample is only appended when a row's percent or status differs from
+    the last one recorded for it, so periodic rewrites of unchanged rows
+    cost nothing.
+    """
+
+    def __init__(self, store: BuildStore, tail_samples: int):
+        self.store = store
+        self.tail_samples = tail_samples
+        self.lock = threading.Lock()
+        self.segments: Dict[int, Segment] = {}
+        self._recorded = np.zeros(0, dtype=bool)
+        self._percent = np.zeros(0, dtype=np.uint8)
+        self._status = np.zeros(0, dtype=np.uint8)
+        with store.lock:
+            store.subscribe(self._on_write)
+            self.record(np.arange(store.size), with_heartbeat=True)
+
+    def _grow(self):
+        capacity = self.store.capacity
+        if len(self._recorded) < capacity:
+            for name in ("_recorded", "_percent", "_status"):
+                old = getattr(self, name)
+                grown = np.zeros(capacity, dtype=old.dtype)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+
+    def record(self, rows: np.ndarray, with_heartbeat: bool, now: int | None = None):
+        """
+        Append samples for the rows whose state changed (called under the
+        store lock). Samples are timed by the row's last heartbeat when the
+        write carried one, otherwise by `now`.
+        """
+        now = int(time.time()) if now is None else now
+        store = self.store
+        rows = np.unique(rows)
+        percent = store.numbers["percent_built"][rows]
+        status = store.codes["status"][rows]
+        with self.lock:
+            self._grow()
+            changed = ~self._recorded[rows] | (self._percent[rows] != percent) | (self._status[rows] != status)
+            rows, percent, status = rows[changed], percent[changed], status[changed]
+            if not len(rows):
+                return
+            self._recorded[rows] = True
+            self._percent[rows] = percent
+            self._status[rows] = status
+
+            timestamps = np.full(len(rows), now, dtype=np.int64)
+            if with_heartbeat:
+                heartbeat = store.numbers["last_heartbeat"][rows]
+                timestamps = np.where(heartbeat != NULL_TIME, heartbeat, now)
+            kept = timestamps > now - settings.TIMELINE_RETENTION_DAYS * DAY_SECONDS
+            rows, percent, status, timestamps = rows[kept], percent[kept], status[kept], timestamps[kept]
+            days = timestamps // DAY_SECONDS
+            for day in np.unique(days).tolist():
+                selected = days == day
+                segment = self.segments.get(day)
+                if segment is None:
+                    segment = self.segments[day] = Segment(day, self.tail_samples)
+                segment.append(Samples(
+                    rows[selected].astype(np.int32),
+                    (timestamps[selected] - day * DAY_SECONDS).astype(np.int32),
+                    percent[selected],
+                    status[selected],
+                ))
+
+    def _on_write(self, rows: np.ndarray, columns: Tuple[str, ...]):
+        if RECORDED_COLUMNS.intersection(columns):
+            self.record(rows, with_heartbeat="last_heartbeat" in columns)
+
+    def samples(self, row: int, start: int, end: int) -> List[Tuple[int, int, str]]:
+        """(epoch seconds, percent, status) of a row between start and end, in time order"""
+        labels = self.store.pools["status"].values
+        result = []
+        with self.lock:
+            days = [day for day in self.segments if start // DAY_SECONDS <= day <= end // DAY_SECONDS]
+            found = [(day, self.segments[day].for_row(row)) for day in sorted(days)]
+        for day, samples in found:
+            timestamps = samples.seconds.astype(np.int64) + day * DAY_SECONDS
+            selected = (timestamps >= start) & (timestamps <= end)
+            result += zip(
+                timestamps[selected].tolist(),
+                samples.percent[selected].tolist(),
+                [labels[code] for code in samples.status[selected].tolist()],
+            )
+        return result
+
+    def maintain(self, now: int | None = None) -> int:
+        """
+        Compact closed days, downsample aging ones and drop expired ones
+        Returns the number of samples held afterwards.
+        """
+        now = int(time.time()) if now is None else now
+        today = now // DAY_SECONDS
+        with self.lock:
+            for day in list(self.segments):
+                # Age of the day's most recent possible sample
+                age = now - (day + 1) * DAY_SECONDS
+                if age >= settings.TIMELINE_RETENTION_DAYS * DAY_SECONDS:
+                    del self.segments[day]
+                elif day < today:
+                    if age >= settings.TIMELINE_MINUTE_DAYS * DAY_SECONDS:
+                        resolution = HOUR
+                    elif age >= settings.TIMELINE_RAW_DAYS * DAY_SECONDS:
+                        resolution = MINUTE
+                    else:
+                        resolution = RAW
+                    self.segments[day].compact(resolution)
+            return sum(len(segment) for segment in self.segments.values())
+
+    def memory_bytes(self) -> int:
+        with self.lock:
+            return sum(segment.nbytes() for segment in self.segments.values())
+
+
+def get_build_timeline(store: BuildStore) -> BuildTimeline:
+    """Timeline attached to a build store"""
+    return store.attachment(
+        "build_timeline",
+        lambda store: BuildTimeline(store, settings.TIMELINE_TAIL_SAMPLES)
+    )
+
+
+def maintain_region_shards() -> Dict[str, int]:
+    """Maintain the timeline of every region shard; returns the samples held per region"""
+    shards = get_region_shards()
+    return {region: get_build_timeline(shards.get(region)).maintain() for region in shards.regions()}
+
+
+async def run_timeline_maintenance(interval: float):
+    """Lifespan task compacting and downsampling every shard's timeline"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            results = await asyncio.to_thread(maintain_region_shards)
+            logger.debug(f"Timeline samples held: {results}")
+        except Exception as e:
+            logger.error(f"Timeline maintenance failed: {str(e)}")
@@ -0,0 +1,4 @@
+"""
+API benchmarks
+Run from the backend directory, e.g. python -m benchmarks.bench_api
+"""
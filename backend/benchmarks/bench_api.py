@@ -0,0 +1,215 @@
+"""
+API load test and benchmark
+Starts the app in-process and drives the main endpoints against synthetic
+fleets, reporting throughput, p50/p99 latency, response size on the wire
+and RSS per endpoint.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_api --fleets 1000,10000,100000 --save results.json
+    python -m benchmarks.bench_api --baseline results.json --max-regression 0.2
+
+With --baseline, exits with status 1 if any endpoint's p99 latency grew or
+its throughput dropped by more than --max-regression (a fraction).
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+
+from benchmarks import fixtures
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak RSS is the best available without /proc (KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def install_fleet(size: int, seed: int) -> List[str]:
+    """
+    Switch the fleet simulator to `size` servers
+    Returns some hostnames to query
+    """
+    from app.config import settings
+    from app.fleet import get_fleet_simulator
+
+    settings.FLEET_SIZE = size
+    settings.FLEET_SEED = seed
+    fleet = get_fleet_simulator()
+    return [fleet.hostname(i) for i in range(0, size, max(1, size // 100))]
+
+
+def endpoint_requests(hostnames: List[str]) -> Dict[str, callable]:
+    """Endpoint name -> function building (method, url, json body) for request i"""
+    return {
+        "build-status": lambda i: ("GET", "/api/build-status", None),
+        "build-history": lambda i: ("GET", f"/api/build-history/2024-01-{i % 28 + 1:02d}", None),
+        "build-history-range": lambda i: (
+            "GET", f"/api/build-history?start=2024-01-{i % 22 + 1:02d}&end=2024-01-{i % 22 + 7:02d}", None
+        ),
+        "build-rollups": lambda i: ("GET", "/api/build-rollups", None),
+        "server-details": lambda i: (
+            "GET", f"/api/server-details?hostname={hostnames[i % len(hostnames)]}", None
+        ),
+        "lookup": lambda i: (
+            "GET", f"/api/lookup?q={hostnames[i % len(hostnames)].upper()}", None
+        ),
+        "lookup-prefix": lambda i: (
+            "GET", f"/api/lookup?q={hostnames[i % len(hostnames)][:-2]}&prefix=true", None
+        ),
+        "racks": lambda i: ("GET", f"/api/racks?region={('cbg', 'dub', 'dal')[i % 3]}", None),
+        "assign": lambda i: ("POST", "/api/assign", {
+            "serial_number": f"SN-BENCH-{i}",
+            "hostname": hostnames[i % len(hostnames)],
+            "dbid": str(900000 + i),
+        }),
+        "push-preconfig": lambda i: ("POST", "/api/push-preconfig", {"depot": (1, 2, 4)[i % 3]}),
+    }
+
+
+async def run_endpoint(client, make_request, requests: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    degraded = 0
+    downloaded = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors, degraded, downloaded
+        for i in counter:
+            method, url, body = make_request(i)
+            start = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - start)
+            downloaded += response.num_bytes_downloaded
+            if response.status_code >= 400:
+                errors += 1
+            if response.headers.get("x-degraded-regions"):
+                degraded += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "degraded": degraded,
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "wire_kb": round(downloaded / requests / 1024, 1),
+        "rss_mb": round(current_rss_mb(), 1),
+    }
+
+
+async def run(
+    fleets: List[int],
+    requests: int,
+    concurrency: int,
+    endpoints: List[str],
+    seed: int
+) -> Dict[str, dict]:
+    import httpx
+    from main import app
+
+    token = fixtures.create_session()
+    results: Dict[str, dict] = {}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench",
+            cookies={"session_token": token}
+        ) as client:
+            for size in fleets:
+                hostnames = install_fleet(size, seed)
+                for name, make_request in endpoint_requests(hostnames).items():
+                    if endpoints and name not in endpoints:
+                        continue
+                    # Warm up before measuring
+                    await run_endpoint(client, make_request, min(requests, concurrency), concurrency)
+                    key = f"{size}/{name}"
+                    results[key] = await run_endpoint(client, make_request, requests, concurrency)
+                    print(f"{key:32} " + "  ".join(f"{k}={v}" for k, v in results[key].items()))
+    return results
+
+
+def find_regressions(results: Dict[str, dict], baseline: Dict[str, dict], max_regression: float) -> List[str]:
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if not reference:
+            continue
+        if result["p99_ms"] > reference["p99_ms"] * (1 + max_regression):
+            regressions.append(f"{key}: p99 {reference['p99_ms']}ms -> {result['p99_ms']}ms")
+        if result["throughput_rps"] < reference["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{key}: throughput {reference['throughput_rps']} -> {result['throughput_rps']} req/s"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard API in-process")
+    parser.add_argument("--fleets", default="1000,10000,100000", help="Comma-separated fleet sizes")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and fleet")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42, help="Fleet simulator seed")
+    parser.add_argument("--endpoints", default="", help="Comma-separated subset of endpoints")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results from a previous --save")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed fractional regression in p99 or throughput")
+    args = parser.parse_args()
+
+    fixtures.configure_environment()
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    results = asyncio.run(run(
+        [int(size) for size in args.fleets.split(",") if size],
+        args.requests,
+        args.concurrency,
+        [name for name in args.endpoints.split(",") if name],
+        args.seed
+    ))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print("Performance regressions detected:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions beyond threshold")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Startup benchmark
+Measures how long `import main` takes (and the slowest modules, from
+python -X importtime), then starts gunicorn with and without preload and
+reports the time until it serves requests, the time to respawn a killed
+worker, and the memory of the master and each worker. PSS splits shared
+pages between the processes using them, so it shows how much copy-on-write
+sharing preload achieves; private is memory only that process holds.
+Linux only (reads /proc).
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_startup --workers 4 --fleet 100000
+    python -m benchmarks.bench_startup --modes preload --save startup.json
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks import fixtures
+from benchmarks.check_import_time import import_times
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(env: Dict[str, str], top: int) -> dict:
+    """Wall time of `import main` plus the modules with the most self time"""
+    start = time.perf_counter()
+    modules = import_times("import main", env)
+    wall = time.perf_counter() - start
+
+    total = next((c for _, c, name in modules if name == "main"), 0)
+    slowest = sorted(modules, reverse=True)[:top]
+    return {
+        "process_s": round(wall, 3),
+        "import_main_ms": round(total / 1000, 1),
+        "slowest_modules_ms": {name: round(s / 1000, 1) for s, _, name in slowest},
+    }
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    """RSS, PSS and private memory of a process in KB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_settled(pid: int, workers: int, exclude: List[int], timeout: float) -> List[int]:
+    """
+    Wait until the master has `workers` children besides `exclude` and
+    their RSS has stopped growing (startup finished). Returns the workers.
+    """
+    deadline = time.monotonic() + timeout
+    previous: Dict[int, int] = {}
+    stable_since = None
+    while time.monotonic() < deadline:
+        current = {}
+        for child in children(pid):
+            if child in exclude:
+                continue
+            try:
+                current[child] = memory_kb(child)["rss"]
+            except OSError:
+                pass
+        if len(current) == workers and current == previous:
+            stable_since = stable_since or time.monotonic()
+            if time.monotonic() - stable_since >= 0.5:
+                return list(current)
+        else:
+            stable_since = None
+        previous = current
+        time.sleep(0.1)
+    raise TimeoutError(f"{workers} workers did not settle within {timeout}s")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Server did not become healthy within {timeout}s")
+
+
+def run_gunicorn(env: Dict[str, str], workers: int, preload: bool, timeout: float) -> dict:
+    port = free_port()
+    env = dict(env, WEB_CONCURRENCY=str(workers), GUNICORN_PRELOAD=str(preload).lower(),
+               GUNICORN_BIND=f"127.0.0.1:{port}")
+    start = time.perf_counter()
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_healthy(port, timeout)
+        healthy = time.perf_counter() - start
+        pids = wait_settled(master.pid, workers, [], timeout)
+        settled = time.perf_counter() - start
+        worker_memory = [memory_kb(pid) for pid in pids]
+        master_memory = memory_kb(master.pid)
+
+        # A recycled (or crashed) worker is replaced by a fresh fork
+        killed = pids[0]
+        respawn_start = time.perf_counter()
+        os.kill(killed, signal.SIGKILL)
+        wait_settled(master.pid, workers, [killed], timeout)
+        respawn = time.perf_counter() - respawn_start
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+
+    def mb(kb: int) -> float:
+        return round(kb / 1024, 1)
+
+    return {
+        "healthy_s": round(healthy, 2),
+        "all_workers_ready_s": round(settled, 2),
+        "respawn_s": round(respawn, 2),
+        "master_rss_mb": mb(master_memory["rss"]),
+        "worker_rss_mb": [mb(m["rss"]) for m in worker_memory],
+        "worker_pss_mb": [mb(m["pss"]) for m in worker_memory],
+        "worker_private_mb": [mb(m["private"]) for m in worker_memory],
+        "total_pss_mb": mb(master_memory["pss"] + sum(m["pss"] for m in worker_memory)),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--fleet", type=int, default=100000, help="Simulated fleet size (0 for fixed mock data)")
+    parser.add_argument("--modes", default="preload,no-preload", help="Comma-separated: preload, no-preload")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    fixtures.configure_environment()
+    env = dict(os.environ, FLEET_SIZE=str(args.fleet), FLEET_SIMULATOR=str(args.fleet > 0).lower())
+
+    results = {"import": import_profile(env, args.top)}
+    print(f"import main: {results['import']['import_main_ms']} ms "
+          f"(process {results['import']['process_s']} s)")
+    for name, ms in results["import"]["slowest_modules_ms"].items():
+        print(f"    {ms:8.1f} ms  {name}")
+
+    for mode in args.modes.split(","):
+        mode = mode.strip()
+        results[mode] = run_gunicorn(env, args.workers, mode == "preload", args.timeout)
+        print(f"{mode:12} " + "  ".join(f"{k}={v}" for k, v in results[mode].items()))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Export memory check
+Starts uvicorn on a synthetic fleet and streams a gzip CSV export of at
+least --rows build history rows, sampling the server's RSS while it runs.
+Fails if RSS grows by more than --max-growth-mb over its level after a
+one-day warm-up export, or if fewer rows arrive than requested. With
+--archived the days are archived first, so the export reads memory-mapped
+partitions instead of the primary source. Linux only (reads /proc).
+
+Usage (from the backend directory):
+    python -m benchmarks.check_export_memory
+    python -m benchmarks.check_export_memory --rows 1000000 --max-growth-mb 64 --archived
+
+Exits with status 1 on any failure.
+"""
+from datetime import date, timedelta
+from typing import Dict, List
+import argparse
+import math
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import zlib
+
+from benchmarks import fixtures
+from benchmarks.bench_startup import free_port, memory_kb, wait_healthy
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Background tasks that would allocate while the export is measured
+QUIET = {
+    "FLEET_REFRESH_SECONDS": "0",
+    "STALE_SCAN_SECONDS": "0",
+    "TIMELINE_MAINTENANCE_SECONDS": "0",
+    "ARCHIVE_INTERVAL_SECONDS": "0",
+    "ROLLUP_REFRESH_SECONDS": "0",
+    "METRICS_ENABLED": "false",
+}
+
+
+# Starts uvicorn in-process after storing the benchmark session
+LAUNCHER = (
+    "import sys, uvicorn\n"
+    "from benchmarks import fixtures\n"
+    "fixtures.create_session()\n"
+    "from main import app\n"
+    "uvicorn.run(app, host='127.0.0.1', port=int(sys.argv[1]), log_level='warning')\n"
+)
+
+
+def export(port: int, token: str, first: date, last: date) -> int:
+    """Stream a gzip CSV export and return the number of data rows received"""
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/api/export/build-history?start={first}&end={last}",
+        headers={"Accept-Encoding": "gzip", "Cookie": f"session_token={token}"}
+    )
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    lines = 0
+    with urllib.request.urlopen(request, timeout=600) as response:
+        while True:
+            block = response.read(65536)
+            if not block:
+                break
+            lines += decoder.decompress(block).count(b"\n")
+    lines += decoder.flush().count(b"\n")
+    return lines - 1  # Header
+
+
+def sample_rss(pid: int, stop: threading.Event, samples: List[int]):
+    while not stop.is_set():
+        samples.append(memory_kb(pid)["rss"])
+        time.sleep(0.05)
+
+
+def archive_days(env: Dict[str, str], first: date, last: date):
+    """Archive the days in a separate process, as the server's archiver would"""
+    script = (
+        "import sys\n"
+        "from app.archive import get_history_archive\n"
+        "from app.fleet import get_fleet_simulator\n"
+        "fleet, archive = get_fleet_simulator(), get_history_archive()\n"
+        "for day in sys.argv[1:]:\n"
+        "    for region in fleet.regions:\n"
+        "        archive.write(region, day, fleet.history_columns(day, region))\n"
+    )
+    days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+    subprocess.run([sys.executable, "-c", script, *days], cwd=BACKEND_DIR, env=env, check=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows to export at least")
+    parser.add_argument("--fleet", type=int, default=300000, help="Simulated fleet size")
+    parser.add_argument("--max-growth-mb", type=float, default=64.0)
+    parser.add_argument("--archived", action="store_true", help="Export from archived partitions")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    args = parser.parse_args()
+
+    workdir = fixtures.configure_environment()
+    env = dict(os.environ, FLEET_SIZE=str(args.fleet), ARCHIVE_DIR=os.path.join(workdir, "archive"), **QUIET)
+
+    # Sessions live in the server process, so the launcher stores the token
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-c", LAUNCHER, str(port)],
+        cwd=BACKEND_DIR, env=env
+    )
+    token = "bench-session-token"
+    failures: List[str] = []
+    try:
+        wait_healthy(port, args.timeout)
+
+        # Warm up on one day, then size the range to the requested rows
+        last = date.today() - timedelta(days=1)
+        per_day = export(port, token, last, last)
+        days = math.ceil(args.rows / max(per_day, 1))
+        first = last - timedelta(days=days - 1)
+        if args.archived:
+            archive_days(env, first, last)
+            export(port, token, last, last)
+        baseline = memory_kb(server.pid)["rss"]
+
+        samples: List[int] = []
+        stop = threading.Event()
+        sampler = threading.Thread(target=sample_rss, args=(server.pid, stop, samples))
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            rows = export(port, token, first, last)
+        finally:
+            stop.set()
+            sampler.join()
+        elapsed = time.perf_counter() - start
+
+        growth_mb = (max(samples, default=baseline) - baseline) / 1024
+        print(f"exported {rows} rows over {days} days in {elapsed:.1f} s ({rows / elapsed:.0f} rows/s)")
+        print(f"server RSS {baseline / 1024:.1f} MB before, peak growth {growth_mb:.1f} MB "
+              f"(limit {args.max_growth_mb:.0f} MB)")
+        if rows < args.rows:
+            failures.append(f"only {rows} of {args.rows} rows exported")
+        if growth_mb > args.max_growth_mb:
+            failures.append(f"RSS grew by {growth_mb:.1f} MB")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
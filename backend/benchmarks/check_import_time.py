@@ -0,0 +1,114 @@
+"""
+Import-time regression check
+Imports each target module in a fresh interpreter with python -X importtime
+and fails if it pulls in the SAML/XML stack (which must only load on first
+login), or if its cumulative import time exceeds its budget or grew by more
+than --max-regression against a saved baseline. Runs without an IDP
+metadata file, which non-login code paths must not need.
+
+Usage (from the backend directory):
+    python -m benchmarks.check_import_time
+    python -m benchmarks.check_import_time --save import-baseline.json
+    python -m benchmarks.check_import_time --baseline import-baseline.json --max-regression 0.25
+
+Exits with status 1 on any failure.
+"""
+from typing import Dict, List, Tuple
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks import fixtures
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module -> cumulative import budget in ms
+TARGETS: Dict[str, float] = {
+    "app.models": 300.0,
+    "app.session": 600.0,
+    "app.routers": 1500.0,
+    "main": 2000.0,
+}
+
+# Only app.auth may import these
+FORBIDDEN_PREFIXES = ("onelogin", "xmlsec", "lxml")
+
+
+def import_times(statement: str, env: Dict[str, str]) -> List[Tuple[int, int, str]]:
+    """(self us, cumulative us, module) for every module imported by `statement`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{statement!r} failed:\n{result.stderr[-2000:]}")
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append((int(self_us), int(cumulative_us), name))
+    return modules
+
+
+def measure(module: str, env: Dict[str, str], runs: int) -> Tuple[float, List[str]]:
+    """Best cumulative import time in ms over `runs`, and forbidden modules imported"""
+    best = None
+    forbidden: List[str] = []
+    for _ in range(runs):
+        modules = import_times(f"import {module}", env)
+        total = next((c for _, c, name in modules if name == module), 0) / 1000
+        best = total if best is None else min(best, total)
+        forbidden = sorted({
+            name for _, _, name in modules if name.lstrip().startswith(FORBIDDEN_PREFIXES)
+        })
+    return round(best, 1), forbidden
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Imports per module (fastest counts)")
+    parser.add_argument("--baseline", help="JSON from --save to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    fixtures.configure_environment()
+    env = dict(os.environ, SAML_METADATA_PATH=os.path.join(BACKEND_DIR, "missing-idp-metadata.xml"))
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results: Dict[str, float] = {}
+    failures: List[str] = []
+    for module, budget in TARGETS.items():
+        try:
+            total, forbidden = measure(module, env, args.runs)
+        except RuntimeError as e:
+            failures.append(str(e))
+            continue
+        results[module] = total
+        print(f"{module:16} {total:8.1f} ms  (budget {budget:.0f} ms)")
+        if forbidden:
+            failures.append(f"{module} imports the SAML/XML stack: {', '.join(forbidden)}")
+        if total > budget:
+            failures.append(f"{module}: {total} ms exceeds budget of {budget:.0f} ms")
+        reference = baseline.get(module)
+        if reference and total > reference * (1 + args.max_regression):
+            failures.append(f"{module}: {reference} ms -> {total} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
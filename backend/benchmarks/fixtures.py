@@ -0,0 +1,66 @@
+"""
+Benchmark fixtures
+Configures an isolated environment (placeholder IDP metadata, temp state
+directory, relaxed rate limits, fleet simulator enabled) and creates a
+session directly in the session store so no real IDP is needed
+"""
+import os
+import tempfile
+
+# Placeholder IDP metadata: parsed at startup but never used to verify anything
+FAKE_IDP_METADATA = """<?xml version="1.0"?>
+<EntityDescriptor xmlns="urn:oasis:names:tc:SAML:2.0:metadata" entityID="https://idp.bench.invalid">
+  <IDPSSODescriptor protocolSupportEnumeration="urn:oasis:names:tc:SAML:2.0:protocol">
+    <KeyDescriptor use="signing">
+      <KeyInfo xmlns="http://www.w3.org/2000/09/xmldsig#">
+        <X509Data><X509Certificate>MIIBbench</X509Certificate></X509Data>
+      </KeyInfo>
+    </KeyDescriptor>
+    <SingleSignOnService Binding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect"
+                         Location="https://idp.bench.invalid/sso"/>
+  </IDPSSODescriptor>
+</EntityDescriptor>
+"""
+
+BENCH_USER = {
+    "id": "bench@example.com",
+    "email": "bench@example.com",
+    "name": "Benchmark User",
+    "role": "admin",
+    "groups": ["Dashboard-Admins"],
+}
+
+
+def configure_environment(workdir: str | None = None) -> str:
+    """
+    Point settings at a throwaway directory before the app is imported
+    Returns the working directory used
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="dashboard-bench-")
+    metadata_path = os.path.join(workdir, "idp_metadata.xml")
+    with open(metadata_path, "w") as f:
+        f.write(FAKE_IDP_METADATA)
+
+    os.environ.update({
+        "SECRET_KEY": "benchmark-only",
+        "ENVIRONMENT": "development",
+        "FLEET_SIMULATOR": "true",
+        "SAML_ENTITY_ID": "http://bench.invalid",
+        "SAML_ACS_URL": "http://bench.invalid/auth/callback",
+        "SAML_METADATA_PATH": metadata_path,
+        "SAML_METADATA_RELOAD_SECONDS": "0",
+        "SHARED_STATE_DIR": os.path.join(workdir, "state"),
+        "RATE_LIMIT_BURST": str(10 ** 9),
+        "RATE_LIMIT_PER_MINUTE": str(10 ** 9),
+        "LOG_LEVEL": "WARNING",
+    })
+    return workdir
+
+
+def create_session() -> str:
+    """Store a session for BENCH_USER and return its token"""
+    from app.session import store_session
+
+    token = "bench-session-token"
+    store_session(token, dict(BENCH_USER))
+    return token
@@ -0,0 +1,56 @@
+"""
+Gunicorn configuration
+Preload mode (GUNICORN_PRELOAD, on by default) imports the app, parses the
+IDP metadata and builds the shared build state once in the master, then
+forks the workers from it. Garbage collection is kept off in the master
+and its heap is frozen before each fork, so workers (including ones
+restarted by max_requests) share those pages copy-on-write instead of
+rebuilding or touching them.
+"""
+import gc
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+# Exported so the app can tell when it runs in several workers
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+accesslog = "-"
+errorlog = "-"
+
+# Recycle workers after this many requests (0 disables), with jitter so
+# they don't all restart at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+if preload_app:
+    # Collections in the master would leave freed holes in pages the
+    # workers share, so the collector stays off until after the fork
+    gc.disable()
+
+
+def when_ready(server):
+    """Build shared state in the master once the app is loaded, before any worker is forked"""
+    if server.cfg.preload_app:
+        from main import preload
+        preload()
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far to the permanent generation, so
+    # the workers' collections never write to the shared pages
+    if server.cfg.preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        gc.enable()
+
+
+def child_exit(server, worker):
+    """Fold an exited worker's metrics into the retired snapshot before its pid can be reused"""
+    from app.metrics import registry
+    registry.retire_snapshot(worker.pid)
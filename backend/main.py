@@ -4,33 +4,179 @@ Implements SAML2 authentication and all required API endpoints
 """
 from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse
 from fastapi.security import HTTPBearer
 from contextlib import asynccontextmanager
+import asyncio
+import importlib
 import logging
+import sys
 from datetime import datetime, timedelta
-import secrets
 
 from app.config import settings
-from app.auth import saml_auth, get_current_user
-from app.models import User
-from app.routers import build, preconfig, assign, server
-from app.middleware import SecurityHeadersMiddleware, RateLimitMiddleware
+from app.logging_config import setup_logging
+
+# Configure logging (non-blocking queue handler, structured output) before
+# the remaining app modules are imported, so their startup logs go through it
+setup_logging()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from app.session import get_current_user
+from app.models import User
+from app.routers import build, preconfig, assign, server, heartbeat, racks, rollups, export, audit, profiles
+from app.middleware import (
+    SecurityHeadersMiddleware,
+    RateLimitMiddleware,
+    RequestLoggingMiddleware,
+    MetricsMiddleware,
+    SingleFlightMiddleware,
+    AdmissionControlMiddleware,
+    ProfilingMiddleware,
+    CompressionMiddleware
 )
+from app.metrics import registry as metrics_registry
+from app.shards import get_region_shards, refresh_region_shards
+from app.heartbeat import get_heartbeat_log, heartbeat_coalescer
+from app.stale import run_stale_detector
+from app.eta import run_eta_refresh
+from app.timeline import get_build_timeline, run_timeline_maintenance
+from app.racks import get_rack_aggregator
+from app.lookup import get_asset_index
+from app.archive import run_archiver
+from app.rollups import run_rollups
+from app.compression import available_encodings
+from app.profiling import profile_directory, profiling_enabled, run_sampler
+
 logger = logging.getLogger(__name__)
 
+
+async def load_saml_auth():
+    """
+    SAML handler, importing the SAML/XML stack and parsing the IDP metadata
+    on first use (in a worker thread, so the event loop isn't blocked)
+    """
+    auth = await asyncio.to_thread(importlib.import_module, "app.auth")
+    return auth.saml_auth
+
+
+async def watch_saml_metadata(interval: float):
+    """Reload IDP metadata when it changes, once the SAML stack has been loaded"""
+    while True:
+        await asyncio.sleep(interval)
+        saml_auth = getattr(sys.modules.get("app.auth"), "saml_auth", None)
+        if saml_auth is None:
+            continue
+        try:
+            await asyncio.to_thread(saml_auth.reload_metadata)
+        except Exception as e:
+            logger.error(f"IDP metadata watcher error: {str(e)}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan events"""
     logger.info("Starting Server Building Dashboard Backend")
     logger.info(f"Environment: {settings.ENVIRONMENT}")
     logger.info(f"CORS Origins: {settings.CORS_ORIGINS}")
+    
+    # Watch IDP metadata so certificate rotation doesn't need a restart
+    metadata_watcher = None
+    if settings.SAML_METADATA_RELOAD_SECONDS > 0:
+        metadata_watcher = asyncio.create_task(
+            watch_saml_metadata(settings.SAML_METADATA_RELOAD_SECONDS)
+        )
+    
+    # Publish this worker's metrics for /metrics aggregation
+    metrics_flusher = None
+    if settings.METRICS_ENABLED:
+        metrics_flusher = asyncio.create_task(
+            metrics_registry.run_flusher(settings.METRICS_FLUSH_SECONDS)
+        )
+    
+    # Load the region shards up front rather than on the first request
+    shards = await asyncio.to_thread(get_region_shards)
+    if len(shards):
+        logger.info(
+            f"Build state loaded: {len(shards)} servers in {len(shards.regions())} regions, "
+            f"{shards.memory_bytes() // 1024} KB"
+        )
+        # Asset lookup indexes are built once and then kept in sync by
+        # writes; timelines start recording before the first refresh
+        for region in shards.regions():
+            await asyncio.to_thread(get_asset_index, shards.get(region))
+            await asyncio.to_thread(get_build_timeline, shards.get(region))
+    store_refresher = None
+    if settings.FLEET_SIMULATOR and settings.FLEET_REFRESH_SECONDS > 0:
+        store_refresher = asyncio.create_task(
+            refresh_region_shards(settings.FLEET_REFRESH_SECONDS)
+        )
+    
+    if settings.COMPRESSION_ENABLED:
+        logger.info(f"Response compression: {', '.join(available_encodings())}")
+    
+    # Write coalesced heartbeats to the build store in bulk
+    heartbeat_flusher = asyncio.create_task(
+        heartbeat_coalescer.run_flusher(settings.HEARTBEAT_FLUSH_SECONDS)
+    )
+    
+    # Flag in-flight builds that stopped sending heartbeats. Without the
+    # shared heartbeat log a worker only sees its own share of heartbeats,
+    # and would flag builds reporting to the other workers.
+    stale_detector = None
+    if settings.STALE_SCAN_SECONDS > 0:
+        if settings.WEB_CONCURRENCY > 1 and get_heartbeat_log() is None:
+            logger.warning("Stale build detection disabled: several workers without a shared heartbeat log")
+        else:
+            stale_detector = asyncio.create_task(run_stale_detector(settings.STALE_SCAN_SECONDS))
+    
+    # Re-estimate every build's ETA as the learned build curves drift
+    eta_refresher = None
+    if settings.ETA_REFRESH_SECONDS > 0:
+        eta_refresher = asyncio.create_task(run_eta_refresh(settings.ETA_REFRESH_SECONDS))
+    
+    # Compact, downsample and expire build timelines
+    timeline_maintenance = None
+    if settings.TIMELINE_MAINTENANCE_SECONDS > 0:
+        timeline_maintenance = asyncio.create_task(
+            run_timeline_maintenance(settings.TIMELINE_MAINTENANCE_SECONDS)
+        )
+    
+    # Compact closed days of build history into memory-mapped partitions
+    archiver = None
+    if settings.ARCHIVE_INTERVAL_SECONDS > 0:
+        archiver = asyncio.create_task(run_archiver(settings.ARCHIVE_INTERVAL_SECONDS))
+    
+    # Materialize daily build rollups and keep today's fresh
+    rollup_refresher = None
+    if settings.ROLLUP_REFRESH_SECONDS > 0:
+        rollup_refresher = asyncio.create_task(run_rollups(settings.ROLLUP_REFRESH_SECONDS))
+    
+    # Sample every thread's stacks into collapsed stack files for flamegraphs
+    stack_sampler = None
+    if profiling_enabled() and settings.PROFILING_SAMPLER_SECONDS > 0:
+        stack_sampler = asyncio.create_task(run_sampler(settings.PROFILING_SAMPLER_SECONDS))
+    
     yield
+    
+    if stack_sampler:
+        stack_sampler.cancel()
+    if rollup_refresher:
+        rollup_refresher.cancel()
+    if archiver:
+        archiver.cancel()
+    if timeline_maintenance:
+        timeline_maintenance.cancel()
+    if eta_refresher:
+        eta_refresher.cancel()
+    if stale_detector:
+        stale_detector.cancel()
+    heartbeat_flusher.cancel()
+    await heartbeat_coalescer.flush()
+    if store_refresher:
+        store_refresher.cancel()
+    if metadata_watcher:
+        metadata_watcher.cancel()
+    if metrics_flusher:
+        metrics_flusher.cancel()
+        metrics_registry.write_snapshot()
     logger.info("Shutting down Server Building Dashboard Backend")
 
 # Initialize FastAPI app
@@ -43,11 +189,55 @@ app = FastAPI(
     redoc_url="/api/redoc" if settings.ENVIRONMENT == "development" else None,
 )
 
+# Compress responses (innermost, so a coalesced read is compressed once)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES)
+
+# Limit concurrent work per lane (inside coalescing, so only computations
+# take a slot; shed requests are still logged and measured)
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        limits=settings.ADMISSION_LIMITS,
+        default_limit=settings.ADMISSION_DEFAULT_LIMIT,
+        reserved_paths=settings.ADMISSION_RESERVED_PATHS,
+        reserved_limit=settings.ADMISSION_RESERVED_LIMIT,
+        queue_size=settings.ADMISSION_QUEUE_SIZE,
+        timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS
+    )
+
+# Coalesce identical concurrent reads (inside the remaining middleware, so
+# every request is still rate limited, logged and measured)
+if settings.SINGLE_FLIGHT_ENABLED:
+    app.add_middleware(SingleFlightMiddleware, paths=settings.SINGLE_FLIGHT_PATHS)
+
 # Add security headers middleware
 app.add_middleware(SecurityHeadersMiddleware)
 
 # Add rate limiting middleware
-app.add_middleware(RateLimitMiddleware)
+app.add_middleware(
+    RateLimitMiddleware,
+    rate_limit_per_minute=settings.RATE_LIMIT_PER_MINUTE,
+    burst=settings.RATE_LIMIT_BURST
+)
+
+# Add request logging middleware
+app.add_middleware(RequestLoggingMiddleware)
+
+# Add request metrics middleware (outside rate limiting, so rejections are timed too)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Profile single requests for admins (outermost, so the profile covers
+# every middleware), where ENVIRONMENT allows it
+if profiling_enabled() and profile_directory():
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=profile_directory(),
+        interval=settings.PROFILING_REQUEST_INTERVAL_MS / 1000,
+        max_files=settings.PROFILING_MAX_FILES
+    )
 
 # Configure CORS
 app.add_middleware(
@@ -65,6 +255,12 @@ app.include_router(build.router, prefix="/api", tags=["build"])
 app.include_router(preconfig.router, prefix="/api", tags=["preconfig"])
 app.include_router(assign.router, prefix="/api", tags=["assign"])
 app.include_router(server.router, prefix="/api", tags=["server"])
+app.include_router(heartbeat.router, prefix="/api", tags=["heartbeat"])
+app.include_router(racks.router, prefix="/api", tags=["racks"])
+app.include_router(rollups.router, prefix="/api", tags=["rollups"])
+app.include_router(export.router, prefix="/api", tags=["export"])
+app.include_router(audit.router, prefix="/api", tags=["audit"])
+app.include_router(profiles.router, prefix="/api", tags=["profiles"])
 
 # Health check endpoint
 @app.get("/health", tags=["health"])
@@ -76,11 +272,24 @@ async def health_check():
         "version": "1.0.0"
     }
 
+# Metrics endpoint
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    """Prometheus metrics aggregated across all workers"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    metrics_registry.write_snapshot()
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
 # Authentication endpoints
 @app.get("/saml/login", tags=["auth"])
 async def saml_login(request: Request):
     """Initiate SAML login"""
     try:
+        saml_auth = await load_saml_auth()
         auth_request = saml_auth.prepare_auth_request(request)
         return RedirectResponse(
             url=auth_request['url'],
@@ -106,13 +315,9 @@ async def saml_callback(request: Request, response: Response):
                 detail="Missing SAMLResponse"
             )
         
-        user_data = saml_auth.process_saml_response(saml_response, request)
-        
-        # Create session token
-        session_token = secrets.token_urlsafe(32)
-        
-        # Store session (in production, use Redis or similar)
-        saml_auth.store_session(session_token, user_data)
+        # Validate response and create session (duplicates reuse the first session)
+        saml_auth = await load_saml_auth()
+        session_token = await saml_auth.login(saml_response, request)
         
         # Set secure cookie
         response.set_cookie(
@@ -166,6 +371,25 @@ async def root():
         "status": "running"
     }
 
+def preload():
+    """
+    Build the process-wide state workers can share
+    Called once in the gunicorn master in preload mode (see gunicorn.conf.py)
+    before workers are forked, so they inherit the SAML stack and parsed IDP
+    metadata, region shards, rack aggregates, asset lookup indexes and
+    OpenAPI schema copy-on-write instead of each building their own.
+    Per-worker resources (background tasks, connections, thread pools) are
+    still created in lifespan.
+    """
+    importlib.import_module("app.auth")
+    shards = get_region_shards()
+    stores = [shards.get(region) for region in shards.regions()] if shards else [racks.generate_mock_rack_store()]
+    for store in stores:
+        get_rack_aggregator(store)
+        get_asset_index(store)
+    app.openapi()
+    logger.info(f"Preloaded shared state: {len(shards)} servers in {len(shards.regions())} regions")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -1,4 +1,4 @@
-import { useState } from 'react';
+import { useRef, useState } from 'react';
 import { Server } from '../types/build';
 import { fetchWithFallback } from '../utils/api';
 
@@ -17,8 +17,18 @@ interface AssignmentState {
 export const useAssignServers = () => {
   const [assignmentStates, setAssignmentStates] = useState<AssignmentState>({});
   const [error, setError] = useState<string | null>(null);
+  // Idempotency-Key of each assignment until it gets a response, so
+  // retrying one that failed in transit reuses its key
+  const idempotencyKeys = useRef(new Map<string, string>());
 
   const assignSingleServer = async (payload: AssignPayload): Promise<boolean> => {
+    const operation = JSON.stringify(payload);
+    let idempotencyKey = idempotencyKeys.current.get(operation);
+    if (!idempotencyKey) {
+      idempotencyKey = crypto.randomUUID();
+      idempotencyKeys.current.set(operation, idempotencyKey);
+    }
+
     try {
       setError(null);
 
@@ -34,11 +44,14 @@ export const useAssignServers = () => {
         {
           method: 'POST',
           credentials: 'include',
-          body: JSON.stringify(payload),
+          // Retries of this assignment are only carried out once by the backend
+          headers: { 'Idempotency-Key': idempotencyKey },
+          body: operation,
         },
         mockResponse
       );
 
+      idempotencyKeys.current.delete(operation);
       return result.status === 'success';
     } catch (err) {
       console.error('Assignment failed:', err);
@@ -1,4 +1,4 @@
-import { useState } from 'react';
+import { useRef, useState } from 'react';
 import { fetchWithFallback } from '../utils/api';
 
 export type PushStatus = 'idle' | 'pushing' | 'success' | 'failed';
@@ -6,8 +6,17 @@ export type PushStatus = 'idle' | 'pushing' | 'success' | 'failed';
 export const usePushPreconfig = () => {
   const [pushStatus, setPushStatus] = useState<PushStatus>('idle');
   const [error, setError] = useState<string | null>(null);
+  // Idempotency-Key of each depot's push until it gets a response, so
+  // retrying one that failed in transit reuses its key
+  const idempotencyKeys = useRef(new Map<number, string>());
 
   const pushPreconfig = async (depot: number): Promise<boolean> => {
+    let idempotencyKey = idempotencyKeys.current.get(depot);
+    if (!idempotencyKey) {
+      idempotencyKey = crypto.randomUUID();
+      idempotencyKeys.current.set(depot, idempotencyKey);
+    }
+
     try {
       setError(null);
 
@@ -23,11 +32,14 @@ export const usePushPreconfig = () => {
         {
           method: 'POST',
           credentials: 'include',
+          // Retries of this push are only carried out once by the backend
+          headers: { 'Idempotency-Key': idempotencyKey },
           body: JSON.stringify({ depot }),
         },
         mockResponse
       );
 
+      idempotencyKeys.current.delete(depot);
       return result.status === 'success';
     } catch (err) {
       console.error('Push preconfig failed:', err);